@@ -0,0 +1,130 @@
+"""Token authentication without a database query per request.
+
+Tokens are looked up in a small process-local LRU, then in the shared
+cache, and only then in the database. Entries are dropped when the token
+is deleted (logout) and when the user is saved (password change,
+deactivation), see api/signals.py. Other processes keep a dropped entry
+in their local LRU for at most AUTH_TOKEN_LOCAL_TTL seconds.
+
+Only the user fields needed for access checks are cached (CACHED_USER_FIELDS),
+never the password hash; the user is rebuilt with the other fields
+deferred, they are loaded from the database when accessed.
+
+QuerySet.update() sends no signals, so e.g.
+User.objects.update(is_active=False) leaves cached users active for up to
+AUTH_TOKEN_CACHE_TTL seconds unless invalidate_user_tokens() is called.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+CACHED_USER_FIELDS = ('id', 'is_active', 'is_staff')
+
+
+def cache_key(key):
+    return f'auth-token:{key}'
+
+
+class LocalTokenCache:
+    """Thread-safe LRU of cached user fields with a time to live."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            fields, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return fields
+
+    def set(self, key, fields):
+        with self.lock:
+            self.entries[key] = (fields, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_tokens = LocalTokenCache(
+    settings.AUTH_TOKEN_LOCAL_CACHE_SIZE, settings.AUTH_TOKEN_LOCAL_TTL
+)
+
+
+def invalidate_tokens(*keys):
+    for key in keys:
+        local_tokens.delete(key)
+    cache.delete_many([cache_key(key) for key in keys])
+
+
+def invalidate_user_tokens(user):
+    invalidate_tokens(*Token.objects.filter(
+        user_id=user.pk
+    ).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    model = Token
+
+    def authenticate_credentials(self, key):
+        fields = local_tokens.get(key)
+        if fields is None:
+            fields = cache.get(cache_key(key))
+            if fields is None:
+                try:
+                    token = self.model.objects.select_related('user').only(
+                        'user_id',
+                        *(f'user__{name}' for name in CACHED_USER_FIELDS)
+                    ).get(key=key)
+                except self.model.DoesNotExist:
+                    raise exceptions.AuthenticationFailed('Invalid token.')
+                fields = {
+                    name: getattr(token.user, name)
+                    for name in CACHED_USER_FIELDS
+                }
+                cache.set(
+                    cache_key(key), fields, settings.AUTH_TOKEN_CACHE_TTL
+                )
+            local_tokens.set(key, fields)
+
+        if not fields['is_active']:
+            raise exceptions.AuthenticationFailed(
+                'User inactive or deleted.'
+            )
+        # Новый экземпляр на каждый запрос: отложенные поля, загруженные
+        # одним запросом, не попадают в другие.
+        # from_db() ждет значения в порядке полей модели.
+        names = [
+            field.attname for field in User._meta.concrete_fields
+            if field.attname in fields
+        ]
+        user = User.from_db(
+            DEFAULT_DB_ALIAS, names, [fields[name] for name in names]
+        )
+        return user, self.model(key=key, user=user)
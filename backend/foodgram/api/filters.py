@@ -4,6 +4,16 @@ from recipes.models import Ingredient, Recipe, Tag
 
 User = get_user_model()
 
+# Значение ?ordering= и сортировка, совпадающая с индексом рецептов.
+RECIPE_ORDERINGS = {
+    '-pub_date': ('-pub_date', '-id'),
+    'pub_date': ('pub_date', 'id'),
+    '-favorites_count': ('-favorites_count', '-pub_date', '-id'),
+    'favorites_count': ('favorites_count', 'pub_date', 'id'),
+    '-in_carts_count': ('-in_carts_count', '-pub_date', '-id'),
+    'in_carts_count': ('in_carts_count', 'pub_date', 'id'),
+}
+
 
 class IngredientFilter(FilterSet):
     name = filters.CharFilter(lookup_expr='istartswith')
@@ -18,6 +28,7 @@ class RecipeFilter(FilterSet):
         queryset=Tag.objects.all(),
         field_name='tags__slug',
         to_field_name='slug',
+        method='get_tags',
     )
     author = filters.ModelChoiceFilter(
         queryset=User.objects.all(),
@@ -28,10 +39,31 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart',
     )
+    search = filters.CharFilter(
+        method='get_search',
+    )
+    ordering = filters.ChoiceFilter(
+        choices=[(value, value) for value in RECIPE_ORDERINGS],
+        method='get_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ['is_favorited', 'author', 'tags', 'is_in_shopping_cart']
+        fields = [
+            'is_favorited', 'author', 'tags', 'is_in_shopping_cart',
+            'search', 'ordering',
+        ]
+
+    def get_tags(self, queryset, name, value):
+        """Semi-join on tag ids instead of joining the M2M table, so a
+        recipe with several selected tags is returned once without
+        DISTINCT. Slugs are resolved to tags by the form field.
+        """
+        if not value:
+            return queryset
+        return queryset.filter(id__in=Recipe.tags.through.objects.filter(
+            tag_id__in=[tag.id for tag in value]
+        ).values('recipe_id'))
 
     def get_is_favorited(self, queryset, name, value):
         user = self.request.user
@@ -43,4 +75,13 @@ class RecipeFilter(FilterSet):
         user = self.request.user
         if value and user.is_authenticated:
             return queryset.filter(shopping_cart_recipe__user=user)
-        return queryset
\ No newline at end of file
+        return queryset
+
+    def get_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        return queryset.search(value)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
@@ -0,0 +1,206 @@
+"""EXPLAIN of the queries API endpoints run.
+
+Endpoint views are called with a request of the most active user and every
+SELECT they execute, prefetches included, is explained with its
+parameters. The recipe detail cache is bypassed, so both the per-user
+lookup and the shared build are checked. Write paths are represented by
+the lookups their signals run.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.urls import resolve
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from recipes import catalog
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart, Tag
+from recipes.pantry_index import pantry_index
+
+User = get_user_model()
+
+PAGE_SIZE = 6
+# Полный просмотр таблицы: PostgreSQL и SQLite (SCAN без индекса).
+SEQ_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on "?(\w+)"?'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)(?! USING)(?:\s|$)'),
+}
+TABLE_ALIAS = re.compile(r'"(\w+)" (\w+)\b')
+
+
+class QueryRecorder:
+    """execute_wrapper collecting SELECT statements with parameters."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def seq_scans(plan, sql, vendor):
+    """Tables read with a sequential scan according to the plan."""
+    pattern = SEQ_SCAN.get(vendor)
+    if pattern is None:
+        return set()
+    aliases = dict(
+        (alias, table) for table, alias in TABLE_ALIAS.findall(sql)
+    )
+    return {
+        aliases.get(name, name)
+        for name in pattern.findall(plan)
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN основных запросов эндпоинтов на заполненной базе; '
+        'ошибка, если большая таблица читается полным сканированием'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows',
+            type=int,
+            default=10000,
+            help='Таблицы меньшего размера можно сканировать целиком',
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Обновить статистику планировщика перед проверкой',
+        )
+
+    def handle(self, *args, **options):
+        recipe = Recipe.objects.order_by('-id').first()
+        if recipe is None:
+            raise CommandError(
+                'База пуста, заполните ее: python manage.py generate_dataset'
+            )
+        user = User.objects.annotate(
+            carts=Count('shopping_cart_user')
+        ).order_by('-carts', 'id').first()
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+        self.row_counts = {}
+        # Планы называют и производные таблицы (COUNT(*) пагинатора).
+        tables = set(connection.introspection.table_names())
+        failures = []
+        for name, sql, params in self.queries(user, recipe):
+            plan = self.explain(sql, params)
+            large = sorted(
+                table for table in seq_scans(plan, sql, connection.vendor)
+                if table in tables
+                and self.count_rows(table) >= options['min_rows']
+            )
+            if large:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: полное сканирование {", ".join(large)}'
+                ))
+            else:
+                self.stdout.write(f'{name}: OK')
+            if large or options['verbosity'] > 1:
+                self.stdout.write(plan)
+        if failures:
+            raise CommandError(
+                f'Полное сканирование больших таблиц: {", ".join(failures)}'
+            )
+        return 'Планы запросов в порядке.'
+
+    def count_rows(self, table):
+        if table not in self.row_counts:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+                )
+                self.row_counts[table] = cursor.fetchone()[0]
+        return self.row_counts[table]
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{connection.ops.explain_query_prefix()} {sql}', params
+            )
+            # Как QuerySet.explain(): строки плана в одну строку каждая.
+            return '\n'.join(
+                ' '.join(str(column) for column in row)
+                for row in cursor.fetchall()
+            )
+
+    def endpoint_queries(self, user, path, params=None):
+        """SELECT statements run by the view serving GET path."""
+        request = APIRequestFactory().get(path, params)
+        force_authenticate(request, user)
+        match = resolve(path)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = match.func(request, *match.args, **match.kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        if response.status_code != 200:
+            # Например, пустая корзина: проверяются выполненные запросы.
+            self.stdout.write(self.style.WARNING(
+                f'{path}: ответ {response.status_code}'
+            ))
+        return recorder.queries
+
+    def endpoints(self, user, recipe):
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        ingredient_ids = list(
+            recipe.ingredients.values_list('id', flat=True)
+        )
+        yield 'recipes-list', '/api/recipes/', None
+        yield 'recipes-list-tags', '/api/recipes/', {'tags': tags}
+        yield 'recipes-list-author', '/api/recipes/', {
+            'author': recipe.author_id
+        }
+        yield 'recipes-list-favorited', '/api/recipes/', {
+            'is_favorited': 'true'
+        }
+        yield 'recipes-list-shopping-cart', '/api/recipes/', {
+            'is_in_shopping_cart': 'true'
+        }
+        if connection.vendor == 'postgresql':
+            # На SQLite поиск - это LIKE по всей таблице.
+            yield 'recipes-search', '/api/recipes/', {
+                'search': recipe.name.split()[0]
+            }
+        # Без кеша деталей: проверяются и запрос флагов, и сборка ответа.
+        catalog.invalidate_object(Recipe, recipe.pk)
+        yield 'recipes-detail', f'/api/recipes/{recipe.pk}/', None
+        yield 'recipes-similar', f'/api/recipes/{recipe.pk}/similar/', None
+        # Индекс строится полным чтением таблицы, это не запрос эндпоинта.
+        pantry_index.refresh()
+        yield 'recipes-pantry', '/api/recipes/pantry/', {
+            'ingredients': ingredient_ids
+        }
+        yield 'users-subscriptions', '/api/users/subscriptions/', None
+        yield (
+            'download-shopping-cart', '/api/recipes/download_shopping_cart/',
+            None,
+        )
+
+    def queries(self, user, recipe):
+        """(name, sql, params) of every query to explain."""
+        for name, path, params in self.endpoints(user, recipe):
+            queries = self.endpoint_queries(user, path, params)
+            for number, (sql, query_params) in enumerate(queries, 1):
+                yield f'{name} #{number}', sql, query_params
+        # Пользователи с рецептом в избранном и корзине: их читают сигналы
+        # при записи избранного, корзин и ингредиентов.
+        for name, queryset in (
+            ('recipe-favorites', FavoriteRecipe.objects.filter(
+                recipe=recipe
+            ).values('user_id')),
+            ('recipe-shopping-carts', ShoppingCart.objects.filter(
+                recipe=recipe
+            ).values('user_id')),
+        ):
+            yield (name, *queryset.query.sql_with_params())
@@ -0,0 +1,219 @@
+"""Per-request performance metrics and read replica selection.
+
+For every request the middleware records the resolved view and action,
+the number of SQL queries, the time spent in the database, in
+serializers and in total, and what happened to database connections
+(see foodgram/db_connections.py). The numbers go to the Server-Timing
+header and to the `foodgram.requests` logger as one JSON line; requests
+running more queries than REQUEST_QUERY_THRESHOLD are logged as warnings.
+
+Bodies of streaming responses are produced after the middleware returns,
+so their queries are not counted.
+
+ReplicaRoutingMiddleware is described in foodgram/db_router.py.
+"""
+import hashlib
+import json
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import BaseSerializer
+
+from foodgram.db_connections import ConnectionStats, request_stats
+from foodgram.db_router import choose_replica, current_replica, health
+
+logger = logging.getLogger('foodgram.requests')
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.connections = ConnectionStats()
+        # Глубина вложенных вызовов serializer.data, учитывается только
+        # внешний вызов.
+        self.serializer_depth = 0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+
+@contextmanager
+def measure_serializer():
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    metrics.serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_depth -= 1
+        if not metrics.serializer_depth:
+            metrics.serializer_time += time.perf_counter() - start
+
+
+def instrument_serializers():
+    """Time BaseSerializer.data, which every view reads to build the
+    response, including the djoser ones."""
+    data = BaseSerializer.data
+    if getattr(data.fget, 'instrumented', False):
+        return
+
+    def timed_data(serializer):
+        with measure_serializer():
+            return data.fget(serializer)
+
+    timed_data.instrumented = True
+    BaseSerializer.data = property(timed_data)
+
+
+def view_name(view_func, method):
+    view_class = getattr(view_func, 'cls', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__name__}'
+    action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+    if action:
+        return f'{view_class.__name__}.{action}'
+    return view_class.__name__
+
+
+class RequestMetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        token = current_metrics.set(metrics)
+        connections_token = request_stats.set(metrics.connections)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.execute_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+            request_stats.reset(connections_token)
+        total = time.perf_counter() - start
+        self.report(request, response, metrics, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.view = view_name(view_func, request.method)
+
+    def report(self, request, response, metrics, total):
+        connections = metrics.connections.snapshot()
+        if settings.REQUEST_METRICS_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join((
+                f'db;dur={metrics.db_time * 1000:.1f};'
+                f'desc="{metrics.queries} queries"',
+                f'db-connect;dur={connections["wait_ms"]}',
+                f'serializer;dur={metrics.serializer_time * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ))
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': metrics.view,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'db_ms': round(metrics.db_time * 1000, 1),
+            'db_connect_ms': connections.pop('wait_ms'),
+            'db_connections': connections,
+            'serializer_ms': round(metrics.serializer_time * 1000, 1),
+            'total_ms': round(total * 1000, 1),
+        }
+        threshold = settings.REQUEST_QUERY_THRESHOLD
+        record['too_many_queries'] = bool(
+            threshold and metrics.queries > threshold
+        )
+        logger.log(
+            logging.WARNING if record['too_many_queries'] else logging.INFO,
+            json.dumps(record, ensure_ascii=False),
+            extra={'metrics': record},
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """Serve safe requests to use_replica views from a replica, keep
+    clients that have just written on the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        token = current_replica.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_replica.reset(token)
+        if (
+            request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and self.client_key(request)
+        ):
+            cache.set(
+                self.client_key(request), True, settings.REPLICA_PIN_SECONDS
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            not settings.DATABASE_REPLICAS
+            or request.method not in SAFE_METHODS
+            or not getattr(getattr(view_func, 'cls', None), 'use_replica',
+                           False)
+        ):
+            return None
+        client_key = self.client_key(request)
+        if client_key and cache.get(client_key):
+            return None
+        current_replica.set(choose_replica())
+        return None
+
+    def process_exception(self, request, exception):
+        alias = current_replica.get()
+        if alias is None or not isinstance(exception, DatabaseError):
+            return None
+        # Реплика недоступна: повторяем запрос на основной базе.
+        health.mark_down(alias)
+        current_replica.set(None)
+        match = request.resolver_match
+        return match.func(request, *match.args, **match.kwargs)
+
+    @staticmethod
+    def client_key(request):
+        """Cache key of the client, None for anonymous requests."""
+        credentials = (
+            request.META.get('HTTP_AUTHORIZATION')
+            or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        )
+        if not credentials:
+            return None
+        digest = hashlib.sha256(credentials.encode()).hexdigest()
+        return f'replica-pin:{digest}'
@@ -1,7 +1,30 @@
-from rest_framework.mixins import (ListModelMixin, RetrieveModelMixin,
-    CreateModelMixin, DestroyModelMixin)
+import gzip
+import hashlib
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Exists, OuterRef
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.mixins import (CreateModelMixin, DestroyModelMixin,
+                                   ListModelMixin, RetrieveModelMixin)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from recipes import catalog
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            ShoppingCart, Subscribe, Tag)
+
+User = get_user_model()
+
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+RECIPE_DETAIL_CACHE_TIMEOUT = 60 * 60 * 24
+
+
 class ListRetrieveModelMixin(
     ListModelMixin,
     RetrieveModelMixin,
@@ -9,9 +32,142 @@ class ListRetrieveModelMixin(
 ):
     pass
 
+
 class CreateDestroyMixin(
     CreateModelMixin,
     DestroyModelMixin,
     GenericViewSet
 ):
     pass
+
+
+class CachedCatalogMixin:
+    """Serve the unfiltered list as pre-rendered, pre-compressed JSON.
+
+    The rendered bytes are cached under the catalog version of the model,
+    so any change of the table makes workers render it again. Responses
+    carry ETag and Last-Modified, and conditional requests get 304.
+    """
+
+    def get_catalog(self):
+        model = self.get_queryset().model
+        version = catalog.get_version(model)
+        key = f'catalog:{model._meta.label_lower}:{version}'
+        entry = cache.get(key)
+        if entry is None:
+            serializer = self.get_serializer(self.get_queryset(), many=True)
+            body = JSONRenderer().render(serializer.data)
+            etag = hashlib.md5(body).hexdigest()
+            entry = {
+                'identity': (body, f'"{etag}"'),
+                'gzip': (gzip.compress(body), f'"{etag}-gzip"'),
+                'last_modified': int(version),
+            }
+            cache.set(key, entry, CATALOG_CACHE_TIMEOUT)
+        return entry
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params or request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+
+        entry = self.get_catalog()
+        encoding = (
+            'gzip' if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+            else 'identity'
+        )
+        body, etag = entry[encoding]
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=entry['last_modified'],
+        )
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+            if encoding == 'gzip':
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(entry['last_modified'])
+        response['Cache-Control'] = 'no-cache'
+        response['Vary'] = 'Accept, Accept-Encoding'
+        return response
+
+
+class CachedRecipeDetailMixin:
+    """Serve recipe details from a cache shared by all users.
+
+    The cached part is the representation built for an anonymous user; it
+    is valid while the versions of the recipe, its author, tags and
+    ingredients are unchanged. is_favorited, is_in_shopping_cart,
+    author.is_subscribed and the counters are merged in from one query per
+    request.
+    """
+
+    def get_recipe_state(self, pk):
+        """Author, counters and flags of the current user, None if there
+        is no such recipe."""
+        user = self.request.user
+        flags = {}
+        if user.is_authenticated:
+            flags = {
+                'is_favorited': Exists(FavoriteRecipe.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+                'is_in_shopping_cart': Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+                'is_subscribed': Exists(Subscribe.objects.filter(
+                    user=user, author=OuterRef('author')
+                )),
+            }
+        return Recipe.objects.filter(pk=pk).annotate(**flags).values(
+            'author_id', 'favorites_count', 'in_carts_count', *flags
+        ).first()
+
+    def get_shared_detail(self, pk, author_id):
+        versions = catalog.get_versions([
+            catalog.object_version_key(Recipe, pk),
+            catalog.object_version_key(User, author_id),
+            catalog.version_key(Tag),
+            catalog.version_key(Ingredient),
+        ])
+        # Ссылки на изображения абсолютные, они зависят от хоста запроса.
+        host = hashlib.md5(
+            self.request.build_absolute_uri('/').encode()
+        ).hexdigest()
+        key = f'recipe-detail:{pk}:{host}'
+        entry = cache.get(key)
+        if entry is None or entry['versions'] != versions:
+            # Реплика может отставать от только что изменившей версию
+            # записи, поэтому общее представление читается с основной базы.
+            recipe = Recipe.objects.using(DEFAULT_DB_ALIAS).for_user(
+                AnonymousUser()
+            ).filter(pk=pk).first()
+            if recipe is None:
+                raise Http404
+            entry = {
+                'versions': versions,
+                'data': self.get_serializer(recipe).data,
+            }
+            cache.set(key, entry, RECIPE_DETAIL_CACHE_TIMEOUT)
+        return entry['data']
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            raise Http404
+        state = self.get_recipe_state(pk)
+        if state is None:
+            raise Http404
+        data = dict(self.get_shared_detail(pk, state['author_id']))
+        data['author'] = dict(
+            data['author'],
+            is_subscribed=state.get('is_subscribed', False),
+        )
+        data.update(
+            is_favorited=state.get('is_favorited', False),
+            is_in_shopping_cart=state.get('is_in_shopping_cart', False),
+            favorites_count=state['favorites_count'],
+            in_carts_count=state['in_carts_count'],
+        )
+        return Response(data)
@@ -0,0 +1,17 @@
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class FallbackContentNegotiation(DefaultContentNegotiation):
+    """Pick the renderer by ?format= or Accept, else use the first one.
+
+    Clients that ask for an unsupported type (e.g. application/json) get
+    the default format instead of 406, an unknown ?format= is still 404.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            renderer = renderers[0]
+            return renderer, renderer.media_type
@@ -0,0 +1,163 @@
+from base64 import b64decode, b64encode
+from datetime import datetime
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from recipes.models import Recipe
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .filters import RECIPE_ORDERINGS
+
+
+def reverse_field(field):
+    return field[1:] if field.startswith('-') else f'-{field}'
+
+
+def keyset_after(fields, values):
+    """Rows that follow values in the order of fields.
+
+    Nested as a <= x AND (a < x OR (b <= y AND ...)) so the leading
+    column bounds the index scan.
+    """
+    field, *fields = fields
+    value, *values = values
+    name = field.lstrip('-')
+    op = 'lt' if field.startswith('-') else 'gt'
+    after = Q(**{f'{name}__{op}': value})
+    if not fields:
+        return after
+    return Q(**{f'{name}__{op}e': value}) & (
+        after | keyset_after(fields, values)
+    )
+
+
+class RecipePagination(PageNumberPagination):
+    """Page numbers by default, keyset pagination on demand.
+
+    Passing ?cursor= (empty for the first page) switches to keyset mode:
+    recipes are ordered by the index of the active ?ordering= (by default
+    ('-pub_date', '-id')) and each page continues after the last row of
+    the previous one, so there is no COUNT(*) and no OFFSET however deep
+    the user scrolls. Relevance order of ?search= has no such key, so a
+    search needs an explicit ?ordering= in keyset mode.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    default_ordering = '-pub_date'
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор'
+    search_without_ordering_message = (
+        'Для поиска с курсором укажите параметр ordering'
+    )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        ordering = request.query_params.get(self.ordering_query_param)
+        if not ordering:
+            if request.query_params.get('search', '').strip():
+                raise ValidationError(
+                    {self.cursor_query_param: [
+                        self.search_without_ordering_message
+                    ]}
+                )
+            ordering = self.default_ordering
+        self.ordering = ordering
+        self.fields = RECIPE_ORDERINGS[ordering]
+        page_size = self.get_page_size(request)
+        self.cursor = cursor = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+        if cursor is None:
+            reverse = False
+            queryset = queryset.order_by(*self.fields)
+        else:
+            values, reverse = cursor
+            fields = self.fields
+            if reverse:
+                fields = [reverse_field(field) for field in fields]
+            queryset = queryset.filter(
+                keyset_after(fields, values)
+            ).order_by(*fields)
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+        self.page = results
+        return results
+
+    def decode_cursor(self, value):
+        if not value:
+            return None
+        try:
+            ordering, *values, reverse = b64decode(
+                value.encode('ascii'), altchars=b'-_', validate=True
+            ).decode('ascii').split('|')
+            if ordering != self.ordering or len(values) != len(self.fields):
+                raise ValueError
+            values = [
+                Recipe._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+            return values, reverse == '1'
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, values, reverse):
+        value = '|'.join([
+            self.ordering,
+            *(
+                value.isoformat() if isinstance(value, datetime)
+                else str(value)
+                for value in values
+            ),
+            str(int(reverse)),
+        ])
+        cursor = b64encode(value.encode('ascii'), altchars=b'-_')
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            cursor.decode('ascii')
+        )
+
+    def key(self, recipe):
+        return [getattr(recipe, field.lstrip('-')) for field in self.fields]
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        if not self.page:
+            return self.encode_cursor(self.cursor[0], reverse=False)
+        return self.encode_cursor(self.key(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return self.encode_cursor(self.cursor[0], reverse=True)
+        return self.encode_cursor(self.key(self.page[0]), reverse=True)
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
@@ -0,0 +1,123 @@
+import csv
+import os
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer
+
+TITLE = 'Список покупок:'
+CHUNK_SIZE = 64 * 1024
+
+
+class Echo:
+    """File-like object that returns what is written into it."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(BaseRenderer):
+    """Base renderer of a shopping list, streams aggregated rows.
+
+    Rows are dicts with 'name', 'measurement_unit' and 'amount' keys.
+    Error responses are rendered as plain text.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '\n'.join(str(value) for value in data.values())
+        return str(data).encode('utf-8')
+
+    def stream(self, rows):
+        raise NotImplementedError(
+            'ShoppingListRenderer.stream() must be implemented.'
+        )
+
+
+class PlainTextRenderer(ShoppingListRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, rows):
+        yield f'{TITLE}\n'.encode('utf-8')
+        for i, row in enumerate(rows, start=1):
+            yield (
+                f'{i}. {row["name"].capitalize()}'
+                f' - {row["amount"]}, {row["measurement_unit"]}\n'
+            ).encode('utf-8')
+
+
+class CSVRenderer(ShoppingListRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        # BOM lets spreadsheet editors detect the encoding.
+        yield '\ufeff'.encode('utf-8')
+        yield writer.writerow(
+            ('№', 'Ингредиент', 'Количество', 'Ед. изм.')
+        ).encode('utf-8')
+        for i, row in enumerate(rows, start=1):
+            yield writer.writerow((
+                i,
+                row['name'].capitalize(),
+                row['amount'],
+                row['measurement_unit'],
+            )).encode('utf-8')
+
+
+class PDFRenderer(ShoppingListRenderer):
+    """PDF needs the xref table at the end of the file, so the document
+    is built in a spooled temporary file and then streamed by chunks."""
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+    font_size = 12
+    margin = 50
+    line_height = 18
+
+    def get_font(self):
+        font_path = settings.SHOPPING_LIST_PDF_FONT
+        if not os.path.exists(font_path):
+            return 'Helvetica'
+        font_name = os.path.splitext(os.path.basename(font_path))[0]
+        if font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(font_name, font_path))
+        return font_name
+
+    def stream(self, rows):
+        with SpooledTemporaryFile(max_size=CHUNK_SIZE * 16) as pdf_file:
+            self.write_pdf(pdf_file, rows)
+            pdf_file.seek(0)
+            while chunk := pdf_file.read(CHUNK_SIZE):
+                yield chunk
+
+    def write_pdf(self, pdf_file, rows):
+        font = self.get_font()
+        width, height = A4
+        document = canvas.Canvas(pdf_file, pagesize=A4)
+        document.setTitle('Список покупок')
+        y = height - self.margin
+        document.setFont(font, self.font_size + 4)
+        document.drawString(self.margin, y, TITLE)
+        y -= self.line_height * 2
+        document.setFont(font, self.font_size)
+        for i, row in enumerate(rows, start=1):
+            if y < self.margin:
+                document.showPage()
+                document.setFont(font, self.font_size)
+                y = height - self.margin
+            document.drawString(
+                self.margin,
+                y,
+                f'{i}. {row["name"].capitalize()}'
+                f' - {row["amount"]}, {row["measurement_unit"]}'
+            )
+            y -= self.line_height
+        document.save()
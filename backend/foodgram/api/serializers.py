@@ -1,22 +1,56 @@
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from django.contrib.auth.hashers import check_password
+from django.core.files.storage import default_storage
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.fields import CurrentUserDefault
 from djoser.serializers import (PasswordSerializer,
     UserCreateSerializer, UserSerializer
 )
 
+from recipes import catalog
+from recipes.images import schedule_image_processing
+from recipes.signals import shopping_lists_handled
+from recipes.similarity import schedule_similarity_update
 from recipes.models import (Tag, Ingredient, 
     RecipeIngredient, Recipe, Subscribe, 
-    FavoriteRecipe, ShoppingCart
+    FavoriteRecipe, ShoppingCart, ShoppingListItem
 )
 from drf_extra_fields.fields import Base64ImageField
 
 User = get_user_model()
 
 
+class RecipeImageField(Base64ImageField):
+    """Base64 image with size and dimension limits.
+
+    Only the header is read here to get the dimensions, pixels are decoded
+    later when variants are generated, see recipes.images.
+    """
+
+    def to_internal_value(self, base64_data):
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        # Base64 takes 4 characters for every 3 bytes.
+        if (
+            isinstance(base64_data, str)
+            and len(base64_data) > max_size * 4 // 3 + 100
+        ):
+            raise serializers.ValidationError(
+                f'Размер картинки не должен превышать '
+                f'{max_size // (1024 * 1024)} МБ'
+            )
+        image = super().to_internal_value(base64_data)
+        max_dimension = settings.RECIPE_IMAGE_MAX_DIMENSION
+        if image is not None and max(image.image.size) > max_dimension:
+            raise serializers.ValidationError(
+                f'Стороны картинки не должны превышать {max_dimension} px'
+            )
+        return image
+
+
 class AccountListSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
@@ -32,6 +66,8 @@ class AccountListSerializer(UserSerializer):
             )
     
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return (
             self.context.get('request').user.is_authenticated
             and
@@ -137,6 +173,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     ingredients = IngredientListSerializer(many=True, source='recipe')
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image = serializers.SerializerMethodField(read_only=True)
+    images = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -149,11 +187,36 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',            
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
+            'favorites_count',
+            'in_carts_count',
         )
+
+    def build_image_url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_image(self, obj):
+        """Original image, the card variant in lists (many=True) once it
+        is ready."""
+        if not obj.image:
+            return None
+        if isinstance(self.parent, serializers.ListSerializer):
+            return self.build_image_url(obj.card_image)
+        return self.build_image_url(obj.image.name)
+
+    def get_images(self, obj):
+        return {
+            variant: self.build_image_url(name)
+            for variant, name in obj.image_variants.items()
+        }
     
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user=self.context.get("request").user
         return (
             user.is_authenticated
@@ -165,6 +228,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user=self.context.get("request").user
         return (
             user.is_authenticated
@@ -180,7 +245,7 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     author = serializers.PrimaryKeyRelatedField(read_only=True)
     # tags = TagSerializer(many=True)
     ingredients = IngredientCreateUpdateSerializer(many=True)
-    image=Base64ImageField(use_url=True, required=False)
+    image = RecipeImageField(use_url=True, required=False)
 
     class Meta:
         model = Recipe
@@ -196,7 +261,6 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         )
 
     def validate(self, attrs):
-        print("=====Attrs for validation:", attrs)
         # Name is not shorted than 3 letters.
         if len(attrs.get('name')) < 3:
             raise serializers.ValidationError({
@@ -205,7 +269,6 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
         # Duplication of tags.
         tags = attrs.get('tags')
-        print('===Tags:', tags)
         if len(tags) != len(set(tags)):
             raise serializers.ValidationError({
                 'tags': 'Тэги не должны дублироваться'
@@ -219,25 +282,32 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                     'ingredients:': 'Обязательное поле для заполнения'
                 })
-        if len(set([item['id'] for item in ingredients])) < 2:
+        ingredient_ids = [item['id'] for item in ingredients]
+        if len(set(ingredient_ids)) < 2:
             raise serializers.ValidationError({
                     'ingredients:': 'Ингредиентов должно быть не менее двух.'
                 })
 
-        for ingredient in ingredients:
-            if not Ingredient.objects.filter(id=ingredient['id']).exists():
-                raise serializers.ValidationError({
-                    'ingredients:': f'Ингредиент с id={ingredient["id"]} \
-                        не существует в базе'
-                })
-        if len(ingredients) != len(set([item['id'] for item in ingredients])):
+        # One query for all ingredients instead of one per ingredient.
+        existing_ids = set(Ingredient.objects.filter(
+            id__in=ingredient_ids
+        ).values_list('id', flat=True))
+        missing_ids = [
+            ingredient_id for ingredient_id in ingredient_ids
+            if ingredient_id not in existing_ids
+        ]
+        if missing_ids:
+            raise serializers.ValidationError({
+                'ingredients:': f'Ингредиенты с id={missing_ids} '
+                                'не существуют в базе'
+            })
+        if len(ingredient_ids) != len(set(ingredient_ids)):
             raise serializers.ValidationError({
                 'ingredients': 'Ингредиенты не должны дублироваться'
             })
         
         # Amount is not lower than 1 unit.
-        amounts = attrs.get('ingredients')
-        if [item for item in amounts if item['amount'] < 1]:
+        if [item for item in ingredients if item['amount'] < 1]:
             raise serializers.ValidationError({
                 'amount': 'Количество ингредиента не должно быть менее 1'
             })
@@ -251,59 +321,116 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return attrs
 
     def create_ingredients(self, ingredients, recipe):
-        for ingredient in ingredients:
-            current_ingredient = Ingredient.objects.get(id=ingredient.get('id'))
-            RecipeIngredient.objects.create(
-                ingredient=current_ingredient,
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
                 recipe=recipe,
-                amount=ingredient.get('amount')
+                ingredient_id=ingredient.get('id'),
+                amount=ingredient.get('amount'),
+            )
+            for ingredient in ingredients
+        )
+
+    def update_ingredients(self, ingredients, recipe):
+        """Write only changed rows, return amounts before the update."""
+        current = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        old_amounts = {
+            ingredient_id: row.amount
+            for ingredient_id, row in current.items()
+        }
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = current.keys() - amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, row in current.items():
+            amount = amounts.get(ingredient_id, row.amount)
+            if row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ('amount',))
+        added = [
+            ingredient for ingredient in ingredients
+            if ingredient['id'] not in current
+        ]
+        if added:
+            self.create_ingredients(added, recipe)
+        return old_amounts
+
+    def update_shopping_lists(self, recipe, old_amounts, ingredients):
+        """Shift shopping lists of users who have the recipe in cart."""
+        deltas = {
+            ingredient_id: -amount
+            for ingredient_id, amount in old_amounts.items()
+        }
+        for ingredient in ingredients:
+            deltas[ingredient['id']] = (
+                deltas.get(ingredient['id'], 0) + ingredient['amount']
             )
-            # RecipeIngredient.objects.bulk_create([
-            #     RecipeIngredient(
-            #         recipe=recipe,
-            #         ingredient_id=ingredient.get('id'),
-            #         amount=ingredient.get('amount'),
-            #     )
-            # ])
+        ShoppingListItem.objects.apply_deltas(
+            ShoppingCart.objects.filter(
+                recipe=recipe
+            ).values_list('user_id', flat=True),
+            deltas
+        )
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
-        print("=====Validated data Tag:", tags)
         ingredients = validated_data.pop('ingredients')
 
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
-        # for tag in tags:
-        #     current_tag = Tag.objects.get(id=tag['id'])
-        #     RecipeTag.objects.create(
-        #         tag=current_tag,
-        #         recipe=recipe
-        #     )
         self.create_ingredients(ingredients, recipe)
+        Recipe.objects.filter(pk=recipe.pk).update_search_vector()
+        schedule_similarity_update(recipe)
+        catalog.invalidate_on_commit(RecipeIngredient)
+        if recipe.image:
+            schedule_image_processing(recipe)
         
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        if 'tags' in validated_data or 'ingredients' in validated_data:
+            schedule_similarity_update(instance)
         if 'tags' in validated_data:
             tags = validated_data.pop('tags')
             instance.tags.set(tags)
         if 'ingredients' in validated_data:
             ingredients = validated_data.pop('ingredients')
-            instance.ingredients.clear()
-            self.create_ingredients(ingredients, instance)
-        
-        return super().update(
-            instance, validated_data
-        )
+            # Списки покупок сдвигаются одним пересчетом, а не сигналами
+            # на каждую удаленную строку.
+            with shopping_lists_handled(instance.pk):
+                old_amounts = self.update_ingredients(ingredients, instance)
+            self.update_shopping_lists(instance, old_amounts, ingredients)
+            catalog.invalidate_on_commit(RecipeIngredient)
+        if validated_data.get('image'):
+            instance.image_variants = {}
+            schedule_image_processing(instance)
+
+        # Поисковый вектор пересчитывается сигналом post_save рецепта.
+        return super().update(instance, validated_data)
     
     def to_representation(self, instance):
+        request = self.context.get('request')
+        # Reload with relations and flags, see RecipeQuerySet.for_user().
         return RecipeReadSerializer(
-            instance,
+            Recipe.objects.for_user(request.user).get(pk=instance.pk),
             context={
-                'request': self.context.get('request')
+                'request': request
             }).data
 
 class RecipeSubscribeSerializer(serializers.ModelSerializer):
+    image = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -314,6 +441,14 @@ class RecipeSubscribeSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def get_image(self, obj):
+        """Card variant of the image, the original until it is ready."""
+        if not obj.image:
+            return None
+        url = default_storage.url(obj.card_image)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
 class SubscribeSerializer(serializers.ModelSerializer):
     email = serializers.CharField(
         source='author.email',
@@ -332,8 +467,7 @@ class SubscribeSerializer(serializers.ModelSerializer):
         read_only=True)
     recipes = serializers.SerializerMethodField(read_only=True)
     is_subscribed = serializers.SerializerMethodField(read_only=True)
-    recipes_count = serializers.ReadOnlyField(
-        source='author.recipe.count')
+    recipes_count = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Subscribe
@@ -363,15 +497,27 @@ class SubscribeSerializer(serializers.ModelSerializer):
         return attrs
 
     def get_recipes(self, obj):
-        recipes = obj.author.recipe.all()
+        if hasattr(obj.author, 'recipes_preview'):
+            recipes = obj.author.recipes_preview
+        else:
+            recipes = obj.author.recipe.order_by('-pub_date', '-id')
+            recipes_limit = self.context.get('recipes_limit')
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         return RecipeSubscribeSerializer(
             recipes,
             many=True
         ).data
 
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.author.recipe.count()
+
     def get_is_subscribed(self, obj):
-        return Subscribe.objects.filter(
-            user=self.context.get('request').user,
+        user = self.context.get('request').user
+        return obj.user_id == user.id or Subscribe.objects.filter(
+            user=user,
             author=obj.author
         ).exists()
 
@@ -384,7 +530,7 @@ class FavoriteSerializer(serializers.ModelSerializer):
         source='recipe.name',
         read_only=True)
     image = serializers.CharField(
-        source='recipe.image',
+        source='recipe.card_image',
         read_only=True)
     cooking_time = serializers.IntegerField(
         source='recipe.cooking_time',
@@ -418,7 +564,7 @@ class ShoppingCartRecipeSerializer(serializers.ModelSerializer):
         source='recipe.name',
         read_only=True)
     image = serializers.CharField(
-        source='recipe.image',
+        source='recipe.card_image',
         read_only=True)
     cooking_time = serializers.IntegerField(
         source='recipe.cooking_time',
@@ -0,0 +1,27 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import invalidate_tokens, invalidate_user_tokens
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    # После коммита, иначе параллельный запрос может снова закешировать
+    # еще не удаленный токен.
+    key = instance.key
+    transaction.on_commit(lambda: invalidate_tokens(key))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens_on_save(sender, instance, created,
+                                   update_fields=None, **kwargs):
+    # Смена пароля, деактивация и правка профиля меняют закешированного
+    # пользователя; вход обновляет только last_login.
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    transaction.on_commit(lambda: invalidate_user_tokens(instance))
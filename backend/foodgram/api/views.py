@@ -1,16 +1,21 @@
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
 
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import (AllowAny, IsAuthenticated,
     IsAuthenticatedOrReadOnly, SAFE_METHODS)
 from djoser.views import UserViewSet
 
-from recipes.models import (Tag, Ingredient, RecipeIngredient, Recipe,
+from recipes.ingredient_index import ingredient_index
+from recipes.pantry_index import pantry_index
+from recipes.models import (Tag, Ingredient, Recipe,
     Subscribe, FavoriteRecipe, ShoppingCart)
 from .filters import IngredientFilter, RecipeFilter
 from .serializers import (AccountCreateSerializer, AccountListSerializer, 
@@ -18,17 +23,47 @@ from .serializers import (AccountCreateSerializer, AccountListSerializer,
     RecipeReadSerializer, RecipeWriteSerializer, SubscribeSerializer, 
     FavoriteSerializer, ShoppingCartRecipeSerializer,
 )
-from .mixins import ListRetrieveModelMixin, CreateDestroyMixin
+from .pagination import RecipePagination
+from .mixins import (ListRetrieveModelMixin, CreateDestroyMixin,
+    CachedCatalogMixin, CachedRecipeDetailMixin)
 from .permissions import IsAuthorOrAdminOrReadOnly
+from .negotiation import FallbackContentNegotiation
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
 
 User = get_user_model()
 
 
+def get_recipes_limit(request):
+    """Parse recipes_limit query param, None means no limit."""
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None:
+        return None
+    try:
+        recipes_limit = int(recipes_limit)
+    except ValueError:
+        recipes_limit = -1
+    if recipes_limit < 0:
+        raise ValidationError({
+            'recipes_limit': 'Должно быть целым неотрицательным числом'
+        })
+    return recipes_limit
+
+
 class CustomUserViewSet(UserViewSet):
     """Create User, set new password, get 'me' page, get subscribers list."""
+    use_replica = True
     queryset = User.objects.all()
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
 
+    def get_instance(self):
+        # Пользователь из кеша токенов загружен не полностью, остальные
+        # поля читаются одним запросом.
+        user = self.request.user
+        deferred = user.get_deferred_fields()
+        if deferred:
+            user.refresh_from_db(fields=deferred)
+        return user
+
     def get_serializer_class(self):
         if self.action == 'set_password':
             return PasswordChangeSerializer
@@ -41,7 +76,10 @@ class CustomUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,)
     )
     def subscriptions(self, request):
-        queryset = Subscribe.objects.filter(user=request.user)
+        # Meta.ordering не применяется к запросам с GROUP BY.
+        queryset = Subscribe.objects.filter(
+            user=request.user
+        ).with_recipes(get_recipes_limit(request)).order_by('-id')
         pages = self.paginate_queryset(queryset)
         serializer = SubscribeSerializer(
             pages,
@@ -51,28 +89,46 @@ class CustomUserViewSet(UserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(ListRetrieveModelMixin):
+class TagViewSet(CachedCatalogMixin, ListRetrieveModelMixin):
     """Retrieving of Tag list or detail view based on id."""
+    use_replica = True
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
 
 
-class IngredientViewSet(ListRetrieveModelMixin):
-    """Retrieving of Ingredient list or detail view based on id."""
+class IngredientViewSet(CachedCatalogMixin, ListRetrieveModelMixin):
+    """Retrieving of Ingredient list or detail view based on id.
+
+    Search by name is served from the in-memory prefix index.
+    """
+    use_replica = True
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = None
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return Response(ingredient_index.search(name))
+
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    """CRUD of recipt. Create file with shopping list."""
-    queryset = Recipe.objects.all()
+class RecipeViewSet(CachedRecipeDetailMixin, viewsets.ModelViewSet):
+    """CRUD of recipt. Create file with shopping list.
+
+    Details are served from a shared cache with per-user flags merged in.
+    """
+    use_replica = True
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     filterset_class = RecipeFilter
+    pagination_class = RecipePagination
+
+    def get_queryset(self):
+        return Recipe.objects.for_user(self.request.user)
 
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
@@ -81,40 +137,100 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
-    
+
     @action(
         methods=['GET'],
         detail=False,
         url_path='download_shopping_cart',
-        pagination_class=None
+        pagination_class=None,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(PlainTextRenderer, CSVRenderer, PDFRenderer),
+        content_negotiation_class=FallbackContentNegotiation,
     )
     def download_shopping_cart(self, request):
-        if not request.user.shopping_cart_user.exists():
+        """Stream shopping list as txt, csv or pdf.
+
+        Format is chosen with ?format=txt|csv|pdf or the Accept header,
+        other Accept types get the text list.
+        """
+        if not request.user.shopping_list.exists():
             return Response(
                 'В корзине нет товаров',
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        text = 'Список покупок:\n'
-        ingredient_name = 'recipe__recipe__ingredient__name'
-        ingredient_unit = 'recipe__recipe__ingredient__measurement_unit'
-        recipe_amount = 'recipe__recipe__amount'
-        amount_sum = 'recipe__recipe__amount__sum'
-        cart = request.user.shopping_cart_user.select_related('recipe').values(
-            ingredient_name, ingredient_unit).annotate(
-                Sum(recipe_amount)).order_by(ingredient_name)
-        i = 1
-        for _ in cart:
-            text += (
-                f'{i}. {_[ingredient_name].capitalize()}'
-                f' - {_[amount_sum]}, {_[ingredient_unit]}\n'
+                status=status.HTTP_400_BAD_REQUEST,
+                content_type='text/plain; charset=utf-8'
             )
-            i += 1
-        response = HttpResponse(text, content_type='text/plain')
-        filename = 'shopping_list.txt'
+
+        renderer = request.accepted_renderer
+        rows = request.user.shopping_list.values(
+            'amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        ).order_by('name')
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type += f'; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            renderer.stream(rows.iterator()),
+            content_type=content_type
+        )
+        filename = f'shopping_list.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
+    @action(methods=['GET'], detail=False, pagination_class=None)
+    def pantry(self, request):
+        """What can be cooked from ?ingredients=<id>&ingredients=<id>.
+
+        Recipes are ranked by the share of their ingredients in the pantry,
+        then by the number of missing ones, see recipes/pantry_index.py.
+        """
+        try:
+            ingredient_ids = [
+                int(value)
+                for value in request.query_params.getlist('ingredients')
+            ]
+            limit = int(request.query_params.get(
+                'limit', settings.PANTRY_SEARCH_LIMIT
+            ))
+        except ValueError:
+            raise ValidationError(
+                'ingredients и limit должны быть целыми числами.'
+            )
+        if not ingredient_ids:
+            raise ValidationError({'ingredients': 'Укажите ингредиенты.'})
+        if len(ingredient_ids) > settings.PANTRY_MAX_INGREDIENTS:
+            raise ValidationError({
+                'ingredients': 'Не больше '
+                f'{settings.PANTRY_MAX_INGREDIENTS} ингредиентов.'
+            })
+        limit = min(max(limit, 1), settings.PANTRY_SEARCH_MAX_LIMIT)
+        ranked = pantry_index.search(ingredient_ids, limit)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in ranked]
+        )
+        # Рецепт мог быть удален после построения индекса.
+        ranked = [row for row in ranked if row[0] in recipes]
+        results = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in ranked], many=True
+        ).data
+        for item, (_, matched, missing) in zip(results, ranked):
+            item['coverage'] = round(matched / (matched + missing), 3)
+            item['missing_count'] = missing
+        return Response(results)
+
+    @action(methods=['GET'], detail=True, pagination_class=None)
+    def similar(self, request, pk=None):
+        """Recipes most similar by ingredients and tags, precomputed by
+        recipes/similarity.py."""
+        recipe = get_object_or_404(Recipe.objects.only('pk'), pk=pk)
+        recipes = self.get_queryset().filter(
+            similar_to__recipe=recipe
+        ).order_by('-similar_to__score', 'id')
+        serializer = self.get_serializer(
+            recipes[:settings.SIMILAR_RECIPES_COUNT], many=True
+        )
+        return Response(serializer.data)
+
 
 class SubscribeViewSet(CreateDestroyMixin):
     """Create/delete subscribtion."""
@@ -127,6 +243,7 @@ class SubscribeViewSet(CreateDestroyMixin):
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['author_id'] = self.kwargs.get('user_id')
+        context['recipes_limit'] = get_recipes_limit(self.request)
         return context
 
     def perform_create(self, serializer):
@@ -169,28 +286,30 @@ class FavoriteRecipeViewSet(CreateDestroyMixin):
         return context
 
     def perform_create(self, serializer):
-        serializer.save(
-            user=self.request.user,
-            recipe=get_object_or_404(
-                Recipe,
-                id=self.kwargs.get('recipe_id')
-            )
+        recipe = get_object_or_404(
+            Recipe,
+            id=self.kwargs.get('recipe_id')
         )
+        with transaction.atomic(savepoint=False):
+            serializer.save(
+                user=self.request.user,
+                recipe=recipe
+            )
 
     @action(methods=['DELETE'], detail=True)
     def delete(self, request, recipe_id):
-        try:
-            get_object_or_404(
-                FavoriteRecipe,
+        with transaction.atomic(savepoint=False):
+            deleted, _ = FavoriteRecipe.objects.filter(
                 user=request.user,
                 recipe_id=recipe_id
             ).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except:
+        if not deleted:
             return Response(
                 {'errors': 'Рецепт отсутствует в Вашем списке избранного'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 
 class ShoppingCartRecipeViewSet(CreateDestroyMixin):
     """Add/delete recipt in shopping list ."""
@@ -206,22 +325,25 @@ class ShoppingCartRecipeViewSet(CreateDestroyMixin):
         return context
 
     def perform_create(self, serializer):
-        serializer.save(
-            user=self.request.user,
-            recipe=get_object_or_404(
-                Recipe,
-                id=self.kwargs.get('recipe_id')
-            )
+        recipe = get_object_or_404(
+            Recipe,
+            id=self.kwargs.get('recipe_id')
         )
+        with transaction.atomic():
+            serializer.save(
+                user=self.request.user,
+                recipe=recipe
+            )
 
     @action(methods=['DELETE'], detail=True)
     def delete(self, request, recipe_id):
         try:
-            get_object_or_404(
-                ShoppingCart,
-                user=request.user,
-                recipe_id=recipe_id
-            ).delete()
+            with transaction.atomic():
+                get_object_or_404(
+                    ShoppingCart,
+                    user=request.user,
+                    recipe_id=recipe_id
+                ).delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
         except:
             return Response(
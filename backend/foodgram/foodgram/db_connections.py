@@ -0,0 +1,149 @@
+"""Persistent database connections with health checks and metrics.
+
+Connections live for CONN_MAX_AGE seconds and are shared by the requests
+a worker serves. This module replaces Django's close_old_connections
+handlers to count what happens to them:
+
+    opened   - new connections, their setup time is the wait time;
+    reused   - connections kept from an earlier request;
+    broken   - connections that failed the health check or errored and
+               were closed, the next query opens a new one;
+    recycled - connections closed after CONN_MAX_AGE.
+
+With DB_CONN_HEALTH_CHECKS a reused connection is checked (SELECT 1)
+before its first query in a request, as CONN_HEALTH_CHECKS does in newer
+Django versions.
+
+Totals per process are in `stats`, counts of the current request in
+`request_stats` (RequestMetricsMiddleware logs them).
+
+Nothing here keeps session state on the server, so the connections can
+go through an external pooler in transaction mode; set
+DB_DISABLE_SERVER_SIDE_CURSORS there, since .iterator() cursors outlive
+the transaction.
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import signals
+from django.db import close_old_connections as django_close_old_connections
+from django.db import connections
+from django.db.backends.base.base import BaseDatabaseWrapper
+
+logger = logging.getLogger('foodgram.db')
+
+
+class ConnectionStats:
+
+    FIELDS = ('opened', 'reused', 'broken', 'recycled')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = dict.fromkeys(self.FIELDS, 0)
+            self.wait_time = 0.0
+
+    def add(self, wait_time=0.0, **counts):
+        with self.lock:
+            for name, count in counts.items():
+                self.counts[name] += count
+            self.wait_time += wait_time
+
+    def snapshot(self):
+        with self.lock:
+            return dict(
+                self.counts, wait_ms=round(self.wait_time * 1000, 1)
+            )
+
+
+stats = ConnectionStats()
+request_stats = ContextVar('request_stats', default=None)
+
+
+def record(**counts):
+    stats.add(**counts)
+    current = request_stats.get()
+    if current is not None:
+        current.add(**counts)
+
+
+def close_old_connections(signal=None, **kwargs):
+    """Close connections that errored, were left in a transaction or are
+    older than CONN_MAX_AGE; at the start of a request mark the rest for
+    a health check."""
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        connection.health_check_pending = False
+        if (
+            connection.get_autocommit()
+            != connection.settings_dict['AUTOCOMMIT']
+            or connection.errors_occurred and not connection.is_usable()
+        ):
+            connection.close()
+            record(broken=1)
+            logger.warning(
+                'Закрыто сломанное соединение %s: %s',
+                connection.alias, stats.snapshot(),
+            )
+            continue
+        connection.errors_occurred = False
+        if (
+            connection.close_at is not None
+            and time.monotonic() >= connection.close_at
+        ):
+            connection.close()
+            record(recycled=1)
+            continue
+        if signal is signals.request_started:
+            connection.health_check_pending = True
+
+
+def instrument_connections():
+    """Time opening of connections and check reused ones before the first
+    query of a request."""
+    connect = BaseDatabaseWrapper.connect
+    ensure_connection = BaseDatabaseWrapper.ensure_connection
+    if getattr(connect, 'instrumented', False):
+        return
+
+    def timed_connect(connection):
+        start = time.perf_counter()
+        connect(connection)
+        record(opened=1, wait_time=time.perf_counter() - start)
+
+    def checked_ensure_connection(connection):
+        if getattr(connection, 'health_check_pending', False):
+            connection.health_check_pending = False
+            if connection.connection is not None:
+                start = time.perf_counter()
+                if (
+                    not settings.DB_CONN_HEALTH_CHECKS
+                    or connection.is_usable()
+                ):
+                    record(reused=1, wait_time=time.perf_counter() - start)
+                else:
+                    connection.close()
+                    record(broken=1, wait_time=time.perf_counter() - start)
+                    logger.warning(
+                        'Соединение %s не прошло проверку: %s',
+                        connection.alias, stats.snapshot(),
+                    )
+        ensure_connection(connection)
+
+    timed_connect.instrumented = True
+    BaseDatabaseWrapper.connect = timed_connect
+    BaseDatabaseWrapper.ensure_connection = checked_ensure_connection
+
+
+def install():
+    instrument_connections()
+    for signal in (signals.request_started, signals.request_finished):
+        signal.disconnect(django_close_old_connections)
+        signal.connect(close_old_connections)
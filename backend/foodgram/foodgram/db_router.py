@@ -0,0 +1,109 @@
+"""Read replica routing.
+
+ReplicaRoutingMiddleware picks a replica for safe requests to views that
+allow it (use_replica = True) and stores its alias in current_replica;
+ReplicaRouter sends reads of that request there. Everything else, and
+any request made by a client that wrote during the last
+REPLICA_PIN_SECONDS, goes to the primary ('default').
+
+A replica is skipped while it lags more than REPLICA_MAX_LAG seconds or
+for REPLICA_RETRY_AFTER seconds after a connection error.
+"""
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+current_replica = ContextVar('current_replica', default=None)
+
+# Модели, которые всегда читаются с основной базы: только что выданный
+# токен может еще не дойти до реплики.
+PRIMARY_ONLY_MODELS = {'authtoken.token'}
+
+LAG_CHECK_INTERVAL = 1.0
+
+LAG_SQL = {
+    'postgresql': (
+        'SELECT CASE WHEN pg_last_wal_receive_lsn() = '
+        'pg_last_wal_replay_lsn() THEN 0 ELSE COALESCE(EXTRACT(EPOCH FROM '
+        'now() - pg_last_xact_replay_timestamp()), 0) END'
+    ),
+}
+
+
+class ReplicaHealth:
+    """Per-process view of replica lag and failures."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.down_until = {}
+        self.lag = {}
+
+    def mark_down(self, alias):
+        with self.lock:
+            self.down_until[alias] = (
+                time.monotonic() + settings.REPLICA_RETRY_AFTER
+            )
+
+    def reset(self):
+        with self.lock:
+            self.down_until.clear()
+            self.lag.clear()
+
+    def is_usable(self, alias):
+        now = time.monotonic()
+        if self.down_until.get(alias, 0) > now:
+            return False
+        checked, lag = self.lag.get(alias, (0, 0))
+        if now - checked > LAG_CHECK_INTERVAL:
+            try:
+                lag = self.measure_lag(alias)
+            except DatabaseError:
+                self.mark_down(alias)
+                return False
+            with self.lock:
+                self.lag[alias] = (now, lag)
+        return lag <= settings.REPLICA_MAX_LAG
+
+    def measure_lag(self, alias):
+        connection = connections[alias]
+        sql = LAG_SQL.get(connection.vendor)
+        if sql is None:
+            connection.ensure_connection()
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            return float(cursor.fetchone()[0] or 0)
+
+
+health = ReplicaHealth()
+
+
+def choose_replica():
+    """Alias of a usable replica, None if reads must go to the primary."""
+    replicas = [
+        alias for alias in settings.DATABASE_REPLICAS
+        if health.is_usable(alias)
+    ]
+    return random.choice(replicas) if replicas else None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in PRIMARY_ONLY_MODELS:
+            return DEFAULT_DB_ALIAS
+        return current_replica.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
@@ -37,6 +37,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,9 +84,60 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'abc123456'),
         'HOST': os.getenv('DB_HOST', 'db'),
-        'PORT': os.getenv('DB_PORT', '5432')
+        'PORT': os.getenv('DB_PORT', '5432'),
+        # Соединение переиспользуется запросами воркера, см.
+        # foodgram/db_connections.py.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        # Нужно при пулере в режиме transaction (PgBouncer).
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.getenv('DB_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True'
+        ),
     }
 }
+# Check a reused connection with SELECT 1 before the first query of a request.
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+# Read replicas, comma separated hosts: DB_REPLICA_HOSTS=replica1,replica2.
+# Each one gets the alias replica<n>, see foodgram/db_router.py.
+DATABASE_REPLICAS = []
+for number, host in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    alias = f'replica{number}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host.strip(),
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+# Reads of a client stay on the primary this long after it wrote.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', 2))
+REPLICA_RETRY_AFTER = int(os.getenv('REPLICA_RETRY_AFTER', 30))
+
+# The cache keeps replica pins, auth tokens, catalog versions and recipe
+# details, so every worker of every app server must see the same one:
+# CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache,
+# CACHE_LOCATION=memcached:11211 (see infra/docker-compose.yml).
+# The file cache fallback is shared only by the workers of one host.
+CACHE_BACKEND = os.getenv(
+    'CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'
+)
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.getenv('CACHE_LOCATION', '/tmp/foodgram_cache'),
+    }
+}
+if CACHE_BACKEND.endswith('.FileBasedCache'):
+    # Past MAX_ENTRIES the file cache drops random entries (pins included),
+    # the default of 300 is far below the number of recipes.
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+        'CULL_FREQUENCY': int(os.getenv('CACHE_CULL_FREQUENCY', 10)),
+    }
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -131,7 +184,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
@@ -143,6 +196,69 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Tokens are cached in the shared cache and, for a shorter time, in a
+# per-process LRU which other processes cannot invalidate.
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 300))
+AUTH_TOKEN_LOCAL_TTL = int(os.getenv('AUTH_TOKEN_LOCAL_TTL', 5))
+AUTH_TOKEN_LOCAL_CACHE_SIZE = 10000
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+RECIPE_IMAGE_MAX_DIMENSION = 4096
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+# Generate image variants right after commit instead of in a thread pool.
+IMAGE_PROCESSING_SYNC = False
+
+# Top neighbours kept per recipe and the weight of tag overlap, see
+# recipes/similarity.py. SIMILAR_RECIPES_SYNC updates them right after
+# commit instead of in the image processing pool.
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_RECIPES_TAG_BOOST = 0.5
+SIMILAR_RECIPES_REVERSE_LIMIT = 1000
+SIMILAR_RECIPES_SYNC = False
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 30))
+
+# "What can I cook": recipes returned by default and at most, ingredients
+# accepted in one query. PANTRY_INDEX_SYNC rebuilds a stale index inside
+# the request instead of in a background thread.
+PANTRY_SEARCH_LIMIT = 20
+PANTRY_SEARCH_MAX_LIMIT = 100
+PANTRY_MAX_INGREDIENTS = 100
+PANTRY_INDEX_SYNC = False
+
+# Requests running more SQL queries are logged as warnings, 0 disables.
+REQUEST_QUERY_THRESHOLD = int(os.getenv('REQUEST_QUERY_THRESHOLD', 30))
+REQUEST_METRICS_SERVER_TIMING = (
+    os.getenv('REQUEST_METRICS_SERVER_TIMING', 'True') == 'True'
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_METRICS_LOG_LEVEL', 'INFO'),
+            'propagate': True,
+        },
+        'foodgram.db': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': True,
+        },
+    },
+}
+
 DJOSER = {
     'HIDE_USERS': False,
     'LOGIN_FIELD': 'email'
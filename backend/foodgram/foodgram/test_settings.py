@@ -0,0 +1,32 @@
+from .settings import *  # noqa: F401,F403
+
+# Tests run on SQLite unless a database engine is set explicitly,
+# e.g. DB_ENGINE=django.db.backends.postgresql for the production setup.
+if not os.getenv('DB_ENGINE'):  # noqa: F405
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),  # noqa: F405
+        }
+    }
+
+# Alias for the replica routing tests, the test runner points it at the
+# test database. Reads use it only when DATABASE_REPLICAS lists it.
+DATABASES['replica'] = dict(  # noqa: F405
+    DATABASES['default'],  # noqa: F405
+    TEST={'MIRROR': 'default'},
+)
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+IMAGE_PROCESSING_SYNC = True
+SIMILAR_RECIPES_SYNC = True
+PANTRY_INDEX_SYNC = True
@@ -0,0 +1,308 @@
+"""Load generator replaying the frontend flows against a running server.
+
+Every virtual user logs in through auth/token/login and then repeats a
+session: browse the recipe feed with tag filters, open a recipe, toggle
+it in favorites and in the shopping cart, now and then look at the
+subscriptions and download the shopping list. Latency is recorded per
+endpoint and summarised as throughput and p50/p95/p99.
+
+Only the standard library is used, so the script runs anywhere:
+
+    python loadtest.py --url http://localhost:8000 --concurrency 20 \\
+        --duration 60 --prefix load --users 1000
+
+Accounts are the ones created by `manage.py generate_dataset`
+(<prefix><n>@example.com with the same password).
+"""
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+PAGE_SIZE = 6
+# Вероятности шагов сессии после просмотра рецепта.
+FAVORITE_RATE = 0.3
+CART_RATE = 0.2
+SUBSCRIPTIONS_RATE = 0.1
+DOWNLOAD_RATE = 0.05
+
+
+class Stats:
+    """Thread-safe latencies and errors per endpoint."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, name, seconds, ok):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def summary(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        summary = {}
+        for name, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            summary[name] = {
+                'requests': len(latencies),
+                'errors': self.errors[name],
+                'rps': len(latencies) / elapsed,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p95_ms': percentile(latencies, 95) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+            }
+        return summary
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+class Client:
+    """Keep-alive HTTP connection of one virtual user."""
+
+    def __init__(self, base_url, stats, timeout=30):
+        url = urlsplit(base_url)
+        connection_class = (
+            http.client.HTTPSConnection if url.scheme == 'https'
+            else http.client.HTTPConnection
+        )
+        self.connect = lambda: connection_class(
+            url.hostname, url.port, timeout=timeout
+        )
+        self.connection = self.connect()
+        self.prefix = url.path.rstrip('/')
+        self.stats = stats
+        self.token = None
+
+    def request(self, name, method, path, payload=None,
+                expected=(200,), params=None):
+        """Send a request and record it under the endpoint name.
+
+        Returns the status and the decoded JSON body, if any.
+        """
+        headers = {'Accept': '*/*'}
+        if self.token:
+            headers['Authorization'] = f'Token {self.token}'
+        body = None
+        if payload is not None:
+            body = json.dumps(payload)
+            headers['Content-Type'] = 'application/json'
+        url = f'{self.prefix}{path}'
+        if params:
+            url = f'{url}?{urlencode(params, doseq=True)}'
+        start = time.perf_counter()
+        try:
+            status, content, content_type = self.send(
+                method, url, body, headers
+            )
+        except (OSError, http.client.HTTPException):
+            self.stats.record(name, time.perf_counter() - start, False)
+            self.connection.close()
+            self.connection = self.connect()
+            return None, None
+        self.stats.record(
+            name, time.perf_counter() - start, status in expected
+        )
+        if content and content_type.startswith('application/json'):
+            return status, json.loads(content)
+        return status, None
+
+    def send(self, method, url, body, headers):
+        try:
+            self.connection.request(method, url, body, headers)
+            response = self.connection.getresponse()
+        except (ConnectionError, http.client.RemoteDisconnected):
+            # Сервер мог закрыть простаивающее соединение.
+            self.connection.close()
+            self.connection = self.connect()
+            self.connection.request(method, url, body, headers)
+            response = self.connection.getresponse()
+        content = response.read()
+        return (
+            response.status, content, response.getheader('Content-Type', '')
+        )
+
+    def close(self):
+        self.connection.close()
+
+
+class VirtualUser:
+    """One logged-in user walking through the site."""
+
+    def __init__(self, client, email, password, tags, rng):
+        self.client = client
+        self.email = email
+        self.password = password
+        self.tags = tags
+        self.rng = rng
+        self.favorites = set()
+        self.cart = set()
+        # Число страниц ленты для каждого набора тегов.
+        self.pages = {}
+
+    def login(self):
+        status, body = self.client.request(
+            'auth-token-login', 'POST', '/api/auth/token/login/',
+            {'email': self.email, 'password': self.password},
+        )
+        if status != 200:
+            return False
+        self.client.token = body['auth_token']
+        return True
+
+    def session(self):
+        tags = ()
+        if self.tags:
+            tags = tuple(sorted(self.rng.sample(
+                self.tags, self.rng.randint(1, len(self.tags))
+            )))
+        params = {
+            'page': self.rng.randint(1, self.pages.get(tags, 1)),
+            'limit': PAGE_SIZE,
+            'tags': tags,
+        }
+        status, page = self.client.request(
+            'recipes-list', 'GET', '/api/recipes/', params=params
+        )
+        if status != 200 or not page['results']:
+            self.pages.pop(tags, None)
+            return
+        self.pages[tags] = max(1, -(-page['count'] // PAGE_SIZE))
+        recipe_id = self.rng.choice(page['results'])['id']
+
+        self.client.request(
+            'recipes-detail', 'GET', f'/api/recipes/{recipe_id}/'
+        )
+        if self.rng.random() < FAVORITE_RATE:
+            self.toggle('favorite', self.favorites, recipe_id)
+        if self.rng.random() < CART_RATE:
+            self.toggle('shopping_cart', self.cart, recipe_id)
+        if self.rng.random() < SUBSCRIPTIONS_RATE:
+            self.client.request(
+                'users-subscriptions', 'GET', '/api/users/subscriptions/'
+            )
+        if self.rng.random() < DOWNLOAD_RATE:
+            self.client.request(
+                'recipes-download-shopping-cart', 'GET',
+                '/api/recipes/download_shopping_cart/',
+            )
+
+    def toggle(self, kind, selected, recipe_id):
+        name = kind.replace('_', '-')
+        path = f'/api/recipes/{recipe_id}/{kind}/'
+        if recipe_id in selected:
+            self.client.request(
+                f'{name}-remove', 'DELETE', path, expected=(204,)
+            )
+            selected.discard(recipe_id)
+        else:
+            # 400 - рецепт уже был добавлен в прошлых запусках.
+            self.client.request(
+                f'{name}-add', 'POST', path, expected=(201, 400)
+            )
+            selected.add(recipe_id)
+
+
+def run(url, accounts, concurrency=10, duration=30.0, seed=0, stats=None):
+    """Run `concurrency` virtual users for `duration` seconds.
+
+    accounts is a list of (email, password), each virtual user takes the
+    next one. Returns the Stats object.
+    """
+    stats = stats or Stats()
+    deadline = time.monotonic() + duration
+    probe = Client(url, stats)
+    _, tags = probe.request('tags-list', 'GET', '/api/tags/')
+    probe.close()
+    tags = [tag['slug'] for tag in tags or []]
+
+    def worker(number):
+        rng = random.Random(f'{seed}:{number}')
+        client = Client(url, stats)
+        email, password = accounts[number % len(accounts)]
+        user = VirtualUser(client, email, password, tags, rng)
+        try:
+            if not user.login():
+                return
+            while time.monotonic() < deadline:
+                user.session()
+        finally:
+            client.close()
+
+    threads = [
+        threading.Thread(target=worker, args=(number,), daemon=True)
+        for number in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.stop()
+    return stats
+
+
+def print_summary(summary):
+    print(
+        f'{"endpoint":<34}{"requests":>9}{"errors":>8}{"rps":>9}'
+        f'{"p50, ms":>10}{"p95, ms":>10}{"p99, ms":>10}'
+    )
+    for name, row in summary.items():
+        print(
+            f'{name:<34}{row["requests"]:>9}{row["errors"]:>8}'
+            f'{row["rps"]:>9.1f}{row["p50_ms"]:>10.1f}'
+            f'{row["p95_ms"]:>10.1f}{row["p99_ms"]:>10.1f}'
+        )
+    total = sum(row['requests'] for row in summary.values())
+    rps = sum(row['rps'] for row in summary.values())
+    print(f'{"total":<34}{total:>9}{"":>8}{rps:>9.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8000')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument(
+        '--duration', type=float, default=30, help='Seconds to run'
+    )
+    parser.add_argument('--prefix', default='load')
+    parser.add_argument(
+        '--users', type=int, default=100,
+        help='Number of generated accounts to log in with',
+    )
+    parser.add_argument('--password', default='123')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--report', help='Write the summary to a JSON file')
+    args = parser.parse_args()
+
+    accounts = [
+        (f'{args.prefix}{number}@example.com', args.password)
+        for number in range(args.users)
+    ]
+    summary = run(
+        args.url, accounts, args.concurrency, args.duration, args.seed
+    ).summary()
+    print_summary(summary)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as report:
+            json.dump(summary, report, indent=2)
+
+
+if __name__ == '__main__':
+    main()
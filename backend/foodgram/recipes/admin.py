@@ -1,6 +1,7 @@
 from django.contrib import admin
-from django.db.models import Count
 
+from recipes import catalog
+from recipes.similarity import schedule_similarity_update
 from recipes.models import (Tag, Ingredient, 
     RecipeIngredient, Recipe, Subscribe, 
     FavoriteRecipe, ShoppingCart,
@@ -16,21 +17,20 @@ class RecipeIngredientAdmin(admin.TabularInline):
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredientAdmin,)
     list_display = (
-        'id', 'name', 'author', 'text', 'pub_date', 'favorite_count'
+        'id', 'name', 'author', 'text', 'pub_date', 'favorites_count',
+        'in_carts_count'
     )
     search_fields = ('name', 'author', 'tags')
     list_filter = ('name', 'author', 'tags', 'pub_date')
     filter_vertical = ('tags',)
     empty_value_display = '-пусто-'
 
-    def favorite_count(self, obj):
-        return obj.obj_count
-    
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        return queryset.annotate(
-            obj_count=Count("favorite_recipe", distinct=True),
-        )
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        Recipe.objects.filter(pk=form.instance.pk).update_search_vector()
+        schedule_similarity_update(form.instance)
+        catalog.invalidate_on_commit(RecipeIngredient)
+
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'measurement_unit')
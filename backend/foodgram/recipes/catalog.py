@@ -0,0 +1,84 @@
+"""Versions of reference data (tags, ingredients) in the shared cache.
+
+A version is the time of the last change of a model's table. It is bumped
+by ORM signals and by the import commands, so every worker can tell that
+its cached catalog or in-memory index is stale. The RecipeIngredient
+version is bumped after recipe writes for the pantry index.
+
+Signals are not sent by QuerySet.update() and bulk_create(), so code
+writing tags, ingredients or recipes that way must call invalidate() or
+invalidate_objects() itself, as the import commands do.
+
+Single objects (a recipe, a user) have versions too, for caches of data
+built from them; those keys expire after OBJECT_VERSION_TIMEOUT, which
+only makes such caches rebuild.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+OBJECT_VERSION_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def version_key(model):
+    return f'catalog:{model._meta.label_lower}:version'
+
+
+def object_version_key(model, pk):
+    return f'catalog:{model._meta.label_lower}:{pk}:version'
+
+
+def get_version(model):
+    version = cache.get(version_key(model))
+    if version is None:
+        cache.add(version_key(model), time.time(), timeout=None)
+        version = cache.get(version_key(model))
+    return version
+
+
+def get_versions(keys):
+    """Versions under the given keys in their order, one cache round trip
+    unless some are missing."""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if versions.get(key) is None:
+            cache.add(key, time.time(), timeout=OBJECT_VERSION_TIMEOUT)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def invalidate_object(model, pk):
+    cache.set(
+        object_version_key(model, pk), time.time(), OBJECT_VERSION_TIMEOUT
+    )
+
+
+def invalidate_objects(model, pks):
+    version = time.time()
+    cache.set_many(
+        {object_version_key(model, pk): version for pk in pks},
+        OBJECT_VERSION_TIMEOUT
+    )
+
+
+def invalidate_object_on_commit(model, pk):
+    transaction.on_commit(lambda: invalidate_object(model, pk))
+
+
+def invalidate_objects_on_commit(model, pks):
+    pks = list(pks)
+    transaction.on_commit(lambda: invalidate_objects(model, pks))
+
+
+def invalidate(*models):
+    cache.set_many(
+        {version_key(model): time.time() for model in models},
+        timeout=None
+    )
+
+
+def invalidate_on_commit(*models):
+    """Bump versions once the current transaction commits, so that workers
+    rebuilding on the new version see the change."""
+    transaction.on_commit(lambda: invalidate(*models))
@@ -0,0 +1,73 @@
+"""Background generation of recipe image variants.
+
+The request only stores the uploaded original. Decoding the pixels and
+resizing happen in a thread pool after the transaction commits, variants
+are rendered by sorl.thumbnail and their names saved to
+Recipe.image_variants, so serializers build URLs without extra queries.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import get_thumbnail
+
+from recipes import catalog
+
+logger = logging.getLogger(__name__)
+
+VARIANTS = {
+    'card': ('480x360', {'crop': 'center', 'format': 'JPEG', 'quality': 80}),
+    'detail': ('1200x900', {'format': 'JPEG', 'quality': 85}),
+    'webp': ('480x360', {'crop': 'center', 'format': 'WEBP', 'quality': 80}),
+}
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def get_executor():
+    # Created lazily, so that every forked gunicorn worker has its own.
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_PROCESSING_WORKERS,
+                thread_name_prefix='recipe-images',
+            )
+    return executor
+
+
+def process_recipe_image(recipe_id):
+    from recipes.models import Recipe
+
+    close_old_connections()
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id).first()
+        if recipe is None or not recipe.image:
+            return
+        variants = {
+            name: get_thumbnail(recipe.image, geometry, **options).name
+            for name, (geometry, options) in VARIANTS.items()
+        }
+        # Skip the update if the image was replaced in the meantime.
+        if Recipe.objects.filter(
+            pk=recipe_id, image=recipe.image.name
+        ).update(image_variants=variants):
+            catalog.invalidate_object(Recipe, recipe_id)
+    except Exception:
+        logger.exception('Image variants of recipe %s failed', recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_image_processing(recipe):
+    """Process the recipe image once the current transaction commits."""
+    recipe_id = recipe.pk
+    if settings.IMAGE_PROCESSING_SYNC:
+        transaction.on_commit(lambda: process_recipe_image(recipe_id))
+    else:
+        transaction.on_commit(
+            lambda: get_executor().submit(process_recipe_image, recipe_id)
+        )
@@ -0,0 +1,387 @@
+"""Chunked, idempotent bulk import of CSV/JSON data.
+
+Rows are streamed from the file and written in batches, so memory use
+does not depend on the file size. On PostgreSQL a batch is loaded with
+COPY into a temporary table and moved to the target table with
+INSERT ... SELECT ... ON CONFLICT, elsewhere the ORM bulk methods are used.
+
+Conflict modes:
+    error  - abort on the first duplicate, like a plain INSERT;
+    ignore - skip rows that already exist, re-runs are safe;
+    upsert - update existing rows by their unique fields.
+
+An upsert only updates the columns present in the input. auto_now_add
+fields and the derived fields given to BulkImporter (counters, search
+vectors and the like, maintained by the application) are never updated.
+"""
+import csv
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
+from django.db import IntegrityError, connection, transaction
+from django.db.models import AutoField
+
+CONFLICT_MODES = ('ignore', 'upsert', 'error')
+BATCH_SIZE = 5000
+READ_SIZE = 64 * 1024
+# NULL marker of the COPY stream.
+NULL = '\\N'
+
+
+def read_csv(path):
+    with open(path, 'r', encoding='utf-8', newline='') as csv_file:
+        yield from csv.DictReader(csv_file)
+
+
+def read_json(path):
+    """Objects of a JSON array or of a JSON Lines file, one at a time."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as json_file:
+        buffer = json_file.read(READ_SIZE).lstrip()
+        if not buffer.startswith('['):
+            json_file.seek(0)
+            for line in json_file:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip(', \t\r\n')
+            if buffer.startswith(']'):
+                return
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = json_file.read(READ_SIZE)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            yield obj
+            buffer = buffer[end:]
+
+
+def read_rows(path):
+    if str(path).endswith(('.json', '.jsonl')):
+        return read_json(path)
+    return read_csv(path)
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def add_import_arguments(parser):
+    parser.add_argument(
+        '--conflicts',
+        choices=CONFLICT_MODES,
+        default='ignore',
+        help='Что делать с уже существующими записями (по умолчанию ignore)',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=BATCH_SIZE,
+        help='Количество строк в одной пачке',
+    )
+    parser.add_argument(
+        '--no-copy',
+        action='store_true',
+        help='Не использовать COPY даже на PostgreSQL',
+    )
+
+
+class BulkImporter:
+    """Write model rows in batches with the chosen conflict mode.
+
+    on_batch is called with the objects of every committed batch, e.g. to
+    drop caches of the rows, since the bulk writes send no signals.
+    """
+
+    def __init__(self, model, unique_fields, conflicts='ignore',
+                 batch_size=BATCH_SIZE, use_copy=True, stdout=None,
+                 derived_fields=(), on_batch=None):
+        self.model = model
+        self.unique_fields = [
+            model._meta.get_field(name) for name in unique_fields
+        ]
+        self.derived_fields = [
+            model._meta.get_field(name) for name in derived_fields
+        ]
+        self.conflicts = conflicts
+        self.batch_size = batch_size
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.stdout = stdout
+        self.on_batch = on_batch
+
+    def get_fields(self, obj):
+        return [
+            field for field in self.model._meta.concrete_fields
+            if not isinstance(field, AutoField) or obj.pk is not None
+        ]
+
+    def get_update_fields(self, row):
+        """Fields an upsert may overwrite: those given in the row, except
+        the keys, auto_now_add and derived fields."""
+        return [
+            field for field in self.model._meta.concrete_fields
+            if (field.name in row or field.attname in row)
+            and not field.primary_key
+            and field not in self.unique_fields
+            and field not in self.derived_fields
+            and not getattr(field, 'auto_now_add', False)
+        ]
+
+    def run(self, rows):
+        """Import dicts of field values, return the number of rows."""
+        total = 0
+        has_pk = False
+        start = time.perf_counter()
+        for batch in batches(rows, self.batch_size):
+            objs = [self.model(**row) for row in batch]
+            has_pk = has_pk or objs[0].pk is not None
+            try:
+                with transaction.atomic():
+                    if self.use_copy:
+                        self.copy_batch(objs, batch[0])
+                    elif self.conflicts == 'upsert':
+                        self.upsert_batch(objs, batch[0])
+                    else:
+                        self.model.objects.bulk_create(
+                            objs, ignore_conflicts=self.conflicts == 'ignore'
+                        )
+            except IntegrityError as error:
+                raise CommandError(
+                    f'Такие экземпляры {self.model.__name__} уже существуют: '
+                    f'{error}. Используйте --conflicts=ignore или upsert.'
+                )
+            if self.on_batch is not None:
+                self.on_batch(objs)
+            total += len(objs)
+            self.report(total, start)
+        if has_pk:
+            self.reset_sequence()
+        return total
+
+    def report(self, total, start):
+        if self.stdout is None:
+            return
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(
+            f'{self.model.__name__}: {total} строк, {rate:.0f} строк/с'
+        )
+
+    def reset_sequence(self):
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                no_style(), [self.model]
+            ):
+                cursor.execute(sql)
+
+    def upsert_batch(self, objs, row):
+        """ORM upsert for databases without COPY: update existing rows by
+        unique fields, create the rest."""
+        update_fields = self.get_update_fields(row)
+        key_names = [field.attname for field in self.unique_fields]
+
+        def key(obj):
+            # Значения из CSV - строки, из БД - значения типа поля.
+            return tuple(
+                field.to_python(getattr(obj, field.attname))
+                for field in self.unique_fields
+            )
+
+        first = key_names[0]
+        existing = {
+            key(obj): obj.pk
+            for obj in self.model.objects.filter(**{
+                f'{first}__in': {getattr(obj, first) for obj in objs}
+            }).only(*key_names)
+        }
+        new, changed = {}, {}
+        for obj in objs:
+            if key(obj) in existing:
+                obj.pk = existing[key(obj)]
+                changed[key(obj)] = obj
+            else:
+                new[key(obj)] = obj
+        if changed and update_fields:
+            self.model.objects.bulk_update(
+                changed.values(), [field.name for field in update_fields]
+            )
+        if new:
+            self.model.objects.bulk_create(new.values())
+
+    def copy_batch(self, objs, row):
+        """COPY into a temporary table, then INSERT ... ON CONFLICT."""
+        quote = connection.ops.quote_name
+        fields = self.get_fields(objs[0])
+        table = quote(self.model._meta.db_table)
+        staging = quote(f'import_{self.model._meta.db_table}')
+        columns = ', '.join(quote(field.column) for field in fields)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for obj in objs:
+            writer.writerow(
+                NULL if value is None else value
+                for value in (
+                    field.get_db_prep_save(
+                        field.pre_save(obj, True), connection
+                    )
+                    for field in fields
+                )
+            )
+        buffer.seek(0)
+
+        keys = ', '.join(quote(field.column) for field in self.unique_fields)
+        select = f'SELECT {columns} FROM {staging}'
+        if self.conflicts == 'ignore':
+            on_conflict = 'ON CONFLICT DO NOTHING'
+        elif self.conflicts == 'upsert':
+            select = f'SELECT DISTINCT ON ({keys}) {columns} FROM {staging}'
+            updates = ', '.join(
+                f'{quote(field.column)} = EXCLUDED.{quote(field.column)}'
+                for field in self.get_update_fields(row)
+            )
+            on_conflict = (
+                f'ON CONFLICT ({keys}) DO UPDATE SET {updates}' if updates
+                else f'ON CONFLICT ({keys}) DO NOTHING'
+            )
+        else:
+            on_conflict = ''
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {staging} AS '
+                f'SELECT {columns} FROM {table} WITH NO DATA'
+            )
+            cursor.copy_expert(
+                f'COPY {staging} ({columns}) FROM STDIN '
+                f"WITH (FORMAT csv, NULL '{NULL}')",
+                buffer,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} ({columns}) {select} {on_conflict}'
+            )
+            cursor.execute(f'DROP TABLE {staging}')
+
+
+def hash_passwords(passwords, executor=None, chunksize=1):
+    """Password hashes, computed in the process pool when it is given."""
+    if executor is None:
+        return [make_password(password) for password in passwords]
+    return list(executor.map(make_password, passwords, chunksize=chunksize))
+
+
+class UserImporter:
+    """Create users in batches, hashing passwords across processes.
+
+    Users whose username or email is already taken (in the database or
+    earlier in the file) are skipped and counted, not treated as errors.
+    """
+
+    def __init__(self, model, workers=None, batch_size=BATCH_SIZE,
+                 stdout=None):
+        self.model = model
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.stdout = stdout
+        self.created = 0
+        self.skipped = 0
+
+    def run(self, rows):
+        """Import dicts with username, email, password etc, return the
+        number of created users."""
+        start = time.perf_counter()
+        executor = None
+        if self.workers > 1:
+            executor = ProcessPoolExecutor(
+                self.workers, initializer=django.setup
+            )
+        try:
+            seen_usernames, seen_emails = set(), set()
+            for batch in batches(rows, self.batch_size):
+                batch = self.new_rows(batch, seen_usernames, seen_emails)
+                if batch:
+                    self.create_batch(batch, executor)
+                self.report(start)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self.created
+
+    def new_rows(self, batch, seen_usernames, seen_emails):
+        existing_usernames = set(self.model.objects.filter(
+            username__in=[row['username'] for row in batch]
+        ).values_list('username', flat=True))
+        existing_emails = set(self.model.objects.filter(
+            email__in=[row['email'] for row in batch]
+        ).values_list('email', flat=True))
+        rows = []
+        for row in batch:
+            if (
+                row['username'] in existing_usernames
+                or row['username'] in seen_usernames
+                or row['email'] in existing_emails
+                or row['email'] in seen_emails
+            ):
+                self.skipped += 1
+                continue
+            seen_usernames.add(row['username'])
+            seen_emails.add(row['email'])
+            rows.append(row)
+        return rows
+
+    def create_batch(self, rows, executor):
+        hashes = hash_passwords(
+            [row['password'] for row in rows],
+            executor,
+            chunksize=max(1, len(rows) // (self.workers * 4)),
+        )
+        users = [
+            self.model(
+                username=row['username'],
+                first_name=row.get('first_name', ''),
+                last_name=row.get('last_name', ''),
+                email=row['email'],
+                password=password,
+                is_superuser=bool(row.get('is_superuser')),
+                is_staff=bool(row.get('is_staff')),
+            )
+            for row, password in zip(rows, hashes)
+        ]
+        # ignore_conflicts защищает от параллельной регистрации тех же
+        # пользователей между проверкой и вставкой. Такие строки не
+        # вставляются, поэтому созданными считаются только строки с нашими
+        # хешами паролей (у каждого своя соль).
+        with transaction.atomic():
+            self.model.objects.bulk_create(users, ignore_conflicts=True)
+            created = self.model.objects.filter(
+                username__in=[user.username for user in users],
+                password__in=hashes,
+            ).count()
+        self.created += created
+        self.skipped += len(users) - created
+
+    def report(self, start):
+        if self.stdout is None:
+            return
+        elapsed = time.perf_counter() - start
+        total = self.created + self.skipped
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(
+            f'{self.model.__name__}: создано {self.created}, '
+            f'пропущено {self.skipped}, {rate:.0f} строк/с'
+        )
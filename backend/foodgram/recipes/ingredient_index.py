@@ -0,0 +1,94 @@
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+
+from django.conf import settings
+
+from recipes import catalog
+from recipes.models import Ingredient
+
+# Sorts after any character of an ingredient name.
+MAX_CHAR = '\U0010ffff'
+
+Snapshot = namedtuple('Snapshot', 'records names words')
+
+
+class IngredientIndex:
+    """In-memory prefix index of ingredient names for autocomplete.
+
+    Names are kept in sorted arrays and searched with bisect: one array of
+    whole names for prefix matches and one of name suffixes starting at
+    each following word for word-start matches. Substring matches are a
+    linear scan that only runs when the first two groups don't fill the
+    limit. The index is rebuilt from the database when the catalog version
+    in the shared cache changes, so all workers see ingredient changes.
+    A rebuild publishes the arrays as one Snapshot, so a search running in
+    another thread never mixes old and new arrays.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.snapshot = Snapshot((), (), ())
+
+    @staticmethod
+    def build():
+        # Positions in records follow name order, so sorting positions
+        # ranks matches alphabetically within a group.
+        records = tuple(sorted(
+            Ingredient.objects.values('id', 'name', 'measurement_unit'),
+            key=lambda record: (record['name'].lower(), record['id'])
+        ))
+        names = tuple(
+            (record['name'].lower(), position)
+            for position, record in enumerate(records)
+        )
+        words = tuple(sorted(
+            (name[start + 1:], position)
+            for name, position in names
+            for start, char in enumerate(name)
+            if char == ' ' and name[start + 1:start + 2] not in ('', ' ')
+        ))
+        return Snapshot(records, names, words)
+
+    def refresh(self):
+        version = catalog.get_version(Ingredient)
+        if version == self.version:
+            return
+        with self.lock:
+            if version != self.version:
+                self.snapshot = self.build()
+                self.version = version
+
+    @staticmethod
+    def prefix_range(keys, query):
+        start = bisect_left(keys, (query,))
+        end = bisect_left(keys, (query + MAX_CHAR,), lo=start)
+        return keys[start:end]
+
+    def ranked(self, snapshot, query):
+        for _, position in self.prefix_range(snapshot.names, query):
+            yield position
+        yield from sorted(
+            position
+            for _, position in self.prefix_range(snapshot.words, query)
+        )
+        for name, position in snapshot.names:
+            if query in name:
+                yield position
+
+    def search(self, query, limit=None):
+        """Ingredients ranked: name prefix, word start, then substring."""
+        self.refresh()
+        # Readers take the snapshot once, a rebuild replaces it as a whole.
+        snapshot = self.snapshot
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        found = {}
+        for position in self.ranked(snapshot, query.lower()):
+            found.setdefault(position)
+            if len(found) >= limit:
+                break
+        return [snapshot.records[position] for position in found]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes import similarity
+
+
+class Command(BaseCommand):
+    help = 'Пересчет похожих рецептов по матрице рецепт x ингредиент'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--block-cells',
+            type=int,
+            default=similarity.BLOCK_CELLS,
+            help='Размер блока оценок, вычисляемого за один шаг',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        total = similarity.rebuild(options['block_cells'])
+        return (
+            f'Похожие рецепты пересчитаны: {total} связей за '
+            f'{time.perf_counter() - start:.1f} с.'
+        )
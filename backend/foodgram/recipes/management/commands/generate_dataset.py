@@ -0,0 +1,252 @@
+import random
+from bisect import bisect_left
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+from recipes import catalog
+from recipes.importing import (BATCH_SIZE, BulkImporter, UserImporter,
+                               batches)
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Subscribe, Tag)
+
+User = get_user_model()
+
+DISHES = (
+    'Суп', 'Салат', 'Рагу', 'Омлет', 'Пирог', 'Запеканка', 'Каша', 'Паста',
+    'Плов', 'Котлеты', 'Блины', 'Оладьи', 'Ризотто', 'Жаркое', 'Кекс',
+)
+AMOUNTS = (1, 2, 3, 5, 10, 20, 50, 100, 150, 200, 250, 300, 500)
+
+
+class Zipf:
+    """Sample items whose popularity follows Zipf's law: the item of
+    rank k is chosen with probability proportional to 1 / k ** s."""
+
+    def __init__(self, items, s, rng):
+        self.items = list(items)
+        # Ранг не должен совпадать с порядком id, иначе самыми
+        # популярными всегда окажутся самые старые записи.
+        rng.shuffle(self.items)
+        self.cum_weights = list(accumulate(
+            1 / rank ** s for rank in range(1, len(self.items) + 1)
+        ))
+
+    def choice(self, rng):
+        point = rng.random() * self.cum_weights[-1]
+        return self.items[bisect_left(self.cum_weights, point)]
+
+    def sample(self, rng, k):
+        """Up to k distinct items."""
+        k = min(k, len(self.items))
+        chosen = {}
+        for _ in range(k * 10):
+            if len(chosen) == k:
+                break
+            item = self.choice(rng)
+            chosen[item] = None
+        return list(chosen)
+
+
+class Command(BaseCommand):
+    help = 'Генерация воспроизводимого набора данных для нагрузочных тестов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--authors-share', type=float, default=0.1,
+            help='Доля пользователей, публикующих рецепты',
+        )
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Среднее число избранных рецептов у пользователя',
+        )
+        parser.add_argument(
+            '--carts', type=float, default=2,
+            help='Среднее число рецептов в корзине пользователя',
+        )
+        parser.add_argument(
+            '--subscriptions', type=float, default=5,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности',
+        )
+        parser.add_argument(
+            '--days', type=float, default=365,
+            help='За сколько последних дней распределены даты публикации',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--prefix', default='load',
+            help='Префикс логинов создаваемых пользователей',
+        )
+        parser.add_argument('--password', default='123')
+        parser.add_argument('--workers', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--no-copy', action='store_true')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.seed = options['seed']
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        tag_ids = list(
+            Tag.objects.order_by('id').values_list('id', flat=True)
+        )
+        ingredient_ids = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+        if not tag_ids or not ingredient_ids:
+            raise CommandError(
+                'Сначала загрузите теги и ингредиенты: '
+                'python manage.py import_tags_ingredients'
+            )
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                'задайте другой --prefix.'
+            )
+
+        rng = random.Random(self.seed)
+        self.import_users()
+        user_ids = list(User.objects.filter(
+            username__startswith=prefix
+        ).order_by('id').values_list('id', flat=True))
+        authors = user_ids[
+            :max(1, int(len(user_ids) * options['authors_share']))
+        ]
+        self.authors = Zipf(authors, options['zipf'], rng)
+        self.tags = Zipf(tag_ids, options['zipf'], rng)
+        self.ingredients = Zipf(ingredient_ids, options['zipf'], rng)
+
+        first_id = (Recipe.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        recipe_ids = range(first_id, first_id + options['recipes'])
+        self.write(Recipe, ('id',), map(self.recipe_row, recipe_ids))
+        self.spread_pub_dates(recipe_ids)
+        self.write(Recipe.tags.through, ('recipe', 'tag'), (
+            row for recipe_id in recipe_ids
+            for row in self.recipe_tag_rows(recipe_id)
+        ))
+        self.write(RecipeIngredient, ('recipe', 'ingredient'), (
+            row for recipe_id in recipe_ids
+            for row in self.recipe_ingredient_rows(recipe_id)
+        ))
+
+        recipes = Zipf(recipe_ids, options['zipf'], rng)
+        self.write(FavoriteRecipe, ('user', 'recipe'), self.user_rows(
+            user_ids, recipes, 'recipe_id', options['favorites'], 'favorites'
+        ))
+        self.write(ShoppingCart, ('user', 'recipe'), self.user_rows(
+            user_ids, recipes, 'recipe_id', options['carts'], 'carts'
+        ))
+        self.write(Subscribe, ('user', 'author'), self.user_rows(
+            user_ids, self.authors, 'author_id', options['subscriptions'],
+            'subscriptions'
+        ))
+        generated = Recipe.objects.filter(
+            id__gte=recipe_ids.start, id__lt=recipe_ids.stop
+        )
+        generated.update_search_vector()
+        generated.reconcile_counters()
+        ShoppingListItem.objects.rebuild()
+        catalog.invalidate(RecipeIngredient)
+        return (
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}.'
+        )
+
+    def rng(self, *key):
+        """Independent generator per entity, so each table is written in
+        its own pass without keeping the dataset in memory."""
+        return random.Random(':'.join(map(str, (self.seed, *key))))
+
+    def write(self, model, unique_fields, rows):
+        BulkImporter(
+            model,
+            unique_fields,
+            batch_size=self.options['batch_size'],
+            use_copy=not self.options['no_copy'],
+            stdout=self.stdout,
+        ).run(rows)
+
+    def import_users(self):
+        prefix = self.options['prefix']
+        UserImporter(
+            User,
+            workers=self.options['workers'],
+            batch_size=self.options['batch_size'],
+            stdout=self.stdout,
+        ).run(
+            {
+                'username': f'{prefix}{number}',
+                'first_name': 'Имя',
+                'last_name': 'Фамилия',
+                'email': f'{prefix}{number}@example.com',
+                'password': self.options['password'],
+            }
+            for number in range(self.options['users'])
+        )
+
+    def recipe_row(self, recipe_id):
+        rng = self.rng('recipe', recipe_id)
+        return {
+            'id': recipe_id,
+            'name': f'{rng.choice(DISHES)} №{recipe_id}',
+            'image': 'recipes/images/sample.jpg',
+            'text': 'Описание рецепта.',
+            'cooking_time': rng.randint(5, 180),
+            'author_id': self.authors.choice(rng),
+        }
+
+    def spread_pub_dates(self, recipe_ids):
+        """pub_date is auto_now_add, so the bulk writes set it to now.
+        Spread it uniformly over the last --days, so the feed order, keyset
+        cursors and pub_date indexes see realistic, distinct values."""
+        now = timezone.now()
+        seconds = self.options['days'] * 24 * 60 * 60
+        for batch in batches(recipe_ids, self.options['batch_size']):
+            Recipe.objects.bulk_update([
+                Recipe(id=recipe_id, pub_date=now - timedelta(
+                    seconds=self.rng('pub_date', recipe_id).uniform(0, seconds)
+                ))
+                for recipe_id in batch
+            ], ['pub_date'])
+
+    def recipe_tag_rows(self, recipe_id):
+        rng = self.rng('tags', recipe_id)
+        return [
+            {'recipe_id': recipe_id, 'tag_id': tag_id}
+            for tag_id in self.tags.sample(rng, rng.randint(1, 3))
+        ]
+
+    def recipe_ingredient_rows(self, recipe_id):
+        rng = self.rng('ingredients', recipe_id)
+        return [
+            {
+                'recipe_id': recipe_id,
+                'ingredient_id': ingredient_id,
+                'amount': rng.choice(AMOUNTS),
+            }
+            for ingredient_id in self.ingredients.sample(
+                rng, rng.randint(3, 12)
+            )
+        ]
+
+    def user_rows(self, user_ids, items, field, mean, kind):
+        """Rows linking every user to about `mean` popular items."""
+        if not mean:
+            return
+        for number, user_id in enumerate(user_ids):
+            rng = self.rng(kind, number)
+            count = int(rng.expovariate(1 / mean))
+            for item in items.sample(rng, count):
+                if item != user_id or field != 'author_id':
+                    yield {'user_id': user_id, field: item}
@@ -1,36 +1,75 @@
-import csv
-from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
-from django.db import IntegrityError
+from recipes import catalog
+from recipes.importing import BulkImporter, add_import_arguments, read_rows
 from recipes.models import Recipe, RecipeIngredient
 
 User = get_user_model()
 
 
+# Model: (file, unique fields used by --conflicts=upsert).
 Models = {
-    Recipe: 'recipes.csv',
-    Recipe.tags.through: 'recipe_tags.csv',
-    RecipeIngredient: 'recipe_ingredients.csv',
+    Recipe: ('recipes.csv', ('id',)),
+    Recipe.tags.through: ('recipe_tags.csv', ('recipe', 'tag')),
+    RecipeIngredient: ('recipe_ingredients.csv', ('recipe', 'ingredient')),
+}
+# Fields maintained by the application, never overwritten by an upsert.
+DERIVED_FIELDS = {
+    Recipe: (
+        'favorites_count', 'in_carts_count', 'image_variants',
+        'search_vector',
+    ),
+}
+
+# Attribute with the id of the recipe a row belongs to.
+RECIPE_ID_FIELDS = {
+    Recipe: 'id',
+    Recipe.tags.through: 'recipe_id',
+    RecipeIngredient: 'recipe_id',
 }
 
 
+def invalidate_recipes(model):
+    """Bump versions of the batch's recipes, so their cached details are
+    rebuilt after an upsert or added tags and ingredients."""
+    attname = RECIPE_ID_FIELDS[model]
+
+    def invalidate(objs):
+        catalog.invalidate_objects(Recipe, {
+            int(getattr(obj, attname)) for obj in objs
+            if getattr(obj, attname) is not None
+        })
+    return invalidate
+
+
 class Command(BaseCommand):
     help = 'Загрузка данных из csv файлов'
 
+    def add_arguments(self, parser):
+        add_import_arguments(parser)
+        parser.add_argument(
+            '--data-dir',
+            default=None,
+            help='Каталог с файлами данных (по умолчанию BASE_DIR/data)',
+        )
+
     def handle(self, *args, **options):
-        for model, csv_files in Models.items():
-            with open(
-                f'{settings.BASE_DIR}/data/{csv_files}',
-                'r',
-                encoding='utf-8'
-            ) as csv_file:
-                reader = csv.DictReader(csv_file)
-                try:
-                    model.objects.bulk_create(
-                        model(**data) for data in reader
-                    )
-                except IntegrityError:
-                    return f'Такие экземляры {model} уже существуют...'
-                self.stdout.write(f'Данные таблицы {model.__name__} успешно загружены')
+        data_dir = options['data_dir'] or f'{settings.BASE_DIR}/data'
+        for model, (data_file, unique_fields) in Models.items():
+            BulkImporter(
+                model,
+                unique_fields,
+                conflicts=options['conflicts'],
+                batch_size=options['batch_size'],
+                use_copy=not options['no_copy'],
+                stdout=self.stdout,
+                derived_fields=DERIVED_FIELDS.get(model, ()),
+                on_batch=invalidate_recipes(model),
+            ).run(read_rows(f'{data_dir}/{data_file}'))
+            self.stdout.write(
+                f'Данные таблицы {model.__name__} успешно загружены'
+            )
+        Recipe.objects.update_search_vector()
+        catalog.invalidate(RecipeIngredient)
         return 'Рецепты загружены.'
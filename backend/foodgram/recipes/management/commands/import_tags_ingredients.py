@@ -1,31 +1,40 @@
-import csv
 from django.conf import settings
 from django.core.management.base import BaseCommand
-from django.db import IntegrityError
+from recipes import catalog
+from recipes.importing import BulkImporter, add_import_arguments, read_rows
 from recipes.models import Tag, Ingredient
 
+# Model: (file, unique fields used by --conflicts=upsert).
 Models = {
-    Ingredient: 'ingredients.csv',
-    Tag: 'tags.csv'
+    Ingredient: ('ingredients.csv', ('name', 'measurement_unit')),
+    Tag: ('tags.csv', ('slug',)),
 }
 
 
 class Command(BaseCommand):
     help = 'Загрузка данных из csv файлов'
 
+    def add_arguments(self, parser):
+        add_import_arguments(parser)
+        parser.add_argument(
+            '--data-dir',
+            default=None,
+            help='Каталог с файлами данных (по умолчанию BASE_DIR/data)',
+        )
+
     def handle(self, *args, **options):
-        for model, csv_files in Models.items():
-            with open(
-                f'{settings.BASE_DIR}/data/{csv_files}',
-                'r',
-                encoding='utf-8'
-            ) as csv_file:
-                reader = csv.DictReader(csv_file)
-                try:
-                    model.objects.bulk_create(
-                        model(**data) for data in reader
-                    )
-                    self.stdout.write(f'Данные таблицы {model.__name__} успешно загружены')
-                except IntegrityError:
-                    return f'Такие экземляры {model} уже существуют...'
-        return 'Данные тегов и ингредиентов загружены.'
\ No newline at end of file
+        data_dir = options['data_dir'] or f'{settings.BASE_DIR}/data'
+        for model, (data_file, unique_fields) in Models.items():
+            BulkImporter(
+                model,
+                unique_fields,
+                conflicts=options['conflicts'],
+                batch_size=options['batch_size'],
+                use_copy=not options['no_copy'],
+                stdout=self.stdout,
+            ).run(read_rows(f'{data_dir}/{data_file}'))
+            catalog.invalidate(model)
+            self.stdout.write(
+                f'Данные таблицы {model.__name__} успешно загружены'
+            )
+        return 'Данные тегов и ингредиентов загружены.'
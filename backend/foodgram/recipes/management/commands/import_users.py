@@ -1,8 +1,7 @@
-import csv
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
-from django.db import IntegrityError
+from recipes.importing import BATCH_SIZE, UserImporter, read_rows
 
 User = get_user_model()
 
@@ -10,25 +9,36 @@ User = get_user_model()
 class Command(BaseCommand):
     help = 'Загрузка данных из csv файлов'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Число процессов для хеширования паролей '
+                 '(по умолчанию по числу ядер, 1 - без пула)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Количество пользователей в одной пачке',
+        )
+        parser.add_argument(
+            '--data-dir',
+            default=None,
+            help='Каталог с файлами данных (по умолчанию BASE_DIR/data)',
+        )
+
     def handle(self, *args, **options):
-        with open(
-            f'{settings.BASE_DIR}/data/users.csv',
-            'r',
-            encoding='utf-8'
-        ) as csv_file:
-            reader = csv.DictReader(csv_file)
-            for row in reader:
-                try:
-                    u = User(
-                        username=row['username'],
-                        first_name=row['first_name'],
-                        last_name=row['last_name'],
-                        email=row['email'],
-                        is_superuser=bool(row['is_superuser']),
-                        is_staff=bool(row['is_staff'])
-                    )
-                    u.set_password(row['password'])
-                    u.save()
-                except IntegrityError:
-                    return 'Такие Пользователи уже есть...'
-        return (f'Пользователи успешно созданы')
+        data_dir = options['data_dir'] or f'{settings.BASE_DIR}/data'
+        importer = UserImporter(
+            User,
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            stdout=self.stdout,
+        )
+        importer.run(read_rows(f'{data_dir}/users.csv'))
+        return (
+            f'Пользователи успешно созданы: {importer.created}, '
+            f'пропущено существующих: {importer.skipped}'
+        )
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Проверка (--check) или исправление счетчиков избранного и корзин'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только найти расхождения, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            fixed = Recipe.objects.reconcile_counters()
+            return f'Исправлено счетчиков рецептов: {fixed}.'
+
+        drifted = Recipe.objects.drifted_counters().order_by('id')
+        for recipe in drifted[:20]:
+            self.stdout.write(
+                f'recipe={recipe.id}: избранное {recipe.favorites_count} '
+                f'вместо {recipe.actual_favorites_count}, корзины '
+                f'{recipe.in_carts_count} '
+                f'вместо {recipe.actual_in_carts_count}'
+            )
+        count = drifted.count()
+        if count:
+            raise CommandError(
+                f'Расхождений в счетчиках рецептов: {count}. '
+                'Запустите команду без --check для исправления.'
+            )
+        return 'Счетчики рецептов совпадают с избранным и корзинами.'
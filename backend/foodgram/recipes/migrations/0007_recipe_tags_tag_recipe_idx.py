@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Index (tag_id, recipe_id) of the auto-created recipe-tag table.
+
+    The unique (recipe_id, tag_id) constraint serves lookups by recipe;
+    filtering the feed by tags starts from the tag ids and reads recipe
+    ids straight from this index.
+    """
+
+    dependencies = [
+        ('recipes', '0006_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX recipe_tags_tag_recipe_idx',
+        ),
+    ]
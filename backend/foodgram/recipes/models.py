@@ -1,10 +1,19 @@
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import (BooleanField, Case, Count, Exists, F,
+                              IntegerField, OuterRef, Prefetch, Q, Subquery,
+                              Sum, Value, When)
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
 from colorfield.fields import ColorField
 from django.core.validators import MinValueValidator
 
 User = get_user_model()
 
+SEARCH_CONFIG = 'russian'
+
 
 class Tag(models.Model):
     name = models.CharField(
@@ -88,6 +97,129 @@ class RecipeIngredient(models.Model):
         return f'{self.ingredient}'
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def for_user(self, user):
+        """Load relations and per-user flags in a fixed number of queries.
+
+        Author (annotated with is_subscribed), tags and ingredient rows are
+        prefetched once per page, is_favorited and is_in_shopping_cart are
+        annotated with EXISTS subqueries. search_vector is not loaded.
+        """
+        if user.is_authenticated:
+            is_favorited = Exists(FavoriteRecipe.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+            is_in_shopping_cart = Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+            is_subscribed = Exists(Subscribe.objects.filter(
+                user=user, author=OuterRef('pk')
+            ))
+        else:
+            is_favorited = is_in_shopping_cart = is_subscribed = Value(
+                False, output_field=BooleanField()
+            )
+        return self.defer('search_vector').annotate(
+            is_favorited=is_favorited,
+            is_in_shopping_cart=is_in_shopping_cart,
+        ).prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate(is_subscribed=is_subscribed)
+            ),
+            'tags',
+            Prefetch(
+                'recipe',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )
+
+    def search(self, text):
+        """Recipes matching the text in name, ingredients or description.
+
+        On PostgreSQL the query is matched against search_vector (GIN
+        index) and results are ordered by relevance. Other databases get
+        a case-insensitive substring match (icontains, on SQLite only for
+        ASCII letters) without ranking.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return self.filter(
+                Q(name__icontains=text)
+                | Q(text__icontains=text)
+                | Q(Exists(RecipeIngredient.objects.filter(
+                    recipe=OuterRef('pk'), ingredient__name__icontains=text
+                )))
+            )
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return self.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', '-id')
+
+    def shift_counter(self, field, delta):
+        """Atomically add delta to favorites_count or in_carts_count,
+        never going below zero."""
+        queryset = self
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        return queryset.update(**{field: F(field) + delta})
+
+    @staticmethod
+    def actual_count(model):
+        """Number of model rows (favorites or carts) of the outer recipe."""
+        return Coalesce(Subquery(
+            model.objects.filter(
+                recipe=OuterRef('pk')
+            ).order_by().values('recipe').annotate(
+                count=Count('pk')
+            ).values('count')
+        ), 0)
+
+    def drifted_counters(self):
+        """Recipes whose stored counters differ from the actual ones."""
+        return self.annotate(
+            actual_favorites_count=self.actual_count(FavoriteRecipe),
+            actual_in_carts_count=self.actual_count(ShoppingCart),
+        ).exclude(
+            favorites_count=F('actual_favorites_count'),
+            in_carts_count=F('actual_in_carts_count'),
+        )
+
+    def reconcile_counters(self):
+        """Rewrite drifted counters, return the number of fixed recipes."""
+        return Recipe.objects.filter(
+            pk__in=self.drifted_counters().order_by().values('pk')
+        ).update(
+            favorites_count=self.actual_count(FavoriteRecipe),
+            in_carts_count=self.actual_count(ShoppingCart),
+        )
+
+    def update_search_vector(self):
+        """Recompute search_vector: name (A), ingredient names (B),
+        description (C). Must run after the recipe ingredients are saved.
+
+        Recipe.save() runs it through post_save. Ingredient rows written
+        directly and update()/bulk_create() of recipes need an explicit
+        call, as the serializer, the admin and the import commands do.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        ingredient_names = RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', delimiter=' ')
+        ).values('names')
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(
+                Subquery(ingredient_names), weight='B', config=SEARCH_CONFIG
+            )
+            + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+        ))
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -105,6 +237,12 @@ class Recipe(models.Model):
         upload_to='recipes/images',
         blank=True
     )
+    image_variants = models.JSONField(
+        'Размеры картинки',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     text = models.TextField(
         'Описание'
     )
@@ -127,15 +265,91 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    # Счетчики обновляются через F() при добавлении и удалении из
+    # избранного и корзины, расхождения исправляет reconcile_recipe_counters.
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        default=0,
+        editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В корзинах',
+        default=0,
+        editable=False
+    )
+    # GIN-индекс создается миграцией 0006 только на PostgreSQL.
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx'
+            ),
+            # Рецепты автора (?author=) в порядке ленты.
+            models.Index(
+                fields=('author', '-pub_date', '-id'),
+                name='recipe_author_pub_date_idx'
+            ),
+            # Сортировка по популярности (?ordering=).
+            models.Index(
+                fields=('-favorites_count', '-pub_date', '-id'),
+                name='recipe_favorites_count_idx'
+            ),
+            models.Index(
+                fields=('-in_carts_count', '-pub_date', '-id'),
+                name='recipe_in_carts_count_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'Автор: {self.author.username}, рецепт: {self.name}'
 
+    @property
+    def card_image(self):
+        """Name of the card image variant, of the original until the
+        variant is ready. Empty for a recipe without an image."""
+        if not self.image:
+            return ''
+        return self.image_variants.get('card', self.image.name)
+
+
+class SubscribeQuerySet(models.QuerySet):
+
+    def with_recipes(self, recipes_limit=None):
+        """Annotate recipes_count and prefetch latest recipes of authors.
+
+        At most recipes_limit recipes per author are loaded into
+        author.recipes_preview with a correlated LIMIT subquery, so a page
+        costs a fixed number of queries whatever the authors publish.
+        """
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        if recipes_limit == 0:
+            recipes = recipes.none()
+        elif recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author_id=OuterRef('author_id')
+                ).order_by('-pub_date', '-id').values('pk')[:recipes_limit]
+            ))
+        return self.select_related('author').annotate(
+            recipes_count=Count('author__recipe'),
+        ).prefetch_related(
+            Prefetch(
+                'author__recipe',
+                queryset=recipes,
+                to_attr='recipes_preview'
+            )
+        )
+
 
 class Subscribe(models.Model):
     user = models.ForeignKey(
@@ -155,6 +369,8 @@ class Subscribe(models.Model):
         auto_now_add=True
     )
 
+    objects = SubscribeQuerySet.as_manager()
+
     class Meta:
         ordering = ('-id',)
         verbose_name = 'Подписка'
@@ -165,6 +381,13 @@ class Subscribe(models.Model):
                 name='unique_subscription'
             )
         ]
+        indexes = [
+            # Страница подписок пользователя, новые сверху.
+            models.Index(
+                fields=('user', '-id'),
+                name='subscribe_user_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user.username} -> {self.author.username}'
@@ -194,6 +417,13 @@ class FavoriteRecipe(models.Model):
                 name='unique_favorite_user_recipe'
             )
         ]
+        indexes = [
+            # Обратное направление: кто добавил рецепт, подсчет избранного.
+            models.Index(
+                fields=('recipe', 'user'),
+                name='favorite_recipe_user_idx'
+            ),
+        ]
     
     def __str__(self) -> str:
         return f'{self.user.username} -> {self.recipe.name}'
@@ -221,6 +451,175 @@ class ShoppingCart(models.Model):
                 name='unique_recipe_shopping_cart'
             )
         ]
+        indexes = [
+            # Пользователи, у которых рецепт в корзине (правка и удаление
+            # рецепта пересчитывают их списки покупок).
+            models.Index(
+                fields=('recipe', 'user'),
+                name='shopping_cart_recipe_user_idx'
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user.username} -> {self.recipe.name}'
+
+
+class SimilarRecipe(models.Model):
+    """Precomputed neighbour of a recipe, see recipes/similarity.py."""
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='similar_recipes',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        related_name='similar_to',
+        on_delete=models.CASCADE,
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        ordering = ('-score', 'similar')
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('recipe', 'similar'),
+                name='unique_similar_recipe'
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe_id} -> {self.similar_id}: {self.score:.3f}'
+
+
+class ShoppingListQuerySet(models.QuerySet):
+
+    def apply_deltas(self, user_ids, deltas):
+        """Add {ingredient_id: delta} to the shopping lists of users.
+
+        Costs at most three queries whatever the number of users and
+        ingredients: create missing rows, shift amounts, drop rows that
+        reached zero.
+        """
+        user_ids = list(user_ids)
+        deltas = {
+            ingredient_id: delta
+            for ingredient_id, delta in deltas.items() if delta
+        }
+        if not user_ids or not deltas:
+            return
+        with transaction.atomic(savepoint=False):
+            if any(delta > 0 for delta in deltas.values()):
+                self.bulk_create(
+                    [
+                        self.model(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=0
+                        )
+                        for user_id in user_ids
+                        for ingredient_id, delta in deltas.items()
+                        if delta > 0
+                    ],
+                    ignore_conflicts=True,
+                )
+            items = self.filter(
+                user_id__in=user_ids, ingredient_id__in=deltas
+            )
+            items.update(amount=F('amount') + Case(
+                *(
+                    When(ingredient_id=ingredient_id, then=Value(delta))
+                    for ingredient_id, delta in deltas.items()
+                ),
+                default=Value(0),
+                output_field=IntegerField(),
+            ))
+            if any(delta < 0 for delta in deltas.values()):
+                items.filter(amount__lte=0).delete()
+
+    def add_recipe(self, user_ids, recipe):
+        self.apply_deltas(user_ids, dict(
+            RecipeIngredient.objects.filter(
+                recipe=recipe
+            ).values_list('ingredient_id', 'amount')
+        ))
+
+    def remove_recipe(self, user_ids, recipe):
+        self.apply_deltas(user_ids, {
+            ingredient_id: -amount
+            for ingredient_id, amount in RecipeIngredient.objects.filter(
+                recipe=recipe
+            ).values_list('ingredient_id', 'amount')
+        })
+
+    def expected(self):
+        """Totals computed from shopping carts, the source of truth."""
+        return RecipeIngredient.objects.filter(
+            recipe__shopping_cart_recipe__isnull=False
+        ).values(
+            'ingredient_id',
+            user_id=F('recipe__shopping_cart_recipe__user'),
+        ).annotate(
+            total=Sum('amount'),
+        ).order_by().values_list('user_id', 'ingredient_id', 'total')
+
+    def rebuild(self):
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(
+                (
+                    self.model(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                    )
+                    for user_id, ingredient_id, amount in self.expected()
+                ),
+                batch_size=1000,
+            )
+
+
+class ShoppingListItem(models.Model):
+    """Ingredient totals of the user's shopping cart.
+
+    Maintained by deltas on cart and recipe changes, so downloading the
+    list is a scan of the user's rows instead of a four-table aggregate.
+    The deltas are applied by signals (recipes/signals.py), so admin and
+    ORM writes keep it in sync too; bulk writes of RecipeIngredient must
+    apply them themselves.
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        related_name='shopping_list',
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.IntegerField(
+        'Количество',
+        default=0
+    )
+
+    objects = ShoppingListQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_ingredient'
+            )
+        ]
 
     def __str__(self) -> str:
-        return f'{self.user.username} -> {self.recipe.name}'
\ No newline at end of file
+        return f'{self.user.username} -> {self.ingredient}: {self.amount}'
@@ -0,0 +1,129 @@
+"""In-memory inverted index of recipe ingredients for pantry matching.
+
+For every ingredient the index keeps the sorted positions of the recipes
+using it (one postings array and offsets per ingredient, CSR layout), and
+for every recipe the number of its ingredients. A pantry query counts
+matches per recipe with one bincount over the postings of the given
+ingredients, so its cost depends on the length of those postings, not on
+the size of the RecipeIngredient table.
+
+Recipe writes bump the RecipeIngredient version in the shared cache (see
+recipes/catalog.py). A worker that sees a new version rebuilds its index
+in a background thread and answers from the old one meanwhile, so
+results may lag writes by the build time.
+"""
+import threading
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+
+from recipes import catalog
+from recipes.models import RecipeIngredient
+from recipes.similarity import load_pairs
+
+Postings = namedtuple(
+    'Postings', 'ingredient_ids offsets positions recipe_ids sizes'
+)
+
+
+class PantryIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.building = False
+        self.postings = None
+
+    @staticmethod
+    def load():
+        pairs = load_pairs(
+            RecipeIngredient.objects, 'ingredient_id', 'recipe_id'
+        )
+        pairs = pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+        recipe_ids, positions, sizes = np.unique(
+            pairs[:, 1], return_inverse=True, return_counts=True
+        )
+        ingredient_ids, starts = np.unique(pairs[:, 0], return_index=True)
+        return Postings(
+            ingredient_ids=ingredient_ids,
+            offsets=np.append(starts, len(pairs)),
+            positions=positions.astype(np.int32),
+            recipe_ids=recipe_ids,
+            sizes=sizes,
+        )
+
+    def build(self, version):
+        self.postings = self.load()
+        self.version = version
+
+    def build_in_background(self, version):
+        try:
+            self.build(version)
+        finally:
+            self.building = False
+            connection.close()
+
+    def refresh(self):
+        version = catalog.get_version(RecipeIngredient)
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version or self.building:
+                return
+            if self.postings is None or settings.PANTRY_INDEX_SYNC:
+                self.build(version)
+                return
+            self.building = True
+        threading.Thread(
+            target=self.build_in_background,
+            args=(version,),
+            name='pantry-index',
+            daemon=True,
+        ).start()
+
+    def search(self, ingredient_ids, limit):
+        """(recipe_id, matched, missing) of the recipes that use any of the
+        ingredients: the highest share of covered ingredients first, then
+        the fewest missing ones, then the newest."""
+        self.refresh()
+        postings = self.postings
+        query = np.unique(np.asarray(ingredient_ids, dtype=np.int64))
+        found = np.searchsorted(
+            postings.ingredient_ids,
+            query[np.isin(query, postings.ingredient_ids)],
+        )
+        if not len(found):
+            return []
+        matched = np.bincount(
+            np.concatenate([
+                postings.positions[
+                    postings.offsets[position]:postings.offsets[position + 1]
+                ]
+                for position in found
+            ]),
+            minlength=len(postings.recipe_ids),
+        )
+        candidates = np.flatnonzero(matched)
+        matched = matched[candidates]
+        sizes = postings.sizes[candidates]
+        coverage = matched / sizes
+        if len(candidates) > limit:
+            # Сортируются только рецепты не хуже limit-го по покрытию.
+            threshold = np.partition(coverage, -limit)[-limit]
+            keep = coverage >= threshold
+            candidates, matched = candidates[keep], matched[keep]
+            sizes, coverage = sizes[keep], coverage[keep]
+        recipe_ids = postings.recipe_ids[candidates]
+        missing = sizes - matched
+        order = np.lexsort((-recipe_ids, missing, -coverage))[:limit]
+        return [
+            (int(recipe_id), int(count), int(lack))
+            for recipe_id, count, lack in zip(
+                recipe_ids[order], matched[order], missing[order]
+            )
+        ]
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,226 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from recipes import catalog
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart,
+                            ShoppingListItem, Tag)
+
+User = get_user_model()
+
+# Рецепты с массовой правкой ингредиентов: списки покупок по ним
+# пересчитывает вызывающий код одним запросом.
+handled_recipes = ContextVar('handled_recipes', default=frozenset())
+# Удаляемые рецепты: их корзины и ингредиенты удаляются каскадом, а списки
+# покупок уже пересчитаны в pre_delete. id -> (база, отметка в on_commit).
+deleted_recipes = ContextVar('deleted_recipes', default=None)
+
+
+@contextmanager
+def shopping_lists_handled(recipe_id):
+    """Skip per-row shopping list deltas of the recipe's carts and
+    ingredients, the caller applies them itself."""
+    token = handled_recipes.set(handled_recipes.get() | {recipe_id})
+    try:
+        yield
+    finally:
+        handled_recipes.reset(token)
+
+
+def is_handled(recipe_id):
+    """Whether per-row shopping list and counter deltas of the recipe
+    are skipped.
+
+    A deleted recipe stays marked only while the on_commit callback of its
+    delete is pending: after a commit the callback clears the mark, after
+    a rollback Django drops the callback and the mark is ignored.
+    """
+    if recipe_id in handled_recipes.get():
+        return True
+    deleted = deleted_recipes.get() or {}
+    if recipe_id not in deleted:
+        return False
+    using, forget = deleted[recipe_id]
+    if any(
+        callback[1] is forget
+        for callback in transaction.get_connection(using).run_on_commit
+    ):
+        return True
+    forget()
+    return False
+
+
+def forget_deleted_recipe(recipe_id):
+    deleted = dict(deleted_recipes.get() or {})
+    deleted.pop(recipe_id, None)
+    deleted_recipes.set(deleted)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_catalog(sender, **kwargs):
+    catalog.invalidate_on_commit(sender)
+
+
+@receiver(post_delete, sender=Recipe)
+def invalidate_recipe_ingredients(sender, **kwargs):
+    catalog.invalidate_on_commit(RecipeIngredient)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    catalog.invalidate_object_on_commit(Recipe, instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_ingredient_recipe(sender, instance, **kwargs):
+    # Строки ингредиентов можно менять и без сохранения самого рецепта.
+    catalog.invalidate_object_on_commit(Recipe, instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_tagged_recipes(sender, instance, action, reverse, pk_set,
+                              **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        recipe_ids = [instance.pk]
+    elif pk_set is not None:
+        recipe_ids = pk_set
+    else:
+        recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+    catalog.invalidate_objects_on_commit(Recipe, recipe_ids)
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields=None,
+                      **kwargs):
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    catalog.invalidate_object_on_commit(User, instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, raw=False,
+                                update_fields=None, **kwargs):
+    # Название и описание входят в поисковый вектор, так что он обновляется
+    # и при сохранении рецепта из админки или shell.
+    if raw or (
+        update_fields is not None and not {'name', 'text'} & update_fields
+    ):
+        return
+    Recipe.objects.filter(pk=instance.pk).update_search_vector()
+
+
+@receiver(post_save, sender=Ingredient)
+def update_recipe_search_vectors(sender, instance, created, **kwargs):
+    # Название ингредиента входит в поисковый вектор рецептов.
+    if not created:
+        Recipe.objects.filter(ingredients=instance).update_search_vector()
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_deleted_recipe_from_shopping_lists(sender, instance, using,
+                                              **kwargs):
+    ShoppingListItem.objects.remove_recipe(
+        ShoppingCart.objects.filter(
+            recipe=instance
+        ).values_list('user_id', flat=True),
+        instance
+    )
+    recipe_id = instance.pk
+
+    def forget():
+        forget_deleted_recipe(recipe_id)
+    # Удаление всегда идет в транзакции, так что отметка живет до ее конца.
+    transaction.on_commit(forget, using=using)
+    deleted_recipes.set(
+        {**(deleted_recipes.get() or {}), recipe_id: (using, forget)}
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def unmark_deleted_recipe(sender, instance, **kwargs):
+    forget_deleted_recipe(instance.pk)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_cart_to_shopping_list(sender, instance, created, **kwargs):
+    if created:
+        ShoppingListItem.objects.add_recipe(
+            [instance.user_id], instance.recipe_id
+        )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_cart_from_shopping_list(sender, instance, **kwargs):
+    if not is_handled(instance.recipe_id):
+        ShoppingListItem.objects.remove_recipe(
+            [instance.user_id], instance.recipe_id
+        )
+
+
+def cart_users(recipe_id):
+    return ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True)
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_recipe_ingredient(sender, instance, **kwargs):
+    instance.previous = None
+    if instance.pk is not None:
+        instance.previous = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def shift_shopping_lists_on_save(sender, instance, **kwargs):
+    deltas = {instance.ingredient_id: instance.amount}
+    if getattr(instance, 'previous', None):
+        ingredient_id, amount = instance.previous
+        deltas[ingredient_id] = deltas.get(ingredient_id, 0) - amount
+    ShoppingListItem.objects.apply_deltas(
+        cart_users(instance.recipe_id), deltas
+    )
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def shift_shopping_lists_on_delete(sender, instance, **kwargs):
+    if not is_handled(instance.recipe_id):
+        ShoppingListItem.objects.apply_deltas(
+            cart_users(instance.recipe_id),
+            {instance.ingredient_id: -instance.amount}
+        )
+
+
+COUNTERS = {
+    FavoriteRecipe: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).shift_counter(
+            COUNTERS[sender], 1
+        )
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    # Счетчики удаляемого рецепта сдвигать незачем.
+    if not is_handled(instance.recipe_id):
+        Recipe.objects.filter(pk=instance.recipe_id).shift_counter(
+            COUNTERS[sender], -1
+        )
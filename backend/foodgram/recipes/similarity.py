@@ -0,0 +1,266 @@
+"""Similar recipes by ingredient overlap.
+
+Recipes are rows of a sparse binary recipe x ingredient matrix, the
+similarity of two recipes is the Jaccard index of their ingredient sets
+boosted by the Jaccard index of their tags:
+
+    jaccard(ingredients) * (1 + SIMILAR_RECIPES_TAG_BOOST * jaccard(tags))
+
+so recipes without common ingredients are never similar.
+
+`manage.py build_similar_recipes` stores the top SIMILAR_RECIPES_COUNT
+neighbours of every recipe in SimilarRecipe. It multiplies blocks of rows
+of the matrix by its transpose and scores each block as a dense array, so
+the time grows with the square of the number of recipes while memory
+stays bounded by BLOCK_CELLS. When a recipe is written, its own neighbours
+are recomputed from the recipes sharing an ingredient with it, and it is
+inserted into the lists of the SIMILAR_RECIPES_REVERSE_LIMIT most similar
+of them. A list the recipe drops out of stays one entry short until the
+next full build.
+"""
+import logging
+from collections import defaultdict
+from itertools import chain, islice
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Q
+from scipy import sparse
+
+from recipes.images import get_executor
+from recipes.models import Recipe, RecipeIngredient, SimilarRecipe
+
+logger = logging.getLogger(__name__)
+
+# Cells of the dense block of scores computed at once (4 bytes each).
+BLOCK_CELLS = 4 * 1024 * 1024
+RecipeTag = Recipe.tags.through
+
+
+def load_pairs(queryset, *fields):
+    """Two-column int array of the values of fields."""
+    values = np.fromiter(
+        chain.from_iterable(
+            queryset.order_by().values_list(*fields).iterator()
+        ),
+        dtype=np.int64,
+    )
+    return values.reshape(-1, 2)
+
+
+def load_counts(queryset):
+    """Recipe ids (sorted) and the number of rows of each."""
+    pairs = load_pairs(
+        queryset.values('recipe_id').annotate(count=Count('pk')),
+        'recipe_id', 'count',
+    )
+    pairs = pairs[np.argsort(pairs[:, 0])]
+    return pairs[:, 0], pairs[:, 1]
+
+
+def incidence(pairs, recipe_ids):
+    """Binary CSR matrix with a row per recipe id and a column per
+    distinct value of the second column of pairs."""
+    rows = np.searchsorted(recipe_ids, pairs[:, 0])
+    values, columns = np.unique(pairs[:, 1], return_inverse=True)
+    return sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, columns)),
+        shape=(len(recipe_ids), len(values)),
+    )
+
+
+def jaccard(common, sizes_a, sizes_b):
+    union = sizes_a + sizes_b - common
+    return np.divide(
+        common, union, out=np.zeros(np.shape(union), dtype=np.float32),
+        where=union > 0,
+    )
+
+
+def score(common, sizes_a, sizes_b, common_tags, tags_a, tags_b):
+    tag_jaccard = jaccard(common_tags, tags_a, tags_b)
+    # Округление делает порядок равных оценок одинаковым при полном и
+    # инкрементальном пересчете.
+    return np.round(
+        jaccard(common, sizes_a, sizes_b)
+        * (1 + settings.SIMILAR_RECIPES_TAG_BOOST * tag_jaccard),
+        6,
+    )
+
+
+def top(ids, scores, count):
+    """The count best (id, score), by score and then by id."""
+    if len(scores) > count:
+        best = np.argpartition(-scores, count - 1)[:count]
+        ids, scores = ids[best], scores[best]
+    order = np.lexsort((ids, -scores))
+    return ids[order], scores[order]
+
+
+def neighbours(block_cells=BLOCK_CELLS):
+    """Yield (recipe_id, similar_id, score) of the top neighbours of every
+    recipe."""
+    recipe_ids = np.fromiter(
+        Recipe.objects.order_by('pk').values_list('pk', flat=True).iterator(),
+        dtype=np.int64,
+    )
+    ingredients = incidence(
+        load_pairs(RecipeIngredient.objects, 'recipe_id', 'ingredient_id'),
+        recipe_ids,
+    )
+    # Тегов немного, их матрица хранится плотной.
+    tags = incidence(
+        load_pairs(RecipeTag.objects, 'recipe_id', 'tag_id'), recipe_ids
+    ).toarray()
+    sizes = ingredients.getnnz(axis=1).astype(np.float32)
+    tag_sizes = tags.sum(axis=1)
+    count = min(settings.SIMILAR_RECIPES_COUNT, len(recipe_ids) - 1)
+    if count < 1:
+        return
+    block_size = max(1, block_cells // len(recipe_ids))
+    for start in range(0, len(recipe_ids), block_size):
+        block = slice(start, start + block_size)
+        # Общие ингредиенты и теги блока рецептов со всеми рецептами.
+        common = np.ascontiguousarray(
+            (ingredients @ ingredients[block].T.toarray()).T
+        )
+        scores = score(
+            common, sizes[block, None], sizes,
+            tags[block] @ tags.T, tag_sizes[block, None], tag_sizes,
+        )
+        rows = np.arange(len(scores))
+        scores[rows, rows + start] = 0
+        np.negative(scores, out=scores)
+        best = np.argpartition(scores, count - 1, axis=1)[:, :count]
+        best_scores = -np.take_along_axis(scores, best, axis=1)
+        for row, columns, values in zip(rows, best, best_scores):
+            order = np.lexsort((recipe_ids[columns], -values))
+            for column, value in zip(columns[order], values[order]):
+                if value > 0:
+                    yield (
+                        int(recipe_ids[start + row]),
+                        int(recipe_ids[column]),
+                        float(value),
+                    )
+
+
+def rebuild(block_cells=BLOCK_CELLS, batch_size=5000):
+    """Replace all stored neighbours, return the number of rows."""
+    total = 0
+    with transaction.atomic():
+        SimilarRecipe.objects.all().delete()
+        rows = (
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=value)
+            for recipe_id, similar_id, value in neighbours(block_cells)
+        )
+        while batch := list(islice(rows, batch_size)):
+            SimilarRecipe.objects.bulk_create(batch)
+            total += len(batch)
+    return total
+
+
+def candidates(recipe_id):
+    """Ids (sorted) of the recipes sharing an ingredient with the recipe
+    and their scores against it."""
+    own_ingredients = RecipeIngredient.objects.filter(
+        recipe_id=recipe_id
+    ).values('ingredient_id')
+    own_tags = RecipeTag.objects.filter(recipe_id=recipe_id).values('tag_id')
+    ids, common = load_counts(
+        RecipeIngredient.objects.filter(ingredient_id__in=own_ingredients)
+    )
+    related = RecipeIngredient.objects.filter(
+        ingredient_id__in=own_ingredients
+    ).values('recipe_id')
+    size_ids, sizes = load_counts(
+        RecipeIngredient.objects.filter(recipe_id__in=related)
+    )
+    common_tag_ids, common_tags = load_counts(
+        RecipeTag.objects.filter(recipe_id__in=related, tag_id__in=own_tags)
+    )
+    tag_ids, tags = load_counts(
+        RecipeTag.objects.filter(recipe_id__in=related)
+    )
+
+    def aligned(keys, values):
+        result = np.zeros(len(ids))
+        result[np.isin(ids, keys)] = values[np.isin(keys, ids)]
+        return result
+
+    common, sizes = common.astype(np.float64), aligned(size_ids, sizes)
+    common_tags, tags = (
+        aligned(common_tag_ids, common_tags), aligned(tag_ids, tags)
+    )
+    own = ids == recipe_id
+    if not own.any():
+        return ids[:0], np.zeros(0)
+    scores = score(
+        common, sizes[own], sizes, common_tags, tags[own], tags
+    )
+    return ids[~own], scores[~own]
+
+
+def update_recipe(recipe_id):
+    """Recompute neighbours of one recipe and its place in the lists of
+    the recipes most similar to it."""
+    count = settings.SIMILAR_RECIPES_COUNT
+    ids, scores = candidates(recipe_id)
+    own_ids, own_scores = top(ids, scores, count)
+    reverse_ids, reverse_scores = top(
+        ids, scores, settings.SIMILAR_RECIPES_REVERSE_LIMIT
+    )
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(
+            Q(recipe_id=recipe_id) | Q(similar_id=recipe_id)
+        ).delete()
+        lists = defaultdict(list)
+        for pk, owner_id, value in SimilarRecipe.objects.filter(
+            recipe_id__in=reverse_ids.tolist()
+        ).values_list('pk', 'recipe_id', 'score'):
+            lists[owner_id].append((value, pk))
+        new = [
+            SimilarRecipe(
+                recipe_id=recipe_id, similar_id=similar_id, score=value
+            )
+            for similar_id, value in zip(own_ids.tolist(), own_scores.tolist())
+        ]
+        stale = []
+        for owner_id, value in zip(
+            reverse_ids.tolist(), reverse_scores.tolist()
+        ):
+            current = lists[owner_id]
+            if len(current) >= count:
+                worst = min(current)
+                if value <= worst[0]:
+                    continue
+                stale.append(worst[1])
+            new.append(SimilarRecipe(
+                recipe_id=owner_id, similar_id=recipe_id, score=value
+            ))
+        SimilarRecipe.objects.filter(pk__in=stale).delete()
+        SimilarRecipe.objects.bulk_create(new, ignore_conflicts=True)
+
+
+def process_similar_recipes(recipe_id):
+    close_old_connections()
+    try:
+        if Recipe.objects.filter(pk=recipe_id).exists():
+            update_recipe(recipe_id)
+    except Exception:
+        logger.exception('Similar recipes of recipe %s failed', recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_similarity_update(recipe):
+    """Update similar recipes once the current transaction commits, in the
+    background pool of recipes.images."""
+    recipe_id = recipe.pk
+    if settings.SIMILAR_RECIPES_SYNC:
+        transaction.on_commit(lambda: process_similar_recipes(recipe_id))
+    else:
+        transaction.on_commit(
+            lambda: get_executor().submit(process_similar_recipes, recipe_id)
+        )
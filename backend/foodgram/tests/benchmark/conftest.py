@@ -0,0 +1,237 @@
+import json
+import os
+import random
+from pathlib import Path
+
+import pytest
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from rest_framework.authtoken.models import Token
+
+from recipes import similarity
+from recipes.models import (FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            Subscribe, Tag)
+
+User = get_user_model()
+
+BUDGETS_FILE = Path(__file__).with_name('budgets.json')
+
+# Dataset size, can be raised for a local run: BENCHMARK_SCALE=10.
+SCALE = float(os.getenv('BENCHMARK_SCALE', '1'))
+USERS = int(500 * SCALE)
+RECIPES = int(2000 * SCALE)
+FAVORITES = int(10000 * SCALE)
+CARTS = int(5000 * SCALE)
+SUBSCRIPTIONS = int(5000 * SCALE)
+BATCH_SIZE = 1000
+
+results = {}
+
+
+def sample_pairs(rng, left, right, count, exclude_same=False):
+    pairs = set()
+    while len(pairs) < count:
+        pair = (rng.choice(left), rng.choice(right))
+        if not exclude_same or pair[0] != pair[1]:
+            pairs.add(pair)
+    return pairs
+
+
+def seed(rng):
+    password = make_password('123')
+    User.objects.bulk_create(
+        (
+            User(
+                username=f'user{i}',
+                email=f'user{i}@foodgram.ru',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password,
+            )
+            for i in range(USERS)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = list(User.objects.values_list('id', flat=True))
+
+    Tag.objects.bulk_create([
+        Tag(name='Завтрак', color='#18FF3BFF', slug='breakfast'),
+        Tag(name='Обед', color='#85E0FFFF', slug='lunch'),
+        Tag(name='Ужин', color='#8775D2FF', slug='dinner'),
+    ])
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+
+    with open(
+        f'{settings.BASE_DIR}/data/ingredients.json', encoding='utf-8'
+    ) as json_file:
+        Ingredient.objects.bulk_create(
+            (Ingredient(**data) for data in json.load(json_file)),
+            batch_size=BATCH_SIZE,
+        )
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                author_id=rng.choice(user_ids),
+                name=f'Рецепт {i}',
+                text='Описание рецепта ' * 20,
+                cooking_time=rng.randint(5, 120),
+            )
+            for i in range(RECIPES)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+
+    RecipeTag = Recipe.tags.through
+    RecipeTag.objects.bulk_create(
+        (
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rng.sample(tag_ids, rng.randint(1, 2))
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    RecipeIngredient.objects.bulk_create(
+        (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in rng.sample(ingredient_ids, rng.randint(3, 12))
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    FavoriteRecipe.objects.bulk_create(
+        (
+            FavoriteRecipe(user_id=user_id, recipe_id=recipe_id)
+            for user_id, recipe_id in sample_pairs(
+                rng, user_ids, recipe_ids, FAVORITES)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    ShoppingCart.objects.bulk_create(
+        (
+            ShoppingCart(user_id=user_id, recipe_id=recipe_id)
+            for user_id, recipe_id in sample_pairs(
+                rng, user_ids, recipe_ids, CARTS)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+    Subscribe.objects.bulk_create(
+        (
+            Subscribe(user_id=user_id, author_id=author_id)
+            for user_id, author_id in sample_pairs(
+                rng, user_ids, user_ids, SUBSCRIPTIONS, exclude_same=True)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    # The viewer is a regular user with a full cart, favorites and
+    # subscriptions, like the heaviest real account would have.
+    viewer = User.objects.create_user(
+        username='viewer',
+        email='viewer@foodgram.ru',
+        first_name='Имя',
+        last_name='Фамилия',
+        password='123',
+    )
+    viewer_recipes = rng.sample(recipe_ids, 40)
+    FavoriteRecipe.objects.bulk_create(
+        FavoriteRecipe(user=viewer, recipe_id=recipe_id)
+        for recipe_id in viewer_recipes[:20]
+    )
+    ShoppingCart.objects.bulk_create(
+        ShoppingCart(user=viewer, recipe_id=recipe_id)
+        for recipe_id in viewer_recipes[10:30]
+    )
+    viewer_authors = rng.sample(user_ids, 20)
+    Subscribe.objects.bulk_create(
+        Subscribe(user=viewer, author_id=author_id)
+        for author_id in viewer_authors
+    )
+    own_recipe = Recipe.objects.create(
+        author=viewer,
+        name='Рецепт зрителя',
+        text='Описание рецепта',
+        cooking_time=15,
+    )
+    own_recipe.tags.set(tag_ids[:1])
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(
+            recipe=own_recipe, ingredient_id=ingredient_id, amount=100
+        )
+        for ingredient_id in rng.sample(ingredient_ids, 10)
+    )
+    ShoppingListItem.objects.rebuild()
+    Recipe.objects.update_search_vector()
+    similarity.rebuild()
+    return {
+        'viewer': viewer,
+        'token': Token.objects.create(user=viewer).key,
+        'recipe_id': viewer_recipes[0],
+        'own_recipe_id': own_recipe.id,
+        'free_recipe_id': viewer_recipes[-1],
+        'favorite_recipe_id': viewer_recipes[0],
+        'cart_recipe_id': viewer_recipes[10],
+        'author_id': viewer_authors[0],
+        'free_author_id': next(
+            user_id for user_id in user_ids if user_id not in viewer_authors
+        ),
+        'tag_ids': tag_ids,
+        'ingredient_ids': rng.sample(ingredient_ids, 5),
+    }
+
+
+@pytest.fixture(scope='module')
+def dataset(django_db_setup, django_db_blocker):
+    """Seed the benchmark dataset once and drop it after the module."""
+    with django_db_blocker.unblock():
+        data = seed(random.Random(42))
+        yield data
+        User.objects.all().delete()
+        Tag.objects.all().delete()
+        Ingredient.objects.all().delete()
+
+
+@pytest.fixture(scope='session')
+def budgets():
+    with open(BUDGETS_FILE, encoding='utf-8') as budgets_file:
+        return json.load(budgets_file)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not results:
+        return
+    if os.getenv('BENCHMARK_UPDATE_BUDGETS'):
+        with open(BUDGETS_FILE, encoding='utf-8') as budgets_file:
+            stored = json.load(budgets_file)
+        for name, measured in results.items():
+            stored.setdefault(name, {'time_ms': 1000})
+            stored[name]['queries'] = measured['queries']
+        with open(BUDGETS_FILE, 'w', encoding='utf-8') as budgets_file:
+            json.dump(stored, budgets_file, indent=4, sort_keys=True)
+            budgets_file.write('\n')
+    report = os.getenv('BENCHMARK_REPORT')
+    if report:
+        with open(report, 'w', encoding='utf-8') as report_file:
+            json.dump(results, report_file, indent=4, sort_keys=True)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not results:
+        return
+    terminalreporter.section('endpoint budgets')
+    terminalreporter.write_line(
+        f'{"endpoint":<32}{"queries":>8}{"db, ms":>10}{"total, ms":>11}'
+    )
+    for name, measured in sorted(results.items()):
+        terminalreporter.write_line(
+            f'{name:<32}{measured["queries"]:>8}'
+            f'{measured["db_ms"]:>10.1f}{measured["total_ms"]:>11.1f}'
+        )
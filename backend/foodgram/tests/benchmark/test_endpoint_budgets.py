@@ -0,0 +1,170 @@
+"""Query count and latency budgets for every API endpoint.
+
+Each endpoint is called against a seeded dataset, the number of SQL
+queries, DB time and wall-clock time are recorded and compared with
+budgets.json. Run with BENCHMARK_UPDATE_BUDGETS=1 to store the measured
+query counts as new budgets, BENCHMARK_REPORT=<path> to save the results.
+"""
+import os
+import statistics
+import time
+
+import pytest
+from django.db import connection
+from rest_framework.test import APIClient
+
+from api.middleware import RequestMetrics
+from .conftest import results
+
+ROUNDS = int(os.getenv('BENCHMARK_ROUNDS', '3'))
+TIME_FACTOR = float(os.getenv('BENCHMARK_TIME_FACTOR', '1'))
+
+
+def recipe_payload(data):
+    return {
+        'name': 'Новый рецепт',
+        'text': 'Описание нового рецепта',
+        'cooking_time': 20,
+        'tags': data['tag_ids'][:2],
+        'ingredients': [
+            {'id': ingredient_id, 'amount': 10}
+            for ingredient_id in data['ingredient_ids']
+        ],
+    }
+
+
+# name, method, url, payload, expected status, anonymous.
+ENDPOINTS = (
+    ('auth-token-login', 'post', '/api/auth/token/login/',
+     lambda data: {'email': 'viewer@foodgram.ru', 'password': '123'},
+     200, True),
+    ('users-create', 'post', '/api/users/',
+     lambda data: {
+         'email': 'newcomer@foodgram.ru',
+         'username': 'newcomer',
+         'first_name': 'Имя',
+         'last_name': 'Фамилия',
+         'password': 'Secret-password-1',
+     },
+     201, True),
+    ('users-list', 'get', '/api/users/', None, 200, False),
+    ('users-detail', 'get', '/api/users/{author_id}/', None, 200, False),
+    ('users-me', 'get', '/api/users/me/', None, 200, False),
+    ('users-subscriptions', 'get', '/api/users/subscriptions/',
+     None, 200, False),
+    ('users-subscriptions-limited', 'get',
+     '/api/users/subscriptions/?recipes_limit=3', None, 200, False),
+    ('users-subscribe', 'post',
+     '/api/users/{free_author_id}/subscribe/?recipes_limit=3',
+     None, 201, False),
+    ('users-unsubscribe', 'delete', '/api/users/{author_id}/subscribe/',
+     None, 204, False),
+    ('tags-list', 'get', '/api/tags/', None, 200, False),
+    ('tags-detail', 'get', '/api/tags/{tag_ids[0]}/', None, 200, False),
+    ('ingredients-list', 'get', '/api/ingredients/', None, 200, False),
+    ('ingredients-search', 'get', '/api/ingredients/?name=мо',
+     None, 200, False),
+    ('ingredients-detail', 'get', '/api/ingredients/{ingredient_ids[0]}/',
+     None, 200, False),
+    ('recipes-list-anonymous', 'get', '/api/recipes/', None, 200, True),
+    ('recipes-list', 'get', '/api/recipes/', None, 200, False),
+    ('recipes-list-cursor', 'get', '/api/recipes/?cursor=',
+     None, 200, False),
+    ('recipes-list-ordering', 'get', '/api/recipes/?ordering=-favorites_count',
+     None, 200, False),
+    ('recipes-list-ordering-cursor', 'get',
+     '/api/recipes/?cursor=&ordering=-in_carts_count', None, 200, False),
+    ('recipes-list-search', 'get', '/api/recipes/?search=Рецепт 1',
+     None, 200, False),
+    ('recipes-list-tags', 'get', '/api/recipes/?tags=breakfast&tags=lunch',
+     None, 200, False),
+    ('recipes-list-author', 'get', '/api/recipes/?author={author_id}',
+     None, 200, False),
+    ('recipes-list-favorited', 'get', '/api/recipes/?is_favorited=1',
+     None, 200, False),
+    ('recipes-list-in-cart', 'get', '/api/recipes/?is_in_shopping_cart=1',
+     None, 200, False),
+    ('recipes-detail', 'get', '/api/recipes/{recipe_id}/', None, 200, False),
+    ('recipes-similar', 'get', '/api/recipes/{recipe_id}/similar/',
+     None, 200, False),
+    ('recipes-pantry', 'get',
+     '/api/recipes/pantry/?ingredients={ingredient_ids[0]}'
+     '&ingredients={ingredient_ids[1]}&ingredients={ingredient_ids[2]}',
+     None, 200, False),
+    ('recipes-create', 'post', '/api/recipes/', recipe_payload, 201, False),
+    ('recipes-update', 'patch', '/api/recipes/{own_recipe_id}/',
+     recipe_payload, 200, False),
+    ('recipes-delete', 'delete', '/api/recipes/{own_recipe_id}/',
+     None, 204, False),
+    ('favorite-add', 'post', '/api/recipes/{free_recipe_id}/favorite/',
+     None, 201, False),
+    ('favorite-remove', 'delete',
+     '/api/recipes/{favorite_recipe_id}/favorite/', None, 204, False),
+    ('shopping-cart-add', 'post',
+     '/api/recipes/{free_recipe_id}/shopping_cart/', None, 201, False),
+    ('shopping-cart-remove', 'delete',
+     '/api/recipes/{cart_recipe_id}/shopping_cart/', None, 204, False),
+    ('download-shopping-cart', 'get', '/api/recipes/download_shopping_cart/',
+     None, 200, False),
+    # Смена пароля и выход меняют учетные данные зрителя, поэтому идут
+    # последними.
+    ('users-set-password', 'post', '/api/users/set_password/',
+     lambda data: {
+         'current_password': '123', 'new_password': 'Secret-password-2',
+     },
+     204, False),
+    ('auth-token-logout', 'post', '/api/auth/token/logout/',
+     None, 204, False),
+)
+
+
+def call(client, method, url, payload):
+    """Make one request, return the response, queries and timings."""
+    # Время запросов в connection.queries округлено до миллисекунд, поэтому
+    # оно измеряется так же, как в RequestMetricsMiddleware.
+    metrics = RequestMetrics()
+    with connection.execute_wrapper(metrics.execute_wrapper):
+        start = time.perf_counter()
+        response = getattr(client, method)(url, payload, format='json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        total = time.perf_counter() - start
+    return (
+        response, metrics.queries, metrics.db_time * 1000, total * 1000
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    'name, method, url, payload, status, anonymous',
+    ENDPOINTS,
+    ids=[endpoint[0] for endpoint in ENDPOINTS],
+)
+def test_endpoint_budget(dataset, budgets, name, method, url, payload,
+                         status, anonymous):
+    client = APIClient()
+    if not anonymous:
+        client.credentials(HTTP_AUTHORIZATION=f'Token {dataset["token"]}')
+    url = url.format(**dataset)
+    payload = payload(dataset) if payload else None
+    # Writes change the data, so they are measured once.
+    rounds = ROUNDS if method == 'get' else 1
+
+    measured = [call(client, method, url, payload) for _ in range(rounds)]
+    response = measured[0][0]
+    assert response.status_code == status, response.content[:500]
+    queries = max(queries for _, queries, _, _ in measured)
+    db_ms = statistics.median(db_ms for _, _, db_ms, _ in measured)
+    total_ms = statistics.median(total_ms for _, _, _, total_ms in measured)
+    results[name] = {
+        'queries': queries, 'db_ms': db_ms, 'total_ms': total_ms,
+    }
+
+    budget = budgets.get(name)
+    assert budget is not None, f'Для {name} не задан бюджет в budgets.json'
+    assert queries <= budget['queries'], (
+        f'{name}: {queries} SQL-запросов, бюджет {budget["queries"]}'
+    )
+    assert total_ms <= budget['time_ms'] * TIME_FACTOR, (
+        f'{name}: {total_ms:.1f} мс, бюджет {budget["time_ms"]} мс'
+    )
@@ -0,0 +1,92 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from api.authentication import local_tokens
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    local_tokens.clear()
+    yield
+    cache.clear()
+    local_tokens.clear()
+
+
+@pytest.fixture
+def user():
+    return User.objects.create_user(
+        username='john',
+        email='john@gmail.com',
+        first_name='John',
+        last_name='Doe',
+        password='123',
+    )
+
+
+@pytest.fixture
+def author():
+    return User.objects.create_user(
+        username='chef',
+        email='chef@gmail.com',
+        first_name='Gordon',
+        last_name='Ramsay',
+        password='123',
+    )
+
+
+@pytest.fixture
+def client():
+    return APIClient()
+
+
+@pytest.fixture
+def user_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def tags():
+    return [
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast'),
+        Tag.objects.create(name='Обед', color='#49B64E', slug='lunch'),
+        Tag.objects.create(name='Ужин', color='#8775D2', slug='dinner'),
+    ]
+
+
+@pytest.fixture
+def ingredients():
+    return [
+        Ingredient.objects.create(name=f'ингредиент {i}', measurement_unit='г')
+        for i in range(5)
+    ]
+
+
+@pytest.fixture
+def make_recipes(author, tags, ingredients):
+    def make_recipes(count):
+        recipes = []
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                author=author,
+                name=f'Рецепт {Recipe.objects.count()}',
+                text='Описание',
+                cooking_time=10,
+            )
+            recipe.tags.set(tags[:2])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=i + 1
+                )
+                for ingredient in ingredients[:3]
+            )
+            recipes.append(recipe)
+        return recipes
+    return make_recipes
@@ -0,0 +1,89 @@
+import gzip
+import json
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Tag
+
+
+def get(client, url, **headers):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url, **headers)
+    return response, len(context)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', ['/api/tags/', '/api/ingredients/'])
+def test_catalog_served_from_cache(client, tags, ingredients, url):
+    response, _ = get(client, url)
+    assert response.status_code == 200
+    assert response['ETag']
+    assert response['Last-Modified']
+
+    cached, queries = get(client, url)
+    assert queries == 0
+    assert cached.content == response.content
+
+
+@pytest.mark.django_db
+def test_catalog_conditional_get(client, tags):
+    response, _ = get(client, '/api/tags/')
+    not_modified, queries = get(
+        client, '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.content == b''
+    assert queries == 0
+
+    not_modified, _ = get(
+        client, '/api/tags/', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+    )
+    assert not_modified.status_code == 304
+
+
+@pytest.mark.django_db
+def test_catalog_gzip(client, tags):
+    response, _ = get(client, '/api/tags/', HTTP_ACCEPT_ENCODING='gzip')
+    assert response['Content-Encoding'] == 'gzip'
+    data = json.loads(gzip.decompress(response.content))
+    assert [tag['slug'] for tag in data] == ['breakfast', 'lunch', 'dinner']
+
+
+@pytest.mark.django_db
+def test_catalog_invalidated_on_change(client, tags):
+    response, _ = get(client, '/api/tags/')
+    with TestCase.captureOnCommitCallbacks(execute=True) as callbacks:
+        Tag.objects.filter(slug='lunch').delete()
+        Tag.objects.get(slug='dinner').delete()
+        # Версия меняется только после коммита, до него каталог прежний.
+        unchanged, _ = get(
+            client, '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        assert unchanged.status_code == 304
+    assert callbacks
+    changed, _ = get(
+        client, '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+    )
+    assert changed.status_code == 200
+    assert [tag['slug'] for tag in changed.json()] == ['breakfast']
+
+
+@pytest.mark.django_db
+def test_catalog_invalidated_by_import(client, settings, tmp_path):
+    data = tmp_path / 'data'
+    data.mkdir()
+    (data / 'ingredients.csv').write_text(
+        'name,measurement_unit\nсоль,г\n', encoding='utf-8'
+    )
+    (data / 'tags.csv').write_text(
+        'name,color,slug\nЗавтрак,#18FF3BFF,breakfast\n', encoding='utf-8'
+    )
+    settings.BASE_DIR = tmp_path
+    assert get(client, '/api/ingredients/')[0].json() == []
+    call_command('import_tags_ingredients')
+    assert len(get(client, '/api/ingredients/')[0].json()) == 1
+    assert len(get(client, '/api/tags/')[0].json()) == 1
@@ -0,0 +1,90 @@
+import json
+import logging
+import time
+
+import pytest
+from django.core.signals import request_finished, request_started
+from django.db import connection
+
+from foodgram.db_connections import stats
+
+
+@pytest.fixture(autouse=True)
+def reset_stats(monkeypatch):
+    connection.ensure_connection()
+    # CONN_MAX_AGE = 0 в тестовых настройках.
+    monkeypatch.setattr(connection, 'close_at', None)
+    stats.reset()
+    yield
+    connection.health_check_pending = False
+
+
+def start_request():
+    request_started.send(sender=None)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    request_finished.send(sender=None)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_reused_connection_is_health_checked(monkeypatch):
+    checks = []
+    monkeypatch.setattr(
+        connection, 'is_usable', lambda: checks.append(1) or True
+    )
+
+    start_request()
+    start_request()
+
+    assert len(checks) == 2
+    assert stats.snapshot()['reused'] == 2
+    assert stats.snapshot()['broken'] == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_broken_connection_is_closed(monkeypatch):
+    monkeypatch.setattr(connection, 'is_usable', lambda: False)
+    closed = []
+    monkeypatch.setattr(connection, 'close', lambda: closed.append(1))
+
+    start_request()
+
+    assert closed
+    assert stats.snapshot()['broken'] == 1
+    assert stats.snapshot()['reused'] == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_old_connection_is_recycled(monkeypatch):
+    monkeypatch.setattr(connection, 'close_at', time.monotonic() - 1)
+
+    request_started.send(sender=None)
+
+    assert stats.snapshot()['recycled'] == 1
+    assert not getattr(connection, 'health_check_pending', False)
+
+
+@pytest.mark.django_db
+def test_connection_in_transaction_is_left_alone(monkeypatch):
+    monkeypatch.setattr(connection, 'close_at', time.monotonic() - 1)
+
+    start_request()
+
+    assert stats.snapshot() == {
+        'opened': 0, 'reused': 0, 'broken': 0, 'recycled': 0, 'wait_ms': 0.0
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+def test_request_log_has_connection_metrics(client, caplog):
+    with caplog.at_level(logging.INFO, logger='foodgram.requests'):
+        response = client.get('/api/tags/')
+
+    assert 'db-connect;dur=' in response['Server-Timing']
+    [record] = [
+        record for record in caplog.records
+        if record.name == 'foodgram.requests'
+    ]
+    logged = json.loads(record.getMessage())
+    assert logged['db_connections']['reused'] == 1
+    assert logged['db_connect_ms'] >= 0
@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+
+from recipes.models import (FavoriteRecipe, Recipe, ShoppingCart,
+                            ShoppingListItem, Subscribe)
+
+
+def generate(**options):
+    call_command(
+        'generate_dataset', users=20, recipes=50, seed=7, workers=1,
+        batch_size=16, **options
+    )
+
+
+def snapshot():
+    return (
+        sorted(Recipe.objects.values_list(
+            'id', 'name', 'author__username', 'cooking_time'
+        )),
+        sorted(Recipe.tags.through.objects.values_list('recipe', 'tag')),
+        sorted(FavoriteRecipe.objects.values_list('user__username', 'recipe')),
+        sorted(ShoppingCart.objects.values_list('user__username', 'recipe')),
+        sorted(Subscribe.objects.values_list(
+            'user__username', 'author__username'
+        )),
+    )
+
+
+@pytest.mark.django_db
+def test_generate_dataset_is_reproducible(tags, ingredients,
+                                          django_user_model):
+    generate()
+    first = snapshot()
+    assert len(first[0]) == 50
+    assert all(first[1:])
+
+    django_user_model.objects.filter(username__startswith='load').delete()
+    generate()
+
+    assert snapshot() == first
+
+
+@pytest.mark.django_db
+def test_generate_dataset_spreads_pub_dates(tags, ingredients):
+    start = timezone.now()
+    generate(days=10)
+
+    pub_dates = list(Recipe.objects.values_list('pub_date', flat=True))
+    assert len(set(pub_dates)) == 50
+    assert min(pub_dates) >= start - timedelta(days=10)
+    assert max(pub_dates) <= timezone.now()
+    assert max(pub_dates) - min(pub_dates) > timedelta(days=5)
+
+
+@pytest.mark.django_db
+def test_generate_dataset_fills_shopping_lists(tags, ingredients):
+    generate(carts=3)
+
+    assert ShoppingListItem.objects.exists()
+    call_command('rebuild_shopping_lists', check=True)
+
+
+@pytest.mark.django_db
+def test_generate_dataset_requires_catalog():
+    with pytest.raises(CommandError):
+        generate()
@@ -0,0 +1,206 @@
+import json
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from recipes.importing import BulkImporter, UserImporter, read_json
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+
+def write_catalog(path, color='#E26C2D'):
+    (path / 'tags.csv').write_text(
+        'name,color,slug\n'
+        f'Завтрак,{color},breakfast\n'
+        'Обед,#49B64E,lunch\n',
+        encoding='utf-8',
+    )
+    (path / 'ingredients.csv').write_text(
+        'name,measurement_unit\n'
+        'соль,г\n'
+        'сахар,г\n'
+        'соль,г\n',
+        encoding='utf-8',
+    )
+
+
+def import_catalog(path, **options):
+    call_command(
+        'import_tags_ingredients', data_dir=str(path), batch_size=1, **options
+    )
+
+
+@pytest.mark.django_db
+def test_import_is_idempotent(tmp_path):
+    write_catalog(tmp_path)
+    import_catalog(tmp_path)
+    import_catalog(tmp_path)
+
+    assert Tag.objects.count() == 2
+    assert Ingredient.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_import_upsert_updates_existing_rows(tmp_path):
+    write_catalog(tmp_path)
+    import_catalog(tmp_path)
+    write_catalog(tmp_path, color='#000000')
+    import_catalog(tmp_path, conflicts='upsert')
+
+    assert Tag.objects.get(slug='breakfast').color == '#000000'
+    assert Tag.objects.count() == 2
+    assert Ingredient.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_import_error_mode_rejects_duplicates(tmp_path):
+    write_catalog(tmp_path)
+    import_catalog(tmp_path)
+
+    with pytest.raises(CommandError):
+        import_catalog(tmp_path, conflicts='error')
+
+
+@pytest.mark.django_db
+def test_import_recipes_with_ids(tmp_path, author, tags, ingredients):
+    (tmp_path / 'recipes.csv').write_text(
+        'id,name,image,text,cooking_time,pub_date,author_id\n'
+        f'10,Кекс,recipes/images/sample.jpg,Описание,30,,{author.id}\n',
+        encoding='utf-8',
+    )
+    (tmp_path / 'recipe_tags.csv').write_text(
+        f'recipe_id,tag_id\n10,{tags[0].id}\n', encoding='utf-8'
+    )
+    (tmp_path / 'recipe_ingredients.csv').write_text(
+        f'recipe_id,ingredient_id,amount\n10,{ingredients[0].id},5\n',
+        encoding='utf-8',
+    )
+    for _ in range(2):
+        call_command('import_recipes', data_dir=str(tmp_path))
+
+    recipe = Recipe.objects.get(pk=10)
+    assert list(recipe.tags.all()) == [tags[0]]
+    assert RecipeIngredient.objects.get(recipe=recipe).amount == 5
+    # После импорта с явными id новые рецепты не конфликтуют с ними.
+    assert Recipe.objects.create(
+        author=author, name='Новый', text='Описание', cooking_time=1
+    ).pk > 10
+
+
+def write_recipes(path, author, tags, ingredients, name='Кекс', amount=5):
+    (path / 'recipes.csv').write_text(
+        'id,name,image,text,cooking_time,pub_date,author_id\n'
+        f'10,{name},recipes/images/sample.jpg,Описание,30,,{author.id}\n',
+        encoding='utf-8',
+    )
+    (path / 'recipe_tags.csv').write_text(
+        f'recipe_id,tag_id\n10,{tags[0].id}\n', encoding='utf-8'
+    )
+    (path / 'recipe_ingredients.csv').write_text(
+        f'recipe_id,ingredient_id,amount\n10,{ingredients[0].id},{amount}\n',
+        encoding='utf-8',
+    )
+
+
+@pytest.mark.django_db
+def test_import_recipes_upsert(tmp_path, author, tags, ingredients):
+    write_recipes(tmp_path, author, tags, ingredients)
+    call_command('import_recipes', data_dir=str(tmp_path))
+    Recipe.objects.filter(pk=10).update(
+        favorites_count=3, image_variants={'card': 'card.jpg'}
+    )
+    pub_date = Recipe.objects.get(pk=10).pub_date
+    write_recipes(tmp_path, author, tags, ingredients, name='Пирог', amount=7)
+
+    call_command('import_recipes', data_dir=str(tmp_path), conflicts='upsert')
+
+    recipe = Recipe.objects.get(pk=10)
+    assert recipe.name == 'Пирог'
+    # Даты и поля, которые ведет приложение, не перезаписываются.
+    assert recipe.pub_date == pub_date
+    assert recipe.favorites_count == 3
+    assert recipe.image_variants == {'card': 'card.jpg'}
+    assert list(recipe.tags.all()) == [tags[0]]
+    assert RecipeIngredient.objects.get(recipe=recipe).amount == 7
+
+
+@pytest.mark.django_db
+def test_import_recipes_upsert_refreshes_detail(client, tmp_path, author,
+                                                tags, ingredients):
+    write_recipes(tmp_path, author, tags, ingredients)
+    call_command('import_recipes', data_dir=str(tmp_path))
+    assert client.get('/api/recipes/10/').json()['name'] == 'Кекс'
+    write_recipes(tmp_path, author, tags, ingredients, name='Пирог', amount=7)
+
+    call_command('import_recipes', data_dir=str(tmp_path), conflicts='upsert')
+
+    data = client.get('/api/recipes/10/').json()
+    assert data['name'] == 'Пирог'
+    assert data['ingredients'][0]['amount'] == 7
+
+
+@pytest.mark.parametrize('lines', [False, True])
+def test_read_json_streams_objects(tmp_path, monkeypatch, lines):
+    rows = [{'name': f'ингредиент {i}', 'measurement_unit': 'г'}
+            for i in range(50)]
+    path = tmp_path / 'ingredients.json'
+    if lines:
+        path.write_text('\n'.join(json.dumps(row) for row in rows) + '\n')
+    else:
+        path.write_text(json.dumps(rows, ensure_ascii=False, indent=2))
+    monkeypatch.setattr('recipes.importing.READ_SIZE', 64)
+
+    assert list(read_json(path)) == rows
+
+
+@pytest.mark.django_db
+def test_import_json_file(settings):
+    path = settings.BASE_DIR / 'data' / 'ingredients.json'
+    with path.open(encoding='utf-8') as json_file:
+        expected = len(json.load(json_file))
+
+    assert BulkImporter(
+        Ingredient, ('name', 'measurement_unit')
+    ).run(read_json(path)) == expected
+    assert Ingredient.objects.count() == expected
+
+
+def write_users(path, *names):
+    (path / 'users.csv').write_text(
+        'username,first_name,last_name,email,password,is_superuser,is_staff\n'
+        + ''.join(
+            f'{name},{name},{name},{name}@gmail.com,123,,\n' for name in names
+        ),
+        encoding='utf-8',
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('workers', [1, 2])
+def test_import_users_skips_duplicates(tmp_path, user, workers):
+    write_users(tmp_path, 'anna', user.username, 'boris', 'anna')
+
+    message = call_command(
+        'import_users', data_dir=str(tmp_path), workers=workers, batch_size=2
+    )
+
+    assert message.endswith('2, пропущено существующих: 2')
+    anna = User.objects.get(username='anna')
+    assert anna.check_password('123')
+    assert not anna.is_staff
+    assert User.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_import_users_counts_inserted_rows(user):
+    # Пользователь появился между проверкой и вставкой пачки.
+    importer = UserImporter(User, workers=1)
+    importer.create_batch([
+        {'username': user.username, 'email': user.email, 'password': '1'},
+        {'username': 'anna', 'email': 'anna@mail.ru', 'password': '1'},
+    ], None)
+
+    assert (importer.created, importer.skipped) == (1, 1)
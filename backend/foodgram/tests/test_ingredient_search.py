@@ -0,0 +1,66 @@
+import pytest
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Ingredient
+
+URL = '/api/ingredients/'
+
+
+@pytest.fixture
+def catalog():
+    return Ingredient.objects.bulk_create(
+        Ingredient(name=name, measurement_unit='г')
+        for name in (
+            'сахар', 'сахарная пудра', 'ванильный сахар', 'масло сливочное',
+            'тростниковый сахар', 'сахароза', 'рис', 'пересахаренный мед',
+        )
+    )
+
+
+def names(client, query, **params):
+    response = client.get(URL, {'name': query, **params})
+    assert response.status_code == 200
+    return [item['name'] for item in response.json()]
+
+
+@pytest.mark.django_db
+def test_search_ranking(client, catalog):
+    assert names(client, 'Сахар') == [
+        'сахар', 'сахарная пудра', 'сахароза',
+        'ванильный сахар', 'тростниковый сахар',
+        'пересахаренный мед',
+    ]
+    assert names(client, 'сливоч') == ['масло сливочное']
+    assert names(client, 'нет такого') == []
+
+
+@pytest.mark.django_db
+def test_search_limit(client, catalog, settings):
+    settings.INGREDIENT_SEARCH_LIMIT = 2
+    assert names(client, 'сахар') == ['сахар', 'сахарная пудра']
+
+
+@pytest.mark.django_db
+def test_search_served_from_memory(client, catalog):
+    names(client, 'сахар')
+    with CaptureQueriesContext(connection) as context:
+        names(client, 'рис')
+    assert len(context) == 0
+
+
+@pytest.mark.django_db
+def test_search_refreshes_on_change(client, catalog):
+    assert names(client, 'рис') == ['рис']
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        Ingredient.objects.create(name='рисовая мука', measurement_unit='г')
+    assert names(client, 'рис') == ['рис', 'рисовая мука']
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        Ingredient.objects.get(name='рис').delete()
+    assert names(client, 'рис') == ['рисовая мука']
+
+
+@pytest.mark.django_db
+def test_list_without_name(client, catalog):
+    assert len(client.get(URL).json()) == len(catalog)
@@ -0,0 +1,23 @@
+import loadtest
+
+
+def test_percentile():
+    values = [i / 1000 for i in range(1, 101)]
+
+    assert loadtest.percentile(values, 50) == 0.05
+    assert loadtest.percentile(values, 99) == 0.099
+    assert loadtest.percentile([], 95) == 0.0
+
+
+def test_loadtest_replays_flows(live_server, user, make_recipes):
+    make_recipes(10)
+
+    # live_server на SQLite делит одно соединение между потоками,
+    # поэтому здесь один виртуальный пользователь.
+    summary = loadtest.run(
+        live_server.url, [(user.email, '123')], concurrency=1, duration=1
+    ).summary()
+
+    for name in ('auth-token-login', 'recipes-list', 'recipes-detail'):
+        assert summary[name]['requests']
+    assert not any(row['errors'] for row in summary.values()), summary
@@ -0,0 +1,96 @@
+import pytest
+from django.test import TestCase
+
+from recipes.models import Recipe, RecipeIngredient
+
+URL = '/api/recipes/pantry/'
+
+
+@pytest.fixture
+def make_recipe(author, tags, ingredients):
+    def make_recipe(ingredient_numbers):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {Recipe.objects.count()}',
+            text='Описание', cooking_time=10,
+        )
+        recipe.tags.set(tags[:1])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient=ingredients[number], amount=1
+            )
+            for number in ingredient_numbers
+        )
+        return recipe
+    return make_recipe
+
+
+def pantry(client, ingredients, **params):
+    response = client.get(
+        URL, {'ingredients': [ingredient.id for ingredient in ingredients],
+              **params}
+    )
+    assert response.status_code == 200, response.json()
+    return [
+        (item['id'], item['coverage'], item['missing_count'])
+        for item in response.json()
+    ]
+
+
+@pytest.mark.django_db
+def test_ranked_by_coverage_then_missing(client, ingredients, make_recipe):
+    two = make_recipe([0, 1])
+    four = make_recipe([0, 1, 2, 3])
+    one = make_recipe([2])
+    make_recipe([3, 4])
+
+    assert pantry(client, ingredients[:3]) == [
+        (one.id, 1.0, 0), (two.id, 1.0, 0), (four.id, 0.75, 1),
+    ]
+    assert pantry(client, ingredients[:3], limit=1) == [(one.id, 1.0, 0)]
+
+
+@pytest.mark.django_db
+def test_index_follows_recipe_writes(user_client, tags, ingredients,
+                                     make_recipe):
+    old = make_recipe([0, 1, 2])
+    assert pantry(user_client, ingredients[:2]) == [(old.id, 0.667, 1)]
+    data = {
+        'name': 'Новый рецепт',
+        'text': 'Описание',
+        'cooking_time': 5,
+        'tags': [tags[0].id],
+        'ingredients': [
+            {'id': ingredient.id, 'amount': 1}
+            for ingredient in ingredients[:2]
+        ],
+    }
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        response = user_client.post('/api/recipes/', data, format='json')
+    assert response.status_code == 201, response.json()
+
+    assert pantry(user_client, ingredients[:2]) == [
+        (response.json()['id'], 1.0, 0), (old.id, 0.667, 1),
+    ]
+
+
+@pytest.mark.django_db
+def test_deleted_recipes_are_skipped(client, ingredients, make_recipe):
+    deleted = make_recipe([0])
+    kept = make_recipe([0, 1])
+    pantry(client, ingredients[:1])
+
+    deleted.delete()
+
+    assert pantry(client, ingredients[:1]) == [(kept.id, 0.5, 1)]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('params', [
+    {},
+    {'ingredients': 'соль'},
+    {'ingredients': [1], 'limit': 'все'},
+    {'ingredients': list(range(1, 102))},
+])
+def test_invalid_pantry(client, params):
+    assert client.get(URL, params).status_code == 400
@@ -0,0 +1,66 @@
+import io
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from api.management.commands.check_query_plans import seq_scans
+from recipes.models import ShoppingCart
+
+
+def test_seq_scans_postgresql():
+    plan = (
+        'Limit  (cost=0.29..1.02 rows=6 width=80)\n'
+        '  ->  Seq Scan on recipes_recipe  (cost=0.00..16.50 rows=650)\n'
+        '  ->  Index Scan using recipe_pub_date_id_idx on recipes_recipe\n'
+        '  ->  Seq Scan on recipes_tag u0  (cost=0.00..1.03 rows=3)'
+    )
+    assert seq_scans(plan, '', 'postgresql') == {
+        'recipes_recipe', 'recipes_tag'
+    }
+
+
+def test_seq_scans_sqlite_resolves_aliases():
+    sql = (
+        'SELECT ... FROM "recipes_recipe" WHERE EXISTS '
+        '(SELECT 1 FROM "recipes_favoriterecipe" U0 WHERE ...)'
+    )
+    plan = (
+        '5 0 0 SCAN recipes_recipe USING INDEX recipe_pub_date_id_idx\n'
+        '17 0 0 CORRELATED SCALAR SUBQUERY 1\n'
+        '25 17 0 SCAN U0\n'
+        '30 0 0 SCAN recipes_tag'
+    )
+    assert seq_scans(plan, sql, 'sqlite') == {
+        'recipes_favoriterecipe', 'recipes_tag'
+    }
+
+
+@pytest.mark.django_db
+def test_check_query_plans_on_seeded_database(make_recipes, user):
+    recipe, *_ = make_recipes(3)
+    ShoppingCart.objects.create(user=user, recipe=recipe)
+
+    assert call_command('check_query_plans', min_rows=0) == (
+        'Планы запросов в порядке.'
+    )
+
+
+@pytest.mark.django_db
+def test_check_query_plans_needs_data():
+    with pytest.raises(CommandError):
+        call_command('check_query_plans')
+
+
+@pytest.mark.django_db
+def test_check_query_plans_explains_endpoint_queries(make_recipes, user):
+    make_recipes(3)
+    out = io.StringIO()
+
+    call_command('check_query_plans', min_rows=0, stdout=out)
+
+    output = out.getvalue()
+    # Флаги пользователя и сборка кешируемого ответа, prefetch-запросы.
+    assert 'recipes-detail #5: OK' in output
+    assert 'recipes-pantry #1: OK' in output
+    assert 'recipe-shopping-carts: OK' in output
@@ -0,0 +1,85 @@
+import pytest
+from django.db import OperationalError, connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from foodgram.db_router import health
+
+RECIPES = '/api/recipes/'
+
+# Данные должны быть закоммичены, чтобы соединение реплики их видело.
+pytestmark = pytest.mark.django_db(transaction=True)
+
+
+@pytest.fixture(autouse=True)
+def replicas(settings):
+    settings.DATABASE_REPLICAS = ['replica']
+    health.reset()
+    yield
+    health.reset()
+
+
+@pytest.fixture
+def token_client(user):
+    token = Token.objects.create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def queries_by_alias(client, method, url):
+    with CaptureQueriesContext(connections['default']) as default, \
+            CaptureQueriesContext(connections['replica']) as replica:
+        response = getattr(client, method)(url)
+    assert response.status_code < 400
+    return len(default), len(replica)
+
+
+def test_reads_go_to_replica(client, make_recipes):
+    make_recipes(2)
+
+    default, replica = queries_by_alias(client, 'get', RECIPES)
+
+    assert default == 0
+    assert replica > 0
+
+
+def test_replicas_are_not_used_when_disabled(settings, client, make_recipes):
+    settings.DATABASE_REPLICAS = []
+    make_recipes(2)
+
+    assert queries_by_alias(client, 'get', RECIPES)[1] == 0
+
+
+def test_writer_reads_from_primary(token_client, client, make_recipes):
+    recipe = make_recipes(1)[0]
+    _, replica = queries_by_alias(token_client, 'get', RECIPES)
+    assert replica > 0
+
+    queries_by_alias(token_client, 'post', f'{RECIPES}{recipe.id}/favorite/')
+
+    assert queries_by_alias(token_client, 'get', RECIPES)[1] == 0
+    assert queries_by_alias(client, 'get', RECIPES)[1] > 0
+
+
+def test_lagging_replica_is_skipped(monkeypatch, client, make_recipes):
+    make_recipes(2)
+    monkeypatch.setattr(health, 'measure_lag', lambda alias: 60.0)
+
+    assert queries_by_alias(client, 'get', RECIPES)[1] == 0
+
+
+def test_failed_replica_falls_back_to_primary(client, make_recipes):
+    make_recipes(2)
+
+    def broken(execute, sql, params, many, context):
+        raise OperationalError('replica is down')
+
+    with connections['replica'].execute_wrapper(broken):
+        response = client.get(RECIPES)
+        assert response.status_code == 200
+        assert response.json()['count'] == 2
+        assert not health.is_usable('replica')
+
+        assert queries_by_alias(client, 'get', RECIPES)[1] == 0
@@ -0,0 +1,80 @@
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from recipes.models import FavoriteRecipe, Recipe, ShoppingCart
+
+
+def counters(recipe):
+    recipe.refresh_from_db()
+    return recipe.favorites_count, recipe.in_carts_count
+
+
+@pytest.mark.django_db
+def test_counters_follow_favorites_and_carts(user_client, make_recipes):
+    recipe = make_recipes(1)[0]
+    url = f'/api/recipes/{recipe.id}/'
+
+    user_client.post(f'{url}favorite/')
+    user_client.post(f'{url}shopping_cart/')
+    assert counters(recipe) == (1, 1)
+    data = user_client.get(url).data
+    assert (data['favorites_count'], data['in_carts_count']) == (1, 1)
+
+    # Повторное добавление не меняет счетчик.
+    assert user_client.post(f'{url}favorite/').status_code == 400
+    assert counters(recipe) == (1, 1)
+
+    user_client.delete(f'{url}favorite/')
+    user_client.delete(f'{url}shopping_cart/')
+    assert counters(recipe) == (0, 0)
+    assert user_client.delete(f'{url}favorite/').status_code == 400
+    assert counters(recipe) == (0, 0)
+
+
+@pytest.mark.django_db
+def test_ordering_by_popularity(client, make_recipes, user):
+    recipes = make_recipes(3)
+    Recipe.objects.filter(pk=recipes[0].pk).update(favorites_count=5)
+    Recipe.objects.filter(pk=recipes[2].pk).update(favorites_count=2)
+
+    response = client.get('/api/recipes/', {'ordering': '-favorites_count'})
+
+    assert [recipe['id'] for recipe in response.data['results']] == [
+        recipes[0].id, recipes[2].id, recipes[1].id
+    ]
+    assert client.get(
+        '/api/recipes/', {'ordering': 'name'}
+    ).status_code == 400
+
+
+@pytest.mark.django_db
+def test_reconcile_counters(make_recipes, user):
+    recipe, other = make_recipes(2)
+    # bulk_create не отправляет сигналы, счетчик расходится.
+    FavoriteRecipe.objects.bulk_create(
+        [FavoriteRecipe(user=user, recipe=recipe)]
+    )
+    Recipe.objects.filter(pk=other.pk).update(in_carts_count=3)
+
+    with pytest.raises(CommandError):
+        call_command('reconcile_recipe_counters', check=True)
+    call_command('reconcile_recipe_counters')
+
+    assert counters(recipe) == (1, 0)
+    assert counters(other) == (0, 0)
+    call_command('reconcile_recipe_counters', check=True)
+
+
+@pytest.mark.django_db
+def test_counters_follow_orm_writes(make_recipes, user, author):
+    recipe, = make_recipes(1)
+    favorite = FavoriteRecipe.objects.create(user=user, recipe=recipe)
+    ShoppingCart.objects.create(user=user, recipe=recipe)
+    ShoppingCart.objects.create(user=author, recipe=recipe)
+    assert counters(recipe) == (1, 2)
+
+    favorite.delete()
+    ShoppingCart.objects.filter(user=author).delete()
+    assert counters(recipe) == (0, 1)
+    call_command('reconcile_recipe_counters', check=True)
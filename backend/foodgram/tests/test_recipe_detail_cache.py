@@ -0,0 +1,125 @@
+import pytest
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import FavoriteRecipe, Subscribe
+
+
+@pytest.fixture
+def recipe(make_recipes):
+    return make_recipes(1)[0]
+
+
+def detail(client, recipe):
+    response = client.get(f'/api/recipes/{recipe.id}/')
+    assert response.status_code == 200, response.json()
+    return response.json()
+
+
+@pytest.mark.django_db
+def test_second_viewer_gets_cached_detail(client, user_client, recipe,
+                                          django_assert_num_queries):
+    first = detail(client, recipe)
+
+    # Только запрос флагов и счетчиков, токен клиента не проверяется.
+    with django_assert_num_queries(1):
+        second = detail(user_client, recipe)
+
+    assert second == first
+
+
+@pytest.mark.django_db
+def test_flags_are_per_user(client, user, user_client, author, recipe):
+    FavoriteRecipe.objects.create(user=user, recipe=recipe)
+    Subscribe.objects.create(user=user, author=author)
+    other = APIClient()
+    other.force_authenticate(author)
+
+    own = detail(user_client, recipe)
+    assert own['is_favorited'] is True
+    assert own['is_in_shopping_cart'] is False
+    assert own['author']['is_subscribed'] is True
+    assert own['favorites_count'] == 1
+    for client in (other, client):
+        data = detail(client, recipe)
+        assert data['is_favorited'] is False
+        assert data['author']['is_subscribed'] is False
+        assert data['favorites_count'] == 1
+    assert detail(user_client, recipe) == own
+
+
+@pytest.mark.django_db
+def test_recipe_update_invalidates(user_client, author, tags, ingredients,
+                                   recipe):
+    detail(user_client, recipe)
+    client = APIClient()
+    client.force_authenticate(author)
+    data = {
+        'name': 'Новое название',
+        'text': 'Описание',
+        'cooking_time': 5,
+        'tags': [tags[0].id],
+        'ingredients': [
+            {'id': ingredient.id, 'amount': 1}
+            for ingredient in ingredients[:2]
+        ],
+    }
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        response = client.patch(
+            f'/api/recipes/{recipe.id}/', data, format='json'
+        )
+    assert response.status_code == 200, response.json()
+
+    assert detail(user_client, recipe)['name'] == 'Новое название'
+
+
+@pytest.mark.django_db
+def test_author_tag_and_ingredient_changes_invalidate(client, author, tags,
+                                                      ingredients, recipe):
+    detail(client, recipe)
+    tag = recipe.tags.first()
+    ingredient = recipe.recipe.first().ingredient
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        author.first_name = 'Jamie'
+        author.save()
+        tag.name = 'Полдник'
+        tag.save()
+        ingredient.name = 'соль'
+        ingredient.save()
+
+    data = detail(client, recipe)
+    assert data['author']['first_name'] == 'Jamie'
+    assert 'Полдник' in [item['name'] for item in data['tags']]
+    assert 'соль' in [item['name'] for item in data['ingredients']]
+
+
+@pytest.mark.django_db
+def test_ingredient_and_tag_rows_invalidate(client, tags, recipe):
+    detail(client, recipe)
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        row = recipe.recipe.first()
+        row.amount = 100
+        row.save()
+    data = detail(client, recipe)
+    assert 100 in [item['amount'] for item in data['ingredients']]
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        recipe.tags.add(tags[2])
+    assert tags[2].id in [
+        item['id'] for item in detail(client, recipe)['tags']
+    ]
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        tags[2].recipes.clear()
+    assert tags[2].id not in [
+        item['id'] for item in detail(client, recipe)['tags']
+    ]
+
+
+@pytest.mark.django_db
+def test_missing_recipe(client, recipe):
+    assert client.get(f'/api/recipes/{recipe.id + 1}/').status_code == 404
+    assert client.get('/api/recipes/abc/').status_code == 404
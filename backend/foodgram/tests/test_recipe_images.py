@@ -0,0 +1,115 @@
+import base64
+import io
+
+import pytest
+from django.test import TestCase
+from PIL import Image
+
+from recipes.models import Recipe, Subscribe
+
+URL = '/api/recipes/'
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+
+
+def image_base64(size, image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, format=image_format)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/{image_format.lower()};base64,{encoded}'
+
+
+def payload(tags, ingredients, image):
+    return {
+        'name': 'Рецепт с картинкой',
+        'text': 'Описание',
+        'cooking_time': 10,
+        'tags': [tags[0].id],
+        'ingredients': [
+            {'id': ingredient.id, 'amount': 5}
+            for ingredient in ingredients[:2]
+        ],
+        'image': image,
+    }
+
+
+@pytest.mark.django_db
+def test_variants_generated_after_commit(user_client, tags, ingredients):
+    with TestCase.captureOnCommitCallbacks() as callbacks:
+        response = user_client.post(
+            URL, payload(tags, ingredients, image_base64((1600, 1200))),
+            format='json'
+        )
+    assert response.status_code == 201, response.json()
+    # Variants are not ready when the response is built.
+    assert response.json()['images'] == {}
+    process_image, = [
+        callback for callback in callbacks
+        if callback.__qualname__.startswith('schedule_image_processing.')
+    ]
+
+    process_image()
+    recipe = Recipe.objects.get()
+    assert set(recipe.image_variants) == {'card', 'detail', 'webp'}
+    for callback in callbacks:
+        if callback is not process_image:
+            callback()
+    card = Image.open(recipe.image.storage.open(recipe.image_variants['card']))
+    assert card.size == (480, 360)
+    webp = Image.open(recipe.image.storage.open(recipe.image_variants['webp']))
+    assert webp.format == 'WEBP'
+
+    item = user_client.get(URL).json()['results'][0]
+    assert item['image'].endswith(recipe.image_variants['card'])
+    assert set(item['images']) == {'card', 'detail', 'webp'}
+    detail = user_client.get(f'{URL}{recipe.id}/').json()
+    assert detail['image'].endswith(recipe.image.name)
+    ingredient_ids = [ingredient.id for ingredient in ingredients[:2]]
+    pantry = user_client.get(
+        f'{URL}pantry/', {'ingredients': ingredient_ids}
+    ).json()
+    assert pantry[0]['image'].endswith(recipe.image_variants['card'])
+
+
+@pytest.mark.django_db
+def test_image_dimension_limit(user_client, tags, ingredients, settings):
+    settings.RECIPE_IMAGE_MAX_DIMENSION = 100
+    response = user_client.post(
+        URL, payload(tags, ingredients, image_base64((200, 50))),
+        format='json'
+    )
+    assert response.status_code == 400
+    assert 'image' in response.json()
+
+
+@pytest.mark.django_db
+def test_image_size_limit(user_client, tags, ingredients, settings):
+    settings.RECIPE_IMAGE_MAX_SIZE = 100
+    response = user_client.post(
+        URL, payload(tags, ingredients, image_base64((200, 200))),
+        format='json'
+    )
+    assert response.status_code == 400
+    assert 'Размер' in response.json()['image'][0]
+
+
+@pytest.mark.django_db
+def test_short_recipe_responses_use_card(user, user_client, author,
+                                         make_recipes):
+    recipe = make_recipes(1)[0]
+    Recipe.objects.filter(pk=recipe.pk).update(
+        image='recipes/images/original.jpg',
+        image_variants={'card': 'recipes/images/variants/card.jpg'},
+    )
+    Subscribe.objects.create(user=user, author=author)
+
+    for action in ('favorite', 'shopping_cart'):
+        response = user_client.post(f'{URL}{recipe.id}/{action}/')
+        assert response.status_code == 201, response.json()
+        assert response.json()['image'] == 'recipes/images/variants/card.jpg'
+    subscriptions = user_client.get('/api/users/subscriptions/').json()
+    preview = subscriptions['results'][0]['recipes'][0]
+    assert preview['image'].endswith('recipes/images/variants/card.jpg')
@@ -0,0 +1,97 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+URL = '/api/recipes/'
+
+
+@pytest.mark.django_db
+def test_page_number_contract_kept(client, make_recipes):
+    make_recipes(8)
+    data = client.get(URL).json()
+    assert data['count'] == 8
+    assert len(data['results']) == 6
+    assert 'page=2' in data['next']
+
+
+@pytest.mark.django_db
+def test_cursor_walks_forward_and_back(client, make_recipes):
+    recipes = make_recipes(7)
+    expected = [recipe.id for recipe in reversed(recipes)]
+
+    first = client.get(URL, {'cursor': '', 'limit': 3}).json()
+    assert 'count' not in first
+    assert first['previous'] is None
+    second = client.get(first['next']).json()
+    third = client.get(second['next']).json()
+    assert third['next'] is None
+    ids = [
+        item['id']
+        for page in (first, second, third) for item in page['results']
+    ]
+    assert ids == expected
+
+    back = client.get(third['previous']).json()
+    assert [item['id'] for item in back['results']] == expected[3:6]
+    back = client.get(back['previous']).json()
+    assert [item['id'] for item in back['results']] == expected[:3]
+    assert back['previous'] is None
+
+
+@pytest.mark.django_db
+def test_cursor_mode_skips_count(client, make_recipes):
+    make_recipes(3)
+    with CaptureQueriesContext(connection) as context:
+        client.get(URL, {'cursor': ''})
+    assert not any('COUNT(' in query['sql'] for query in context)
+
+
+@pytest.mark.django_db
+def test_invalid_cursor(client):
+    assert client.get(URL, {'cursor': 'garbage'}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_cursor_follows_ordering(client, make_recipes):
+    recipes = make_recipes(5)
+    for count, recipe in zip((2, 0, 3, 2, 1), recipes):
+        recipe.favorites_count = count
+        recipe.save(update_fields=['favorites_count'])
+    expected = [
+        recipe.id for recipe in sorted(
+            recipes,
+            key=lambda recipe: (recipe.favorites_count, recipe.pub_date,
+                                recipe.id),
+            reverse=True,
+        )
+    ]
+    params = {'cursor': '', 'limit': 2, 'ordering': '-favorites_count'}
+
+    first = client.get(URL, params).json()
+    second = client.get(first['next']).json()
+    third = client.get(second['next']).json()
+    assert third['next'] is None
+    ids = [
+        item['id']
+        for page in (first, second, third) for item in page['results']
+    ]
+    assert ids == expected
+    back = client.get(third['previous']).json()
+    assert [item['id'] for item in back['results']] == expected[2:4]
+
+
+@pytest.mark.django_db
+def test_cursor_of_other_ordering_is_invalid(client, make_recipes):
+    make_recipes(3)
+    first = client.get(URL, {'cursor': '', 'limit': 1}).json()
+    response = client.get(first['next'] + '&ordering=-in_carts_count')
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_cursor_search_needs_ordering(client, make_recipes):
+    make_recipes(2)
+    params = {'cursor': '', 'search': 'Рецепт'}
+    assert client.get(URL, params).status_code == 400
+    params['ordering'] = '-pub_date'
+    assert client.get(URL, params).status_code == 200
@@ -0,0 +1,73 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import FavoriteRecipe, ShoppingCart, Subscribe
+
+URL = '/api/recipes/'
+
+
+def count_list_queries(client):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(URL)
+    assert response.status_code == 200
+    return len(context)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('client_name', ['client', 'user_client'])
+def test_recipe_list_query_count_is_constant(request, client_name,
+                                             make_recipes):
+    client = request.getfixturevalue(client_name)
+    make_recipes(1)
+    queries_for_one = count_list_queries(client)
+    make_recipes(5)
+    assert count_list_queries(client) == queries_for_one
+
+
+@pytest.mark.django_db
+def test_recipe_list_query_budget(user_client, make_recipes):
+    make_recipes(6)
+    # count, page, authors, tags, ingredient rows.
+    assert count_list_queries(user_client) == 5
+
+
+@pytest.mark.django_db
+def test_recipe_detail_query_budget(user_client, make_recipes,
+                                    django_assert_num_queries):
+    recipe, = make_recipes(1)
+    with django_assert_num_queries(5):
+        response = user_client.get(f'{URL}{recipe.id}/')
+    assert response.status_code == 200
+    # Shared part is cached, only the per-user flags are queried.
+    with django_assert_num_queries(1):
+        response = user_client.get(f'{URL}{recipe.id}/')
+    assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_recipe_list_user_flags(user, author, user_client, make_recipes):
+    favorite, in_cart, plain = make_recipes(3)
+    FavoriteRecipe.objects.create(user=user, recipe=favorite)
+    ShoppingCart.objects.create(user=user, recipe=in_cart)
+    Subscribe.objects.create(user=user, author=author)
+
+    results = {
+        item['id']: item for item in user_client.get(URL).json()['results']
+    }
+    assert results[favorite.id]['is_favorited'] is True
+    assert results[favorite.id]['is_in_shopping_cart'] is False
+    assert results[in_cart.id]['is_in_shopping_cart'] is True
+    assert results[plain.id]['is_favorited'] is False
+    assert all(item['author']['is_subscribed'] for item in results.values())
+    assert len(results[plain.id]['ingredients']) == 3
+    assert len(results[plain.id]['tags']) == 2
+
+
+@pytest.mark.django_db
+def test_recipe_list_anonymous_flags(client, make_recipes):
+    make_recipes(2)
+    for item in client.get(URL).json()['results']:
+        assert item['is_favorited'] is False
+        assert item['is_in_shopping_cart'] is False
+        assert item['author']['is_subscribed'] is False
@@ -0,0 +1,78 @@
+import pytest
+from django.db import connection
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+
+@pytest.fixture
+def recipes(author, tags):
+    beet = Ingredient.objects.create(name='свекла', measurement_unit='г')
+    meat = Ingredient.objects.create(name='говядина', measurement_unit='г')
+    borsch = Recipe.objects.create(
+        author=author, name='Борщ', text='Красный суп', cooking_time=90
+    )
+    borsch.tags.set(tags[1:])
+    salad = Recipe.objects.create(
+        author=author, name='Винегрет', text='Овощной салат', cooking_time=20
+    )
+    salad.tags.set(tags[:2])
+    for recipe, ingredients in ((borsch, (beet, meat)), (salad, (beet,))):
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+    Recipe.objects.update_search_vector()
+    return borsch, salad
+
+
+def search(client, query, **params):
+    response = client.get('/api/recipes/', {'search': query, **params})
+    assert response.status_code == 200
+    return [recipe['name'] for recipe in response.data['results']]
+
+
+@pytest.mark.django_db
+def test_search_by_name_text_and_ingredient(client, recipes):
+    assert search(client, 'Борщ') == ['Борщ']
+    assert search(client, 'салат') == ['Винегрет']
+    assert sorted(search(client, 'свекла')) == ['Борщ', 'Винегрет']
+    assert search(client, 'ананас') == []
+
+
+@pytest.mark.django_db
+def test_search_with_tags_has_no_duplicates(client, recipes, tags):
+    assert sorted(search(client, 'свекла', tags=['lunch', 'dinner'])) == [
+        'Борщ', 'Винегрет'
+    ]
+    assert search(client, 'свекла', tags=['dinner']) == ['Борщ']
+
+
+@pytest.mark.django_db
+def test_blank_search_is_ignored(client, recipes):
+    assert len(search(client, '  ')) == 2
+
+
+@pytest.mark.skipif(
+    connection.vendor != 'postgresql', reason='ranking needs PostgreSQL'
+)
+@pytest.mark.django_db
+def test_search_ranks_name_above_ingredients(client, recipes, author):
+    Recipe.objects.create(
+        author=author, name='Свекла печеная', text='Гарнир', cooking_time=40
+    )
+    Recipe.objects.update_search_vector()
+
+    assert search(client, 'свеклы')[0] == 'Свекла печеная'
+
+
+@pytest.mark.skipif(
+    connection.vendor != 'postgresql', reason='search_vector needs PostgreSQL'
+)
+@pytest.mark.django_db
+def test_recipe_save_updates_search_vector(client, recipes):
+    borsch, _ = recipes
+    borsch.name = 'Щи'
+    borsch.save()
+
+    assert search(client, 'щи') == ['Щи']
+    assert search(client, 'Борщ') == []
@@ -0,0 +1,44 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+@pytest.mark.django_db
+def test_multi_tag_filter_returns_each_recipe_once(client, make_recipes):
+    recipes = make_recipes(3)
+
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(
+            '/api/recipes/', {'tags': ['breakfast', 'lunch']}
+        )
+
+    assert response.status_code == 200
+    assert response.data['count'] == 3
+    assert sorted(recipe['id'] for recipe in response.data['results']) == (
+        sorted(recipe.id for recipe in recipes)
+    )
+    recipe_queries = [
+        query['sql'] for query in context.captured_queries
+        if 'FROM "recipes_recipe"' in query['sql']
+    ]
+    assert recipe_queries
+    for sql in recipe_queries:
+        assert 'DISTINCT' not in sql
+        assert '"recipes_tag"' not in sql
+
+
+@pytest.mark.django_db
+def test_tag_filter_excludes_other_tags(client, make_recipes, tags):
+    recipe = make_recipes(2)[0]
+    recipe.tags.set(tags[2:])
+
+    response = client.get('/api/recipes/', {'tags': 'dinner'})
+
+    assert [item['id'] for item in response.data['results']] == [recipe.id]
+
+
+@pytest.mark.django_db
+def test_unknown_tag_is_rejected(client, make_recipes):
+    make_recipes(1)
+
+    assert client.get('/api/recipes/', {'tags': 'brunch'}).status_code == 400
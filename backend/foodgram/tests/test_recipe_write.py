@@ -0,0 +1,84 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+URL = '/api/recipes/'
+
+
+@pytest.fixture
+def many_ingredients():
+    Ingredient.objects.bulk_create(
+        Ingredient(name=f'продукт {i}', measurement_unit='г')
+        for i in range(30)
+    )
+    return list(Ingredient.objects.filter(name__startswith='продукт'))
+
+
+def payload(tags, ingredients, **kwargs):
+    return {
+        'name': 'Большой рецепт',
+        'text': 'Описание',
+        'cooking_time': 30,
+        'tags': [tag.id for tag in tags],
+        'ingredients': [
+            {'id': ingredient.id, 'amount': 10} for ingredient in ingredients
+        ],
+        **kwargs,
+    }
+
+
+@pytest.mark.django_db
+def test_create_costs_handful_of_queries(user_client, tags, many_ingredients):
+    with CaptureQueriesContext(connection) as context:
+        response = user_client.post(
+            URL, payload(tags[:1], many_ingredients), format='json'
+        )
+    assert response.status_code == 201, response.json()
+    assert len(response.json()['ingredients']) == 30
+    # Validation 3, write 5 (+ savepoint and release), response 4. Tags are
+    # written after a SELECT of existing ones, since m2m_changed has a
+    # receiver.
+    assert len(context) <= 14
+    assert RecipeIngredient.objects.count() == 30
+
+
+@pytest.mark.django_db
+def test_missing_ingredients_reported_at_once(user_client, tags, ingredients):
+    data = payload(tags[:1], ingredients[:2])
+    data['ingredients'] += [{'id': 998, 'amount': 1}, {'id': 999, 'amount': 1}]
+    response = user_client.post(URL, data, format='json')
+    assert response.status_code == 400
+    assert '998' in str(response.json()) and '999' in str(response.json())
+    assert not Recipe.objects.exists()
+
+
+@pytest.mark.django_db
+def test_update_writes_only_changed_rows(user, user_client, tags, ingredients):
+    response = user_client.post(
+        URL, payload(tags[:1], ingredients[:3]), format='json'
+    )
+    recipe_id = response.json()['id']
+    kept = RecipeIngredient.objects.get(
+        recipe_id=recipe_id, ingredient=ingredients[0]
+    )
+
+    data = payload(tags[:1], ingredients[:2] + ingredients[3:4])
+    data['ingredients'][1]['amount'] = 50
+    with CaptureQueriesContext(connection) as context:
+        response = user_client.patch(
+            f'{URL}{recipe_id}/', data, format='json'
+        )
+    assert response.status_code == 200
+    sql = [query['sql'] for query in context]
+    assert sum(query.startswith('DELETE') for query in sql) == 1
+    assert sum(query.startswith('INSERT') for query in sql) == 1
+
+    rows = dict(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('ingredient_id', 'amount'))
+    assert rows == {
+        ingredients[0].id: 10, ingredients[1].id: 50, ingredients[3].id: 10,
+    }
+    assert RecipeIngredient.objects.filter(pk=kept.pk).exists()
@@ -0,0 +1,58 @@
+import json
+import logging
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def metrics_records(caplog):
+    return [
+        record for record in caplog.records
+        if record.name == 'foodgram.requests'
+    ]
+
+
+@pytest.mark.django_db
+def test_metrics_of_recipe_list(client, make_recipes, caplog):
+    make_recipes(3)
+
+    with caplog.at_level(logging.INFO, logger='foodgram.requests'):
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/recipes/')
+
+    timing = response['Server-Timing']
+    assert f'desc="{len(context)} queries"' in timing
+    assert 'serializer;dur=' in timing
+    assert 'total;dur=' in timing
+    [record] = metrics_records(caplog)
+    assert record.levelno == logging.INFO
+    logged = json.loads(record.getMessage())
+    assert logged == record.metrics
+    assert logged['view'] == 'RecipeViewSet.list'
+    assert logged['queries'] == len(context)
+    assert logged['serializer_ms'] > 0
+    assert not logged['too_many_queries']
+
+
+@pytest.mark.django_db
+def test_requests_over_query_threshold_are_flagged(
+    user_client, make_recipes, settings, caplog
+):
+    recipe = make_recipes(1)[0]
+    settings.REQUEST_QUERY_THRESHOLD = 1
+
+    with caplog.at_level(logging.INFO, logger='foodgram.requests'):
+        user_client.get(f'/api/recipes/{recipe.id}/')
+
+    [record] = metrics_records(caplog)
+    assert record.levelno == logging.WARNING
+    assert record.metrics['view'] == 'RecipeViewSet.retrieve'
+    assert record.metrics['too_many_queries']
+
+
+@pytest.mark.django_db
+def test_server_timing_can_be_disabled(client, settings):
+    settings.REQUEST_METRICS_SERVER_TIMING = False
+
+    assert 'Server-Timing' not in client.get('/api/tags/')
@@ -0,0 +1,190 @@
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.db.models.signals import pre_delete
+
+from recipes.models import (Recipe, RecipeIngredient, ShoppingCart,
+                            ShoppingListItem)
+from recipes.signals import deleted_recipes
+
+URL = '/api/recipes/download_shopping_cart/'
+
+
+@pytest.fixture
+def cart(user_client, make_recipes):
+    recipes = make_recipes(2)
+    for recipe in recipes:
+        response = user_client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        assert response.status_code == 201
+    return recipes
+
+
+def totals(user):
+    return dict(
+        user.shopping_list.values_list('ingredient__name', 'amount')
+    )
+
+
+def download(client, *args, **kwargs):
+    response = client.get(URL, *args, **kwargs)
+    assert response.status_code == 200
+    assert response.streaming
+    return response, b''.join(response.streaming_content)
+
+
+@pytest.mark.django_db
+def test_download_text_by_default(user_client, cart):
+    response, content = download(user_client)
+    assert response['Content-Type'] == 'text/plain; charset=utf-8'
+    assert 'shopping_list.txt' in response['Content-Disposition']
+    # Amounts of both recipes are summed: 1 + 2, 2 + 4, 3 + 6.
+    assert content.decode() == (
+        'Список покупок:\n'
+        '1. Ингредиент 0 - 3, г\n'
+        '2. Ингредиент 1 - 3, г\n'
+        '3. Ингредиент 2 - 3, г\n'
+    )
+
+
+@pytest.mark.django_db
+def test_download_csv_by_query_param(user_client, cart):
+    response, content = download(user_client, {'format': 'csv'})
+    assert response['Content-Type'] == 'text/csv; charset=utf-8'
+    lines = content.decode('utf-8-sig').splitlines()
+    assert lines[0] == '№,Ингредиент,Количество,Ед. изм.'
+    assert lines[1] == '1,Ингредиент 0,3,г'
+    assert len(lines) == 4
+
+
+@pytest.mark.django_db
+def test_download_pdf_by_accept_header(user_client, cart):
+    response, content = download(user_client, HTTP_ACCEPT='application/pdf')
+    assert response['Content-Type'] == 'application/pdf'
+    assert 'shopping_list.pdf' in response['Content-Disposition']
+    assert content.startswith(b'%PDF')
+
+
+@pytest.mark.django_db
+def test_download_text_for_other_accept(user_client, cart):
+    response, content = download(user_client, HTTP_ACCEPT='application/json')
+    assert response['Content-Type'] == 'text/plain; charset=utf-8'
+    assert content.decode().startswith('Список покупок:\n')
+
+
+@pytest.mark.django_db
+def test_download_empty_cart(user_client):
+    response = user_client.get(URL)
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_download_anonymous(client):
+    assert client.get(URL).status_code == 401
+
+
+@pytest.mark.django_db
+def test_totals_follow_cart(user, user_client, cart):
+    assert totals(user) == {
+        'ингредиент 0': 3, 'ингредиент 1': 3, 'ингредиент 2': 3,
+    }
+    response = user_client.delete(f'/api/recipes/{cart[1].id}/shopping_cart/')
+    assert response.status_code == 204
+    assert totals(user) == {
+        'ингредиент 0': 1, 'ингредиент 1': 1, 'ингредиент 2': 1,
+    }
+    user_client.delete(f'/api/recipes/{cart[0].id}/shopping_cart/')
+    assert totals(user) == {}
+
+
+@pytest.mark.django_db
+def test_totals_follow_recipe_edit(user, author, ingredients, tags, cart):
+    from rest_framework.test import APIClient
+    client = APIClient()
+    client.force_authenticate(author)
+    response = client.patch(
+        f'/api/recipes/{cart[0].id}/',
+        {
+            'name': cart[0].name,
+            'text': 'Описание',
+            'cooking_time': 10,
+            'tags': [tags[0].id],
+            'ingredients': [
+                {'id': ingredients[0].id, 'amount': 10},
+                {'id': ingredients[4].id, 'amount': 5},
+            ],
+        },
+        format='json',
+    )
+    assert response.status_code == 200
+    assert totals(user) == {
+        'ингредиент 0': 12, 'ингредиент 1': 2, 'ингредиент 2': 2,
+        'ингредиент 4': 5,
+    }
+    call_command('rebuild_shopping_lists', check=True)
+
+    client.delete(f'/api/recipes/{cart[1].id}/')
+    assert totals(user) == {'ингредиент 0': 10, 'ингредиент 4': 5}
+    call_command('rebuild_shopping_lists', check=True)
+
+
+@pytest.mark.django_db
+def test_rebuild_command(user, make_recipes):
+    recipe, = make_recipes(1)
+    # bulk_create не отправляет сигналы, списки покупок расходятся.
+    ShoppingCart.objects.bulk_create([ShoppingCart(user=user, recipe=recipe)])
+    with pytest.raises(CommandError):
+        call_command('rebuild_shopping_lists', check=True)
+    call_command('rebuild_shopping_lists')
+    call_command('rebuild_shopping_lists', check=True)
+    assert ShoppingListItem.objects.filter(user=user).count() == 3
+
+
+@pytest.mark.django_db
+def test_totals_follow_orm_writes(user, author, ingredients, make_recipes):
+    first, second = make_recipes(2)
+    ShoppingCart.objects.create(user=user, recipe=first)
+    cart = ShoppingCart.objects.create(user=user, recipe=second)
+    row = RecipeIngredient.objects.get(recipe=first, ingredient=ingredients[0])
+    row.amount, row.ingredient = 7, ingredients[3]
+    row.save()
+    RecipeIngredient.objects.get(
+        recipe=first, ingredient=ingredients[1]
+    ).delete()
+    RecipeIngredient.objects.create(
+        recipe=second, ingredient=ingredients[4], amount=4
+    )
+    call_command('rebuild_shopping_lists', check=True)
+
+    cart.delete()
+    call_command('rebuild_shopping_lists', check=True)
+    ShoppingCart.objects.create(user=user, recipe=second)
+    first.delete()
+    assert totals(user) == {
+        'ингредиент 0': 2, 'ингредиент 1': 2, 'ингредиент 2': 2,
+        'ингредиент 4': 4,
+    }
+    call_command('rebuild_shopping_lists', check=True)
+    author.delete()
+    assert totals(user) == {}
+    assert not deleted_recipes.get()
+
+
+@pytest.mark.django_db
+def test_failed_recipe_delete_keeps_deltas(user, make_recipes):
+    recipe = make_recipes(1)[0]
+    cart = ShoppingCart.objects.create(user=user, recipe=recipe)
+
+    def fail(sender, instance, **kwargs):
+        raise RuntimeError('delete failed')
+    pre_delete.connect(fail, sender=Recipe)
+    try:
+        with pytest.raises(RuntimeError), transaction.atomic():
+            recipe.delete()
+    finally:
+        pre_delete.disconnect(fail, sender=Recipe)
+
+    # После отката удаление корзины снова сдвигает список покупок.
+    cart.delete()
+    assert totals(user) == {}
+    call_command('rebuild_shopping_lists', check=True)
@@ -0,0 +1,96 @@
+import pytest
+from django.test import TestCase
+
+from recipes import similarity
+from recipes.models import Recipe, RecipeIngredient, SimilarRecipe
+
+URL = '/api/recipes/{}/similar/'
+
+
+@pytest.fixture
+def make_recipe(author, tags, ingredients):
+    def make_recipe(ingredient_numbers, tag_numbers=(0,)):
+        recipe = Recipe.objects.create(
+            author=author, name=f'Рецепт {Recipe.objects.count()}',
+            text='Описание', cooking_time=10,
+        )
+        recipe.tags.set([tags[number] for number in tag_numbers])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient=ingredients[number], amount=1
+            )
+            for number in ingredient_numbers
+        )
+        return recipe
+    return make_recipe
+
+
+def similar_ids(client, recipe):
+    response = client.get(URL.format(recipe.id))
+    assert response.status_code == 200
+    return [item['id'] for item in response.json()]
+
+
+@pytest.mark.django_db
+def test_ranked_by_ingredients_with_tag_boost(client, make_recipe):
+    recipe = make_recipe([0, 1, 2])
+    same = make_recipe([0, 1, 2], [1])
+    same_tag = make_recipe([0, 1, 3])
+    other_tag = make_recipe([0, 1, 4], [2])
+    unrelated = make_recipe([3, 4])
+
+    assert similarity.rebuild() > 0
+
+    assert similar_ids(client, recipe) == [same.id, same_tag.id, other_tag.id]
+    assert similar_ids(client, unrelated) == [same_tag.id, other_tag.id]
+
+
+@pytest.mark.django_db
+def test_incremental_update_matches_rebuild(make_recipe):
+    recipes = [
+        make_recipe([0, 1, 2]), make_recipe([1, 2], [1]),
+        make_recipe([2, 3, 4]), make_recipe([0, 4], [0, 2]),
+    ]
+    similarity.rebuild()
+    rebuilt = set(SimilarRecipe.objects.values_list(
+        'recipe_id', 'similar_id', 'score'
+    ))
+
+    for recipe in recipes:
+        similarity.update_recipe(recipe.id)
+
+    assert set(SimilarRecipe.objects.values_list(
+        'recipe_id', 'similar_id', 'score'
+    )) == rebuilt
+
+
+@pytest.mark.django_db
+def test_new_recipe_is_added_on_write(user_client, tags, ingredients,
+                                      make_recipe):
+    recipe = make_recipe([0, 1, 2])
+    similarity.rebuild()
+    data = {
+        'name': 'Новый рецепт',
+        'text': 'Описание',
+        'cooking_time': 5,
+        'tags': [tags[0].id],
+        'ingredients': [
+            {'id': ingredient.id, 'amount': 1}
+            for ingredient in ingredients[:2]
+        ],
+    }
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        response = user_client.post('/api/recipes/', data, format='json')
+    assert response.status_code == 201
+
+    new_id = response.json()['id']
+    assert similar_ids(user_client, recipe) == [new_id]
+    assert [item['id'] for item in user_client.get(
+        URL.format(new_id)
+    ).json()] == [recipe.id]
+
+
+@pytest.mark.django_db
+def test_similar_of_missing_recipe(client):
+    assert client.get(URL.format(999)).status_code == 404
@@ -0,0 +1,65 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import Subscribe
+
+URL = '/api/users/subscriptions/'
+
+
+@pytest.mark.django_db
+def test_subscriptions_recipes_limit(user, author, user_client, make_recipes):
+    recipes = make_recipes(5)
+    Subscribe.objects.create(user=user, author=author)
+
+    item, = user_client.get(URL, {'recipes_limit': 2}).json()['results']
+    assert item['id'] == author.id
+    assert item['is_subscribed'] is True
+    assert item['recipes_count'] == 5
+    assert [recipe['id'] for recipe in item['recipes']] == [
+        recipes[4].id, recipes[3].id
+    ]
+
+    item, = user_client.get(URL).json()['results']
+    assert len(item['recipes']) == 5
+
+    item, = user_client.get(URL, {'recipes_limit': 0}).json()['results']
+    assert item['recipes'] == []
+
+
+@pytest.mark.django_db
+def test_subscriptions_invalid_recipes_limit(user_client):
+    response = user_client.get(URL, {'recipes_limit': 'abc'})
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_subscribe_recipes_limit(author, user_client, make_recipes):
+    make_recipes(4)
+    response = user_client.post(
+        f'/api/users/{author.id}/subscribe/?recipes_limit=1'
+    )
+    assert response.status_code == 201
+    assert response.json()['recipes_count'] == 4
+    assert len(response.json()['recipes']) == 1
+
+
+@pytest.mark.django_db
+def test_subscriptions_query_count_is_constant(
+    user, author, user_client, make_recipes, django_user_model,
+):
+    def count_queries():
+        with CaptureQueriesContext(connection) as context:
+            response = user_client.get(URL, {'recipes_limit': 3})
+            assert response.status_code == 200
+        return len(context)
+
+    make_recipes(3)
+    Subscribe.objects.create(user=user, author=author)
+    queries = count_queries()
+    for i in range(5):
+        other_author = django_user_model.objects.create(
+            username=f'author{i}', email=f'author{i}@gmail.com'
+        )
+        Subscribe.objects.create(user=user, author=other_author)
+    assert count_queries() == queries
@@ -0,0 +1,92 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import cache_key, local_tokens
+
+ME = '/api/users/me/'
+
+
+@pytest.fixture
+def token_client(user):
+    token = Token.objects.create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    return client
+
+
+def count_queries(client, url):
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(context)
+
+
+@pytest.mark.django_db
+def test_token_is_cached_locally_and_shared(token_client):
+    first = count_queries(token_client, ME)
+
+    assert count_queries(token_client, ME) == first - 1
+    local_tokens.clear()
+    assert count_queries(token_client, ME) == first - 1
+
+
+@pytest.mark.django_db
+def test_logout_invalidates_token(token_client):
+    token_client.get(ME)
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        response = token_client.post('/api/auth/token/logout/')
+    assert response.status_code == 204
+    assert token_client.get(ME).status_code == 401
+
+
+@pytest.mark.django_db
+def test_password_change_invalidates_cached_user(token_client):
+    token_client.get(ME)
+
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        response = token_client.post(
+            '/api/users/set_password/',
+            {'current_password': '123', 'new_password': 'n3w-Passw0rd'},
+        )
+    assert response.status_code == 204
+    assert token_client.get(ME).wsgi_request.user.check_password(
+        'n3w-Passw0rd'
+    )
+
+
+@pytest.mark.django_db
+def test_deactivation_invalidates_token(token_client, user):
+    token_client.get(ME)
+
+    with TestCase.captureOnCommitCallbacks(execute=True) as callbacks:
+        user.is_active = False
+        user.save()
+        # До коммита закешированный пользователь остается прежним.
+        assert token_client.get(ME).status_code == 200
+    assert callbacks
+
+    assert token_client.get(ME).status_code == 401
+
+
+@pytest.mark.django_db
+def test_invalid_token_is_rejected(client):
+    client.credentials(HTTP_AUTHORIZATION='Token unknown')
+
+    assert client.get(ME).status_code == 401
+
+
+@pytest.mark.django_db
+def test_cache_keeps_no_password_hash(token_client, user):
+    response = token_client.get(ME)
+
+    token = Token.objects.get(user=user)
+    assert cache.get(cache_key(token.key)) == {
+        'id': user.id, 'is_active': True, 'is_staff': False,
+    }
+    assert response.json()['username'] == user.username